@@ -72,3 +72,68 @@ class ActionOpdsReader(InterfaceActionBase):
         :param config_widget: The widget returned by :meth:`config_widget`.
         '''
         config_widget.save_settings()
+    
+    def cli_main(self, args):
+        '''
+        Mirror OPDS catalogs into a calibre library, without GUI:
+            calibre-debug -r "OPDS Reader" -- [options] URL [URL ...]
+        The statistics of each server are printed as JSON.
+        '''
+        import argparse
+        import json
+        import sys
+        
+        from calibre.library import db
+        
+        from .config import KEY, PREFS, openFeedCache
+        from .engine import SyncEngine, formatStats
+        
+        parser = argparse.ArgumentParser(
+            prog='calibre-debug -r "{}" --'.format(self.name),
+            description='Add the books of OPDS catalogs that are not in the library',
+        )
+        parser.add_argument('urls', nargs='+', metavar='URL', help='OPDS URL of a server')
+        parser.add_argument('--library', help='path of the library, the current library by default')
+        parser.add_argument('--catalog', help='title of the catalog, the first catalog of the server by default')
+        parser.add_argument('--depth', type=int, default=0,
+                            help='also mirror the sub-catalogs (by author, series...), up to this depth')
+        parser.add_argument('--max-feeds', type=int, default=PREFS[KEY.MAX_CRAWL_FEEDS],
+                            help='with --depth, the maximum of catalogs mirrored by server, '
+                                 'the catalogs skipped are counted in "skippedFeeds"')
+        parser.add_argument('--keep-news', action='store_true', help='also add the newspapers')
+        parser.add_argument('--no-fix-timestamps', action='store_true',
+                            help='do not fix the timestamps of the books already in the library')
+        parser.add_argument('--delta', action='store_true',
+                            help='only download the books added since the last synchronization, '
+                                 'for the catalogs sorted by date added (like "By Newest")')
+        parser.add_argument('--dry-run', action='store_true', help='only count the books that would be added')
+        parser.add_argument('--verbose', action='store_true', help='print the progress on stderr')
+        options = parser.parse_args(args[1:])
+        
+        def log(*message):
+            print(*message, file=sys.stderr)
+        
+        feedCache = openFeedCache()
+        engine = SyncEngine(
+            db(options.library).new_api,
+            maxConcurrentPages=PREFS[KEY.MAX_CONCURRENT_PAGES],
+            maxDownloadsPerHost=PREFS[KEY.MAX_DOWNLOADS_PER_HOST],
+            feedCache=feedCache,
+            hideNewspapers=not options.keep_news,
+            fixTimestamps=not options.no_fix_timestamps,
+            dryRun=options.dry_run,
+            deltaLoad=options.delta,
+            crawlDepth=options.depth,
+            maxFeeds=options.max_feeds,
+            log=log if options.verbose else None,
+        )
+        try:
+            result = formatStats(engine.syncAll(options.urls, options.catalog))
+        finally:
+            if feedCache:
+                feedCache.evict()
+                feedCache.close()
+        json.dump(result, sys.stdout, indent=2)
+        print()
+        if result['errors']:
+            raise SystemExit(1)
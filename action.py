@@ -9,14 +9,9 @@ try:
 except NameError:
     pass  # load_translations() added in calibre 1.9
 
-import datetime
-import json
-import re
-from typing import Dict, List, Tuple
-from urllib.parse import ParseResult, urlparse
-
-# For Python 3.0 and later
-from urllib.request import urlopen
+from array import array
+from functools import partial
+from typing import List
 
 try:
     from qt.core import (
@@ -24,53 +19,74 @@ try:
         QAbstractTableModel,
         QCheckBox,
         QComboBox,
-        QCoreApplication,
+        QFontDatabase,
         QGridLayout,
         QHeaderView,
         QLabel,
         QLineEdit,
+        QModelIndex,
+        QPlainTextEdit,
+        QProgressBar,
         QPushButton,
-        QSortFilterProxyModel,
+        QSize,
         QStringListModel,
         Qt,
         QTableView,
+        QTimer,
         QToolButton,
     )
     ResizeMode = QHeaderView.ResizeMode
+    SystemFont = QFontDatabase.SystemFont
 except ImportError:
     from PyQt5.Qt import (
         QAbstractItemView,
         QAbstractTableModel,
         QCheckBox,
         QComboBox,
-        QCoreApplication,
+        QFontDatabase,
         QGridLayout,
         QHeaderView,
         QLabel,
         QLineEdit,
+        QModelIndex,
+        QPlainTextEdit,
+        QProgressBar,
         QPushButton,
-        QSortFilterProxyModel,
+        QSize,
         QStringListModel,
         Qt,
         QTableView,
+        QTimer,
         QToolButton,
     )
+    from PyQt5.Qt import QFontDatabase as SystemFont
     from PyQt5.Qt import QHeaderView as ResizeMode
 
 from calibre.db.cache import Cache
-from calibre.ebooks.metadata.book.base import Metadata
-from calibre.gui2 import error_dialog
+from calibre.gui2 import choose_save_file, error_dialog
 from calibre.gui2.actions import InterfaceAction
 from calibre.gui2.widgets2 import Dialog
-from calibre.web.feeds import feedparser
 
+from .book_store import BookStore
+from .catalog_entry import CatalogEntry, entriesFromOpds
 from .common_utils import GUI, PLUGIN_NAME, current_db, debug_print, get_icon
-from .config import KEY, PLUGIN_ICON, PREFS, TEXT, saveOpdsUrlCombobox
-
-
-def parse_timestamp(rawTimestamp):
-    parsableTimestamp = re.sub(r'((\.\d+)?(\+|-)0\d:00|Z)$', '', rawTimestamp)
-    return datetime.datetime.strptime(parsableTimestamp, '%Y-%m-%dT%H:%M:%S')
+from .config import (
+    KEY,
+    PLUGIN_ICON,
+    PREFS,
+    TEXT,
+    federatedOpdsUrls,
+    openBookStore,
+    openFeedCache,
+    openThumbnailCache,
+    saveOpdsUrlCombobox,
+)
+from .filters import FilterBits, formatPredicate, tagPredicate
+from .library_index import LibraryIndex
+from .loader import THUMBNAIL_HEIGHT, BookDownloader, CatalogLoader, FederatedLoader, RootCatalogLoader, ThumbnailLoader
+from .metrics import NO_METRICS
+from .opensearch import findSearchLink
+from .search_index import matchingBooks
 
 
 class DynamicBook(dict):
@@ -114,11 +130,8 @@ class OpdsDialog(Dialog):
     
     def setup_ui(self):
         # The model for the book list
-        self.model = OpdsBooksModel(None, [], self.dbAPI)
-        self.searchproxymodel = QSortFilterProxyModel(self)
-        self.searchproxymodel.setFilterCaseSensitivity(Qt.CaseInsensitive)
-        self.searchproxymodel.setFilterKeyColumn(-1)
-        self.searchproxymodel.setSourceModel(self.model)
+        # The search and the sort are done by the model
+        self.model = OpdsBooksModel(None, [], self.dbAPI, openBookStore())
         
         self.layout = QGridLayout()
         self.setLayout(self.layout)
@@ -141,21 +154,20 @@ class OpdsDialog(Dialog):
         self.layout.addWidget(self.opdsUrlEditor, 0, 1, 1, 3)
         self.opdsUrlLabel.setBuddy(self.opdsUrlEditor)
         
+        self.federatedCheckbox = QCheckBox(TEXT.FEDERATED, self)
+        self.federatedCheckbox.setToolTip(TEXT.FEDERATED_TOOLTIP)
+        self.federatedCheckbox.setChecked(PREFS[KEY.FEDERATED])
+        self.federatedCheckbox.clicked.connect(self.setFederated)
+        self.layout.addWidget(self.federatedCheckbox, 0, 4, 1, 2)
+        
         self.download_opds_button = QPushButton(_('Load OPDS'), self)
         self.download_opds_button.setAutoDefault(False)
         self.download_opds_button.clicked.connect(self.download_opds)
         self.layout.addWidget(self.download_opds_button, 0, buttonColumnNumber)
         
-        # Initially download the catalogs found in the root catalog of the URL
-        # selected at startup.  Fail quietly on failing to open the URL
-        firstCatalogTitle, catalogsList = self.model.downloadOpdsRootCatalog(
-            self.gui,
-            self.opdsUrlEditor.currentText(),
-            False,
-        )
-        # debug_print(firstCatalogTitle, catalogsList)
-        firstCatalogTitle = firstCatalogTitle
-        self.currentOpdsCatalogs = catalogsList  # A dictionary of title->feedURL
+        self.currentOpdsCatalogs = {}  # A dictionary of title->feedURL
+        self.rootCatalogLoader = None
+        self.catalogLoader = None
         
         self.opdsCatalogSelectorLabel = QLabel(_('OPDS Catalog:'))
         self.layout.addWidget(self.opdsCatalogSelectorLabel, 1, 0)
@@ -165,9 +177,21 @@ class OpdsDialog(Dialog):
         self.opdsCatalogSelector.setEditable(False)
         self.opdsCatalogSelectorModel = QStringListModel(self.currentOpdsCatalogs.keys())
         self.opdsCatalogSelector.setModel(self.opdsCatalogSelectorModel)
-        self.opdsCatalogSelector.setCurrentText(firstCatalogTitle)
         self.layout.addWidget(self.opdsCatalogSelector, 1, 1, 1, 3)
         
+        self.deltaCatalogCheckbox = QCheckBox(TEXT.DELTA_CATALOG, self)
+        self.deltaCatalogCheckbox.setToolTip(TEXT.DELTA_CATALOG_TOOLTIP)
+        self.deltaCatalogCheckbox.setEnabled(PREFS[KEY.FEED_CACHE_SIZE] > 0)
+        self.deltaCatalogCheckbox.clicked.connect(self.setDeltaCatalog)
+        self.opdsCatalogSelector.currentTextChanged.connect(self.opdsCatalogChanged)
+        self.layout.addWidget(self.deltaCatalogCheckbox, 1, 4)
+        
+        self.crawlCatalogsCheckbox = QCheckBox(TEXT.CRAWL_CATALOGS, self)
+        self.crawlCatalogsCheckbox.setToolTip(TEXT.CRAWL_CATALOGS_TOOLTIP)
+        self.crawlCatalogsCheckbox.setChecked(PREFS[KEY.CRAWL_CATALOGS])
+        self.crawlCatalogsCheckbox.clicked.connect(self.setCrawlCatalogs)
+        self.layout.addWidget(self.crawlCatalogsCheckbox, 1, 5)
+        
         self.catalog_url_button = QPushButton(_('Catalog to URL'), self)
         self.catalog_url_button.setAutoDefault(False)
         self.catalog_url_button.clicked.connect(self.catalog_to_url)
@@ -175,6 +199,7 @@ class OpdsDialog(Dialog):
         
         # Search GUI
         self.searchEditor = QLineEdit(self)
+        self.searchEditor.setPlaceholderText(_('Words of the title, authors or tags; or author:, title:, tag:'))
         self.searchEditor.returnPressed.connect(self.searchBookList)
         self.layout.addWidget(self.searchEditor, 2, buttonColumnNumber - 2, 1, 2)
         
@@ -187,17 +212,58 @@ class OpdsDialog(Dialog):
         self.searchButton.clicked.connect(self.searchBookList)
         self.layout.addWidget(self.searchButton, 2, buttonColumnNumber)
         
+        self.searchServerButton = QPushButton(_('Search on server'), self)
+        self.searchServerButton.setAutoDefault(False)
+        self.searchServerButton.setEnabled(False)
+        self.searchServerButton.setToolTip(_('Load the books found by the OPDS server, instead of the whole catalog'))
+        self.searchServerButton.clicked.connect(self.searchServer)
+        self.layout.addWidget(self.searchServerButton, 2, buttonColumnNumber - 3)
+        
+        # Progress of the loading
+        self.progressLabel = QLabel(self)
+        self.layout.addWidget(self.progressLabel, 3, 0, 1, 3)
+        
+        self.progressBar = QProgressBar(self)
+        self.progressBar.setVisible(False)
+        self.layout.addWidget(self.progressBar, 3, 3, 1, buttonColumnNumber - 3)
+        
+        self.cancelButton = QPushButton(_('Cancel'), self)
+        self.cancelButton.setAutoDefault(False)
+        self.cancelButton.setVisible(False)
+        self.cancelButton.clicked.connect(self.cancelLoading)
+        self.layout.addWidget(self.cancelButton, 3, buttonColumnNumber)
+        
         # The main book list
-        self.library_view = QTableView(self)
+        self.library_view = OpdsBooksView(self)
         self.library_view.setSortingEnabled(True)
         self.library_view.setAlternatingRowColors(True)
-        self.library_view.setModel(self.searchproxymodel)
+        self.library_view.setModel(self.model)
         self.library_view.horizontalHeader().setSectionResizeMode(0, ResizeMode.Stretch)
         self.library_view.horizontalHeader().setSectionResizeMode(1, ResizeMode.Stretch)
         self.library_view.horizontalHeader().setSectionResizeMode(2, ResizeMode.ResizeToContents)
+        self.library_view.horizontalHeader().setSectionResizeMode(3, ResizeMode.ResizeToContents)
+        # The sources are only shown for the catalogs of several servers
+        self.library_view.setColumnHidden(3, True)
         self.library_view.setSelectionBehavior(QAbstractItemView.SelectRows)
-        self.resizeRowHeight()
+        self.library_view.sortByColumn(-1, Qt.AscendingOrder)
+        # The same height for all the rows, the view doesn't have to measure them
+        self.library_view.verticalHeader().setSectionResizeMode(ResizeMode.Fixed)
+        self.library_view.verticalHeader().setDefaultSectionSize(self.library_view.horizontalHeader().sizeHint().height())
+        # The covers of the rows shown are loaded in background
+        self.thumbnailLoader = None
+        if PREFS[KEY.SHOW_THUMBNAILS]:
+            self.thumbnailLoader = ThumbnailLoader(self, openThumbnailCache(), PREFS[KEY.MAX_DOWNLOADS_PER_HOST])
+            self.thumbnailLoader.thumbnailLoaded.connect(self.thumbnailLoaded)
+            self.model.thumbnails = self.thumbnailLoader
+            self.library_view.setIconSize(QSize(THUMBNAIL_HEIGHT, THUMBNAIL_HEIGHT))
+            self.library_view.verticalHeader().setDefaultSectionSize(THUMBNAIL_HEIGHT + 4)
+        # Several thumbnails loaded at once are shown by a single repaint
+        self.thumbnailRepaintTimer = QTimer(self)
+        self.thumbnailRepaintTimer.setSingleShot(True)
+        self.thumbnailRepaintTimer.setInterval(100)
+        self.thumbnailRepaintTimer.timeout.connect(self.library_view.viewport().update)
         self.layout.addWidget(self.library_view, 4, 0, 3, buttonColumnNumber + 1)
+        self.library_view.verticalScrollBar().valueChanged.connect(self.fetchMoreIfNearEnd)
         
         # Options GUI
         self.hideBooksAlreadyInLibraryCheckbox = QCheckBox(TEXT.HIDE_BOOK, self)
@@ -210,6 +276,15 @@ class OpdsDialog(Dialog):
         self.downloadButton.clicked.connect(self.downloadSelectedBooks)
         self.layout.addWidget(self.downloadButton, 7, buttonColumnNumber)
         
+        self.downloadProgressLabel = QLabel(self)
+        self.layout.addWidget(self.downloadProgressLabel, 7, 3, 1, buttonColumnNumber - 3)
+        
+        self.bookDownloader = BookDownloader(self, PREFS[KEY.MAX_DOWNLOADS_PER_HOST])
+        self.bookDownloader.bookDownloaded.connect(self.bookDownloaded)
+        self.bookDownloader.downloadFailed.connect(self.bookDownloadFailed)
+        self.bookDownloader.progressChanged.connect(self.downloadProgressChanged)
+        self.downloadedPaths = []
+        
         self.hideNewsCheckbox = QCheckBox(TEXT.HIDE_NEWSPAPERS, self)
         self.hideNewsCheckbox.clicked.connect(self.setHideNewspapers)
         self.hideNewsCheckbox.setChecked(PREFS[KEY.HIDE_NEWSPAPERS])
@@ -218,31 +293,130 @@ class OpdsDialog(Dialog):
         # Let the checkbox initial state control the filtering
         self.model.setFilterBooksThatAreNewspapers(self.hideNewsCheckbox.isChecked())
         self.model.setFilterBooksThatAreAlreadyInLibrary(self.hideBooksAlreadyInLibraryCheckbox.isChecked())
+        self.model.setTagFilter(PREFS[KEY.HIDDEN_TAGS])
+        self.model.setFormatFilter(PREFS[KEY.DOWNLOAD_FORMATS])
         
         self.fixTimestampButton = QPushButton(_('Fix timestamps of selection'), self)
         self.fixTimestampButton.setAutoDefault(False)
         self.fixTimestampButton.clicked.connect(self.fixBookTimestamps)
         self.layout.addWidget(self.fixTimestampButton, 8, buttonColumnNumber)
         
+        # Diagnostics of the last load: time by phase and counters
+        self.loadMetrics = None
+        self.diagnosticsCheckbox = QCheckBox(TEXT.SHOW_DIAGNOSTICS, self)
+        self.diagnosticsCheckbox.setChecked(PREFS[KEY.SHOW_DIAGNOSTICS])
+        self.diagnosticsCheckbox.clicked.connect(self.setShowDiagnostics)
+        self.layout.addWidget(self.diagnosticsCheckbox, 9, 0, 1, 3)
+        
+        self.exportDiagnosticsButton = QPushButton(_('Export the trace...'), self)
+        self.exportDiagnosticsButton.setAutoDefault(False)
+        self.exportDiagnosticsButton.setToolTip(_('Save the measures of the last load in a JSON file'))
+        self.exportDiagnosticsButton.clicked.connect(self.exportDiagnostics)
+        self.layout.addWidget(self.exportDiagnosticsButton, 9, buttonColumnNumber)
+        
+        self.diagnosticsView = QPlainTextEdit(self)
+        self.diagnosticsView.setReadOnly(True)
+        self.diagnosticsView.setFont(QFontDatabase.systemFont(SystemFont.FixedFont))
+        self.diagnosticsView.setMaximumHeight(self.diagnosticsView.fontMetrics().lineSpacing() * 12)
+        self.layout.addWidget(self.diagnosticsView, 10, 0, 1, buttonColumnNumber + 1)
+        
+        # Refreshed while a catalog is loaded
+        self.diagnosticsTimer = QTimer(self)
+        self.diagnosticsTimer.setInterval(500)
+        self.diagnosticsTimer.timeout.connect(self.updateDiagnostics)
+        self.setShowDiagnostics(self.diagnosticsCheckbox.isChecked())
+        
         self.resize(self.sizeHint())
+        
+        # Stop the loading when the dialog is closed, the downloads go on in the background:
+        # the downloaded books are still added to the library
+        self.finished.connect(self.cancelLoading)
+        self.finished.connect(self.model.closeBookStore)
+        if self.thumbnailLoader is not None:
+            self.finished.connect(self.thumbnailLoader.close)
+        
+        # Initially download the catalogs found in the root catalog of the URL
+        # selected at startup.  Fail quietly on failing to open the URL
+        self.loadRootCatalog(self.opdsUrlEditor.currentText(), False)
     
-    def resizeRowHeight(self):
-        rowHeight = self.library_view.horizontalHeader().height()
-        for rowNumber in range(self.library_view.model().rowCount()):
-            self.library_view.setRowHeight(rowNumber, rowHeight)
-        self.library_view.sortByColumn(-1, Qt.AscendingOrder)
-    
-    def opdsUrlEditorActivated(self, text):
+    def opdsUrlEditorActivated(self, text, downloadAfter=False):
         PREFS[KEY.OPDS_URL] = saveOpdsUrlCombobox(self.opdsUrlEditor)
-        firstCatalogTitle, catalogsList = self.model.downloadOpdsRootCatalog(
-            self.gui,
-            self.opdsUrlEditor.currentText(),
-            True,
-        )
-        self.currentOpdsCatalogs = catalogsList  # A dictionary of title->feedURL
+        self.loadRootCatalog(self.opdsUrlEditor.currentText(), True, downloadAfter)
+    
+    def loadRootCatalog(self, opdsUrl, displayDialogOnErrors, downloadAfter=False):
+        loader = RootCatalogLoader(self, opdsUrl)
+        loader.rootCatalogLoaded.connect(partial(self.rootCatalogLoaded, loader, downloadAfter))
+        loader.loadFailed.connect(partial(self.rootCatalogLoadFailed, loader, opdsUrl, displayDialogOnErrors))
+        self.rootCatalogLoader = loader
+        self.progressLabel.setText(_('Loading {:s}').format(opdsUrl))
+        loader.start()
+    
+    def rootCatalogLoaded(self, loader, downloadAfter, rootCatalog):
+        if loader is not self.rootCatalogLoader:
+            return
+        debug_print('serverHeader:', rootCatalog.serverHeader)
+        debug_print('catalogs:', len(rootCatalog.catalogs), list(rootCatalog.catalogs))
+        self.progressLabel.setText('')
+        self.model.setRootCatalog(rootCatalog)
+        self.searchServerButton.setEnabled(self.model.hasServerSearch())
+        self.setOpdsCatalogs(rootCatalog.firstTitle, rootCatalog.catalogs)
+        if downloadAfter:
+            self.download_opds()
+    
+    def rootCatalogLoadFailed(self, loader, opdsUrl, displayDialogOnErrors, exception):
+        if loader is not self.rootCatalogLoader:
+            return
+        self.progressLabel.setText('')
+        self.setOpdsCatalogs(None, {})
+        self.searchServerButton.setEnabled(False)
+        message = _('Failed opening the OPDS URL {:s}:').format(opdsUrl)
+        reason = str(getattr(exception, 'reason', exception))
+        error_dialog(self.gui, _('Failed opening the OPDS URL'), message, reason, displayDialogOnErrors)
+    
+    def setOpdsCatalogs(self, firstCatalogTitle, catalogs):
+        self.currentOpdsCatalogs = catalogs  # A dictionary of title->feedURL
         self.opdsCatalogSelectorModel.setStringList(self.currentOpdsCatalogs.keys())
         self.opdsCatalogSelector.setCurrentText(firstCatalogTitle)
     
+    def opdsCatalogChanged(self, title):
+        self.deltaCatalogCheckbox.setChecked(self.currentOpdsCatalogs.get(title) in PREFS[KEY.DELTA_CATALOGS])
+    
+    def setDeltaCatalog(self, checked):
+        opdsCatalogUrl = self.currentOpdsCatalogs.get(self.opdsCatalogSelector.currentText(), None)
+        if not opdsCatalogUrl:
+            return
+        deltaCatalogs = [url for url in PREFS[KEY.DELTA_CATALOGS] if url != opdsCatalogUrl]
+        if checked:
+            deltaCatalogs.append(opdsCatalogUrl)
+        PREFS[KEY.DELTA_CATALOGS] = deltaCatalogs
+    
+    def setFederated(self, checked):
+        PREFS[KEY.FEDERATED] = checked
+    
+    def setCrawlCatalogs(self, checked):
+        PREFS[KEY.CRAWL_CATALOGS] = checked
+    
+    def setShowDiagnostics(self, checked):
+        PREFS[KEY.SHOW_DIAGNOSTICS] = checked
+        self.diagnosticsView.setVisible(checked)
+        self.exportDiagnosticsButton.setVisible(checked)
+        self.updateDiagnostics()
+    
+    def updateDiagnostics(self):
+        if self.diagnosticsView.isVisible() and self.loadMetrics is not None:
+            self.diagnosticsView.setPlainText(self.loadMetrics.text())
+    
+    def exportDiagnostics(self):
+        if self.loadMetrics is None:
+            return
+        path = choose_save_file(
+            self, 'opds-reader-diagnostics', _('Export the trace of the load'),
+            filters=[(_('JSON files'), ['json'])], initial_filename='opds_trace.json',
+        )
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(self.loadMetrics.toJson())
+    
     def setHideNewspapers(self, checked):
         PREFS[KEY.HIDE_NEWSPAPERS] = checked
         self.model.setFilterBooksThatAreNewspapers(checked)
@@ -254,23 +428,156 @@ class OpdsDialog(Dialog):
     def searchBookList(self):
         searchString = self.searchEditor.text()
         debug_print('Starting book list search for:', searchString)
-        self.searchproxymodel.setFilterFixedString(searchString)
+        self.model.setSearchQuery(searchString)
+    
+    def searchServer(self):
+        searchTerms = self.searchEditor.text().strip()
+        if not searchTerms or not self.model.hasServerSearch():
+            return
+        debug_print('Searching on the server:', searchTerms)
+        # The books found are not filtered again by the search
+        self.model.setSearchQuery('')
+        self.loadCatalog(self.model.searchLink['href'], searchTerms)
     
     def download_opds(self):
-        opdsCatalogUrl = self.currentOpdsCatalogs.get(self.opdsCatalogSelector.currentText(), None)
+        catalogTitle = self.opdsCatalogSelector.currentText()
+        opdsCatalogUrl = self.currentOpdsCatalogs.get(catalogTitle, None)
         if not opdsCatalogUrl:
             return
-        self.model.downloadOpdsCatalog(self.gui, opdsCatalogUrl)
-        if self.model.isCalibreOpdsServer():
-            self.model.downloadMetadataUsingCalibreRestApi(self.opdsUrlEditor.currentText())
-        self.resizeRowHeight()
+        opdsUrls = federatedOpdsUrls()
+        if self.federatedCheckbox.isChecked() and len(opdsUrls) > 1:
+            debug_print('Downloading catalog from', len(opdsUrls), 'servers:', catalogTitle)
+            self.cancelLoading()
+            self.startLoading(FederatedLoader(self, opdsUrls, catalogTitle, PREFS[KEY.MAX_CONCURRENT_PAGES],
+                                              openFeedCache()))
+            return
+        debug_print('Downloading catalog:', opdsCatalogUrl)
+        self.loadCatalog(opdsCatalogUrl)
+    
+    def loadCatalog(self, opdsCatalogUrl, searchTerms=None):
+        self.cancelLoading()
+        # For a search, the URL of the results is built by the loader from the search link
+        searchLink = self.model.searchLink if searchTerms else None
+        loader = CatalogLoader(self, opdsCatalogUrl, PREFS[KEY.MAX_CONCURRENT_PAGES], openFeedCache(),
+                               self.model.isCalibreOpdsServer(), searchLink, searchTerms,
+                               opdsCatalogUrl in PREFS[KEY.DELTA_CATALOGS],
+                               PREFS[KEY.MAX_CRAWL_DEPTH] if PREFS[KEY.CRAWL_CATALOGS] else 0,
+                               PREFS[KEY.LOAD_ON_DEMAND], PREFS[KEY.MAX_CRAWL_FEEDS])
+        self.startLoading(loader)
+    
+    def startLoading(self, loader):
+        loader.booksLoaded.connect(partial(self.catalogBooksLoaded, loader))
+        loader.timestampsLoaded.connect(partial(self.catalogTimestampsLoaded, loader))
+        loader.progressChanged.connect(partial(self.catalogProgressChanged, loader))
+        loader.loadFailed.connect(partial(self.catalogLoadFailed, loader))
+        loader.waitingForDemand.connect(partial(self.catalogWaitingForDemand, loader))
+        loader.finished.connect(partial(self.catalogLoadFinished, loader))
+        federated = isinstance(loader, FederatedLoader)
+        if federated:
+            loader.booksMerged.connect(partial(self.catalogBooksMerged, loader))
+        self.library_view.setColumnHidden(3, not federated)
+        self.catalogLoader = loader
+        self.model.clearBooks()
+        # The next pages are loaded when the view is scrolled near the end
+        self.model.pageLoader = loader if loader.onDemand else None
+        # The work of the model on the books of the load is measured with the load
+        self.loadMetrics = self.model.metrics = loader.metrics
+        self.diagnosticsTimer.start()
+        self.setLoading(True)
+        loader.start()
+    
+    def cancelLoading(self):
+        if self.catalogLoader is not None:
+            self.catalogLoader.cancel()
+    
+    def setLoading(self, loading):
+        # Only one catalog can be loaded at a time
+        self.download_opds_button.setEnabled(not loading)
+        self.catalog_url_button.setEnabled(not loading)
+        self.searchServerButton.setEnabled(not loading and self.model.hasServerSearch())
+        self.cancelButton.setVisible(loading)
+        self.progressBar.setVisible(loading)
+        self.progressBar.setRange(0, 0)
+        if loading:
+            self.progressLabel.setText(_('Loading the catalog...'))
+    
+    def catalogBooksLoaded(self, loader, books):
+        if loader is self.catalogLoader and not loader.isCancelled():
+            self.model.appendBooks(books)
+    
+    def catalogBooksMerged(self, loader, books):
+        if loader is self.catalogLoader and not loader.isCancelled():
+            self.model.updateSources(books)
+    
+    def catalogTimestampsLoaded(self, loader, timestamps):
+        if loader is self.catalogLoader and not loader.isCancelled():
+            self.model.updateTimestamps(timestamps)
+    
+    def catalogProgressChanged(self, loader, progress):
+        if loader is not self.catalogLoader:
+            return
+        if not self.cancelButton.isVisible():
+            # Loading again after waiting for the demand
+            self.setLoading(True)
+        self.progressLabel.setText(progress.text())
+        if progress.totalEntries:
+            self.progressBar.setRange(0, progress.totalEntries)
+            self.progressBar.setValue(min(progress.entries, progress.totalEntries))
+    
+    def catalogLoadFailed(self, loader, exception):
+        if loader is not self.catalogLoader:
+            return
+        message = _('Failed loading the catalog {:s}:').format(loader.catalogUrl)
+        reason = str(getattr(exception, 'reason', exception))
+        error_dialog(self.gui, _('Failed loading the catalog'), message, reason, True)
+    
+    def catalogWaitingForDemand(self, loader):
+        if loader is not self.catalogLoader:
+            return
+        self.setLoading(False)
+        self.model.sortIfPending()
+        self.progressLabel.setText(_('{:s}, scroll down to load more').format(loader.progress.text()))
+        # Until the view is filled
+        self.fetchMoreIfNearEnd()
+    
+    def fetchMoreIfNearEnd(self):
+        scrollBar = self.library_view.verticalScrollBar()
+        if scrollBar.value() >= scrollBar.maximum() - scrollBar.pageStep() and self.model.canFetchMore(QModelIndex()):
+            self.model.fetchMore(QModelIndex())
+    
+    def catalogLoadFinished(self, loader):
+        if loader is not self.catalogLoader:
+            return
+        self.catalogLoader = None
+        self.diagnosticsTimer.stop()
+        self.updateDiagnostics()
+        if self.model.pageLoader is loader:
+            self.model.pageLoader = None
+        self.setLoading(False)
+        self.model.sortIfPending()
+        text = loader.progress.text()
+        if isinstance(loader, FederatedLoader):
+            self.bookDownloader.setHostLatencies(loader.hostLatencies)
+            if loader.errors:
+                text = _('{text}, {failed} servers failed: {servers}').format(
+                    text=text, failed=len(loader.errors), servers=', '.join(url for url, _error in loader.errors),
+                )
+        if loader.isCancelled():
+            text = _('Cancelled: {:s}').format(text)
+        self.progressLabel.setText(text)
+        if self.library_view.selectAllWhenLoaded:
+            self.library_view.selectAllWhenLoaded = False
+            self.library_view.selectAll()
+    
+    def thumbnailLoaded(self, url):
+        if not self.thumbnailRepaintTimer.isActive():
+            self.thumbnailRepaintTimer.start()
     
     def catalog_to_url(self):
         opdsCatalogUrl = self.currentOpdsCatalogs.get(self.opdsCatalogSelector.currentText(), None)
         self.opdsUrlEditor.insertItem(0, opdsCatalogUrl)
         self.opdsUrlEditor.setCurrentIndex(0)
-        self.opdsUrlEditorActivated(opdsCatalogUrl)
-        self.download_opds()
+        self.opdsUrlEditorActivated(opdsCatalogUrl, downloadAfter=True)
     
     def config(self):
         self.do_user_config(parent=self)
@@ -279,55 +586,100 @@ class OpdsDialog(Dialog):
         selectionmodel = self.library_view.selectionModel()
         if selectionmodel.hasSelection():
             rows = selectionmodel.selectedRows()
-            for row in reversed(rows):
-                book = row.data(Qt.UserRole)
-                self.downloadBook(book)
-    
-    def downloadBook(self, book):
-        if len(book.links) > 0:
-            self.gui.download_ebook(book.links[0])
+            books = [row.data(Qt.UserRole) for row in reversed(rows)]
+            if self.bookDownloader.directory is None:
+                from calibre.ptempfile import PersistentTemporaryDirectory
+                self.bookDownloader.directory = PersistentTemporaryDirectory('_opds_reader')
+            queued = self.bookDownloader.addBooks(books)
+            debug_print('Books queued for download:', queued, '/', len(books))
+    
+    def bookDownloaded(self, book, path):
+        if self.isVisible():
+            # The book store of a closed dialog is closed
+            self.model.addBooksToLibrary([book])
+        # Add the books to the library by batches
+        if not self.downloadedPaths:
+            QTimer.singleShot(1000, self.addDownloadedBooks)
+        self.downloadedPaths.append(path)
+    
+    def addDownloadedBooks(self):
+        paths, self.downloadedPaths = self.downloadedPaths, []
+        if paths:
+            self.gui.iactions['Add Books'].add_filesystem_book(paths)
+    
+    def bookDownloadFailed(self, book, exception):
+        debug_print('Failed downloading the book:', book, exception)
+    
+    def downloadProgressChanged(self, progress):
+        if progress is self.bookDownloader.progress:
+            self.downloadProgressLabel.setText(progress.text())
     
     def fixBookTimestamps(self):
         selectionmodel = self.library_view.selectionModel()
-        if selectionmodel.hasSelection():
-            rows = selectionmodel.selectedRows()
-            for row in reversed(rows):
-                book = row.data(Qt.UserRole)
-                self.fixBookTimestamp(book)
-    
-    def fixBookTimestamp(self, book):
-        bookTimestamp = book.timestamp
-        identicalBookIds = self.findIdenticalBooksForBooksWithMultipleAuthors(book)
-        bookIdToValMap = {}
-        for identicalBookId in identicalBookIds:
-            bookIdToValMap[identicalBookId] = bookTimestamp
-        if len(bookIdToValMap) < 1:
-            debug_print('Failed to set timestamp of book:', book)
-        self.dbAPI.set_field('timestamp', bookIdToValMap)
-    
-    def findIdenticalBooksForBooksWithMultipleAuthors(self, book):
-        authorsList = book.authors
-        if len(authorsList) < 2:
-            return self.dbAPI.find_identical_books(book)
-        # Try matching the authors one by one
-        identicalBookIds = set()
-        for author in authorsList:
-            singleAuthorBook = Metadata(book.title, [author])
-            singleAuthorIdenticalBookIds = self.dbAPI.find_identical_books(singleAuthorBook)
-            identicalBookIds = identicalBookIds.union(singleAuthorIdenticalBookIds)
-        return identicalBookIds
+        if not selectionmodel.hasSelection():
+            return
+        books = [row.data(Qt.UserRole) for row in selectionmodel.selectedRows()]
+        # Index the library once, and write all the timestamps at once
+        matches = LibraryIndex(self.dbAPI).matchTimestamps(books)
+        if matches.timestamps:
+            self.dbAPI.set_field('timestamp', matches.timestamps)
+        debug_print('Timestamps fixed:', len(matches.timestamps), 'books of the library')
+        self.progressLabel.setText(
+            _('Timestamps fixed: {matched} books matched, {ambiguous} ambiguous, {unmatched} not found in the library')
+            .format(matched=matches.matched, ambiguous=matches.ambiguous, unmatched=matches.unmatched),
+        )
+
+
+class OpdsBooksView(QTableView):
+    '''Select all the books of the catalog, also the pages not loaded yet'''
+    
+    selectAllWhenLoaded = False
+    
+    def selectAll(self):
+        model = self.model()
+        if isinstance(model, OpdsBooksModel) and model.loadAllPages():
+            self.selectAllWhenLoaded = True
+        QTableView.selectAll(self)
+
+
+# Filters of the book list
+FILTER_NEWS = 'news'
+FILTER_IN_LIBRARY = 'inLibrary'
+FILTER_TAGS = 'tags'
+FILTER_FORMATS = 'formats'
 
 
 class OpdsBooksModel(QAbstractTableModel):
-    column_headers = [_('Title'), _('Author(s)'), _('Updated')]
-    booktableColumnCount = 3
-    filterBooksThatAreNewspapers = False
-    filterBooksThatAreAlreadyInLibrary = False
+    column_headers = [_('Title'), _('Author(s)'), _('Updated'), _('Source')]
+    booktableColumnCount = 4
     
-    def __init__(self, parent, books=[], db: Cache=None):
+    def __init__(self, parent, books=[], db: Cache=None, store: BookStore=None):
         QAbstractTableModel.__init__(self, parent)
         self.dbAPI = db
-        self.books = self.makeMetadataFromParsedOpds(books)
+        self.libraryIndex = None
+        # The result of the filters is computed once by book, toggling a filter only selects the rows again
+        self.filters = FilterBits()
+        self.filters.setPredicate(FILTER_NEWS, tagPredicate(['News']))
+        self.filters.setPredicate(FILTER_IN_LIBRARY, self.isInLibrary)
+        self.serverHeader = 'none'
+        self.searchLink = None
+        self.searchQuery = ''
+        self.searchMatches = None
+        self.sortColumn = -1
+        self.sortOrder = Qt.AscendingOrder
+        # The sort keys of books changed during a load, the rows are sorted again at the end of the load
+        self.sortPending = False
+        # The CatalogLoader of the pages loaded on demand, while some pages are not loaded
+        self.pageLoader = None
+        # Measures of the work on the books of the last load
+        self.metrics = NO_METRICS
+        # The ThumbnailLoader of the covers, None to not show them
+        self.thumbnails = None
+        # The books of the catalog, with their search index and their display texts and sort keys,
+        # and the ids of the books of the rows: the books shown, in the order of the sort
+        self.books = store if store is not None else BookStore()
+        self.rows = array('I')
+        self.books.append(self.makeEntriesFromParsedOpds(books))
         self.filterBooks()
     
     def headerData(self, section, orientation, role):
@@ -340,77 +692,119 @@ class OpdsBooksModel(QAbstractTableModel):
         return self.column_headers[section]
     
     def rowCount(self, parent) -> int:
-        return len(self.filteredBooks)
+        return len(self.rows)
     
     def columnCount(self, parent) -> int:
         return self.booktableColumnCount
     
     def data(self, index, role):
         row, col = index.row(), index.column()
-        if row >= len(self.filteredBooks):
+        if row >= len(self.rows):
             return None
-        opdsBook = self.filteredBooks[row]
+        bookId = self.rows[row]
         if role == Qt.UserRole:
-            # Return the Metadata object underlying each row
-            return opdsBook
+            # Return the CatalogEntry object underlying each row
+            return self.books[bookId]
+        if role == Qt.DecorationRole:
+            # Only requested for the rows shown by the view
+            if col == 0 and self.thumbnails is not None:
+                opdsBook = self.books[bookId]
+                if opdsBook.thumbnail:
+                    return self.thumbnails.thumbnail(opdsBook.thumbnail)
+            return None
         if role != Qt.DisplayRole:
             return None
         if col >= self.booktableColumnCount:
             return None
         if col == 0:
-            return opdsBook.title
-        if col == 1:
-            return ' & '.join(opdsBook.author)
-        if col == 2:
-            if opdsBook.timestamp is not None:
-                return opdsBook.timestamp.strftime('%Y-%m-%d %H:%M:%S')
-            return opdsBook.timestamp
-        return None
-    
-    def downloadOpdsRootCatalog(self, gui, opdsUrl, displayDialogOnErrors) -> Tuple[str, Dict]:
-        feed = feedparser.parse(opdsUrl)
-        if 'bozo_exception' in feed:
-            exception = feed['bozo_exception']
-            message = _('Failed opening the OPDS URL {:s}:').format(opdsUrl)
-            reason = str(getattr(exception, 'reason', ''))
-            error_dialog(gui, _('Failed opening the OPDS URL'), message, reason, displayDialogOnErrors)
-            return (None, {})
-        if 'server' in feed.headers:
-            self.serverHeader = feed.headers['server']
-        else:
-            self.serverHeader = 'none'
-        debug_print('serverHeader:', self.serverHeader)
-        debug_print('feed.entries:', len(feed.entries), [e['title'] for e in feed.entries])
-        catalogEntries = {}
-        firstTitle = None
-        for entry in feed.entries:
-            title = entry.get('title', 'No title')
-            if firstTitle is None:
-                firstTitle = title
-            links = entry.get('links', [])
-            firstLink = next(iter(links), None)
-            if firstLink is not None:
-                debug_print(f'firstLink: {title} "{firstLink.href}"')
-                catalogEntries[title] = firstLink.href
-        return firstTitle, catalogEntries
-    
-    def downloadOpdsCatalog(self, gui, opdsCatalogUrl):
-        debug_print('Downloading catalog:', opdsCatalogUrl)
-        opdsCatalogFeed = feedparser.parse(opdsCatalogUrl)
-        self.books = self.makeMetadataFromParsedOpds(opdsCatalogFeed.entries)
-        self.filterBooks()
-        QCoreApplication.processEvents()
-        nextUrl = self.findNextUrl(opdsCatalogFeed.feed)
-        while nextUrl is not None:
-            nextFeed = feedparser.parse(nextUrl)
-            self.books = self.books + self.makeMetadataFromParsedOpds(nextFeed.entries)
-            self.filterBooks()
-            QCoreApplication.processEvents()
-            nextUrl = self.findNextUrl(nextFeed.feed)
+            return self.books[bookId].title
+        return self.books.displayTexts(bookId)[col - 1]
+    
+    def canFetchMore(self, parent) -> bool:
+        return not parent.isValid() and self.pageLoader is not None and self.pageLoader.canLoadMore()
+    
+    def fetchMore(self, parent):
+        if self.canFetchMore(parent):
+            self.pageLoader.loadMore()
+    
+    def loadAllPages(self) -> bool:
+        '''Load the pages not loaded yet, for the operations on the whole catalog'''
+        if self.pageLoader is None:
+            return False
+        self.pageLoader.loadAll()
+        self.pageLoader = None
+        return True
+    
+    def sort(self, column, order=Qt.AscendingOrder):
+        if 0 <= column < self.booktableColumnCount:
+            self.loadAllPages()
+        with self.metrics.phase('sort'):
+            self._sort(column, order)
+    
+    def _sort(self, column, order):
+        self.sortColumn = column
+        self.sortOrder = order
+        self.sortPending = False
+        self.layoutAboutToBeChanged.emit()
+        # Keep the selection on the same books
+        oldIndexes = self.persistentIndexList()
+        oldBookIds = [self.rows[index.row()] for index in oldIndexes]
+        self.rows = self.sortBooks(self.rows)
+        if oldIndexes:
+            rows = {bookId: row for row, bookId in enumerate(self.rows)}
+            newIndexes = [self.index(rows[bookId], index.column()) for bookId, index in zip(oldBookIds, oldIndexes)]
+            self.changePersistentIndexList(oldIndexes, newIndexes)
+        self.layoutChanged.emit()
+    
+    def sortIfPending(self):
+        '''Sort again the rows once the load is finished (or waiting), if sort keys changed during the load'''
+        if self.sortPending:
+            with self.metrics.phase('sort'):
+                self._sort(self.sortColumn, self.sortOrder)
+    
+    def sortBooks(self, bookIds) -> array:
+        '''The ids of books in the order of the sort, in the order of the catalog when not sorted'''
+        if self.sortColumn < 0 or self.sortColumn >= self.booktableColumnCount:
+            return self.books.sortedIds(bookIds, -1)
+        return self.books.sortedIds(bookIds, self.sortColumn, self.sortOrder == Qt.DescendingOrder)
+    
+    def setRootCatalog(self, rootCatalog):
+        self.serverHeader = rootCatalog.serverHeader
+        self.searchLink = findSearchLink(rootCatalog.header['links'])
+        debug_print('searchLink:', self.searchLink)
+    
+    def hasServerSearch(self) -> bool:
+        return self.searchLink is not None
     
     def isCalibreOpdsServer(self) -> bool:
         return self.serverHeader.startswith('calibre')
     
+    def closeBookStore(self):
+        # When the dialog is closed: the temporary file of a SQLite store is deleted
+        self.beginResetModel()
+        self.rows = array('I')
+        self.books.close()
+        self.endResetModel()
+    
+    @property
+    def filterBooksThatAreNewspapers(self) -> bool:
+        return self.filters.isActive(FILTER_NEWS)
+    
+    @filterBooksThatAreNewspapers.setter
+    def filterBooksThatAreNewspapers(self, value):
+        self.filters.setActive(FILTER_NEWS, value, self.books)
+    
+    @property
+    def filterBooksThatAreAlreadyInLibrary(self) -> bool:
+        return self.filters.isActive(FILTER_IN_LIBRARY)
+    
+    @filterBooksThatAreAlreadyInLibrary.setter
+    def filterBooksThatAreAlreadyInLibrary(self, value):
+        computed = self.filters.isComputed(FILTER_IN_LIBRARY)
+        self.filters.setActive(FILTER_IN_LIBRARY, value, self.books)
+        if not computed:
+            self.countLibraryLookups(len(self.books))
+    
     def setFilterBooksThatAreAlreadyInLibrary(self, value):
         if value != self.filterBooksThatAreAlreadyInLibrary:
             self.filterBooksThatAreAlreadyInLibrary = value
@@ -421,130 +815,163 @@ class OpdsBooksModel(QAbstractTableModel):
             self.filterBooksThatAreNewspapers = value
             self.filterBooks()
     
-    def filterBooks(self) -> bool:
-        self.beginResetModel()
-        self.filteredBooks = []
-        for book in self.books:
-            if (not self.isFilteredNews(book)) and (not self.isFilteredAlreadyInLibrary(book)):
-                self.filteredBooks.append(book)
-        self.endResetModel()
+    def setTagFilter(self, tags):
+        '''Hide the books with one of the tags'''
+        self.setUserFilter(FILTER_TAGS, tagPredicate(tags) if tags else None)
+    
+    def setFormatFilter(self, formats):
+        '''Hide the books that can't be downloaded in one of the formats'''
+        self.setUserFilter(FILTER_FORMATS, formatPredicate(formats) if formats else None)
+    
+    def setUserFilter(self, name, predicate):
+        if predicate is None:
+            if not self.filters.hasPredicate(name):
+                return
+            self.filters.removePredicate(name)
+        else:
+            self.filters.setPredicate(name, predicate, self.books)
+            self.filters.setActive(name, True, self.books)
+        self.filterBooks()
     
-    def isFilteredNews(self, book) -> bool:
-        if self.filterBooksThatAreNewspapers:
-            if 'News' in book.tags:
-                return True
-        return False
-    
-    def isFilteredAlreadyInLibrary(self, book) -> bool:
-        if self.filterBooksThatAreAlreadyInLibrary:
-            return self.dbAPI.has_book(book)
-        return False
-    
-    def makeMetadataFromParsedOpds(self, books) -> List[Metadata]:
-        metadatalist = []
-        for book in books:
-            metadata = self.opdsToMetadata(book)
-            metadatalist.append(metadata)
-        return metadatalist
-    
-    def opdsToMetadata(self, opdsBookStructure) -> Metadata:
-        authors = opdsBookStructure.author.replace('& ', '&') if 'author' in opdsBookStructure else ''
-        metadata = Metadata(opdsBookStructure.title, authors.split('&'))
-        metadata.uuid = opdsBookStructure.id.replace('urn:uuid:', '', 1) if 'id' in opdsBookStructure else ''
-        try:
-            rawTimestamp = opdsBookStructure.updated
-        except AttributeError:
-            rawTimestamp = '1980-01-01T00:00:00+00:00'
-        metadata.timestamp = parse_timestamp(rawTimestamp)
-        tags = []
-        summary = opdsBookStructure.get('summary', '')
-        summarylines = summary.splitlines()
-        for summaryline in summarylines:
-            if summaryline.startswith('TAGS: '):
-                tagsline = summaryline.replace('TAGS: ', '')
-                tagsline = tagsline.replace('<br />','')
-                tagsline = tagsline.replace(', ', ',')
-                tags = tagsline.split(',')
-        metadata.tags = tags
-        bookDownloadUrls = []
-        links = opdsBookStructure.get('links', [])
-        for link in links:
-            url = link.get('href', '')
-            bookType = link.get('type', '')
-            # Skip covers and thumbnails
-            if not bookType.startswith('image/'):
-                if bookType == 'application/epub+zip':
-                    # EPUB books are preferred and always put at the head of the list if found
-                    bookDownloadUrls.insert(0, url)
+    def setSearchQuery(self, query):
+        if query.strip():
+            self.loadAllPages()
+        self.searchQuery = query
+        self.searchMatches = self.books.search(query)
+        self.filterBooks()
+    
+    def clearBooks(self):
+        self.books.clear()
+        self.filters.clear()
+        self.searchMatches = self.books.search(self.searchQuery)
+        self.filterBooks()
+    
+    def appendBooks(self, books):
+        # Only the new rows are inserted, the existing rows (and the selection
+        # and sorting of the view) are kept as is
+        firstBookId = len(self.books)
+        with self.metrics.phase('book store'):
+            self.books.append(books)
+        with self.metrics.phase('search'):
+            if self.searchMatches is not None:
+                # Only the new books are matched, the matches of the books already loaded don't change
+                self.searchMatches |= matchingBooks(books, self.searchQuery, firstBookId)
+        with self.metrics.phase('filter'):
+            self.filters.append(books)
+            acceptedBookIds = self.acceptedBookIds(firstBookId)
+        if self.filters.isComputed(FILTER_IN_LIBRARY):
+            self.countLibraryLookups(len(books))
+        if not acceptedBookIds:
+            return
+        with self.metrics.phase('model insert'):
+            if 0 <= self.sortColumn < self.booktableColumnCount:
+                self.insertSortedRows(acceptedBookIds)
+            else:
+                firstRow = len(self.rows)
+                self.beginInsertRows(QModelIndex(), firstRow, firstRow + len(acceptedBookIds) - 1)
+                self.rows.extend(acceptedBookIds)
+                self.endInsertRows()
+    
+    def insertSortedRows(self, bookIds: List[int]):
+        '''
+        Insert the rows of new books at their place in the sorted rows: the place of each book is
+        found by a binary search, with the sort keys of the few rows compared.
+        The new books have the highest ids: in both orders, they follow the rows of the same key.
+        '''
+        column = self.sortColumn
+        reverse = self.sortOrder == Qt.DescendingOrder
+        keys = self.books.sortKeys(bookIds, column)
+        rows = self.rows
+        rowKeys = {}
+        
+        def rowKey(row):
+            key = rowKeys.get(row)
+            if key is None:
+                key = rowKeys[row] = self.books.sortKeys((rows[row],), column)[rows[row]]
+            return key
+        
+        # The place of each book, by books in the order of the sort: their places follow
+        places = []
+        low = 0
+        for bookId in sorted(bookIds, key=keys.__getitem__, reverse=reverse):
+            key = keys[bookId]
+            high = len(rows)
+            while low < high:
+                middle = (low + high) // 2
+                if (rowKey(middle) >= key) if reverse else (rowKey(middle) <= key):
+                    low = middle + 1
                 else:
-                    # Formats other than EPUB (like AZW), are appended as they are found
-                    bookDownloadUrls.append(url)
-        metadata.links = bookDownloadUrls
-        return metadata
-    
-    def findNextUrl(self, feed) -> str:
-        for link in feed.links:
-            if link.rel == 'next':
-                return link.href
-        return None
-    
-    def downloadMetadataUsingCalibreRestApi(self, opdsUrl):
-        # The "updated" values on the book metadata, in the OPDS returned
-        # by calibre, are unrelated to the books they are returned with:
-        # the "updated" value is the same value for all books metadata,
-        # and this value is the last modified date of the entire calibre
-        # database.
-        #
-        # It is therefore necessary to use the calibre REST API to get
-        # a meaningful timestamp for the books
-        
-        # Get the base of the web server, from the OPDS URL
-        parsedOpdsUrl = urlparse(opdsUrl)
-        
-        # GET the search URL twice: the first time is to get the total number
-        # of books in the other calibre.  The second GET gets arguments
-        # to retrieve all book ids in the other calibre.
-        parsedCalibreRestSearchUrl = ParseResult(parsedOpdsUrl.scheme, parsedOpdsUrl.netloc, '/ajax/search', '', '', '')
-        calibreRestSearchUrl = parsedCalibreRestSearchUrl.geturl()
-        calibreRestSearchResponse = urlopen(calibreRestSearchUrl)
-        calibreRestSearchJsonResponse = json.load(calibreRestSearchResponse)
-        getAllIdsArgument = 'num=' + str(calibreRestSearchJsonResponse['total_num']) + '&offset=0'
-        parsedCalibreRestSearchUrl = ParseResult(
-            parsedOpdsUrl.scheme,
-            parsedOpdsUrl.netloc,
-            '/ajax/search',
-            '',
-            getAllIdsArgument,
-            '',
-        ).geturl()
-        calibreRestSearchResponse = urlopen(parsedCalibreRestSearchUrl)
-        calibreRestSearchJsonResponse = json.load(calibreRestSearchResponse)
-        bookIds = list(map(str, calibreRestSearchJsonResponse['book_ids']))
-        
-        # Get the metadata for all books by adding the list of
-        # all IDs as a GET argument
-        bookIdsGetArgument = 'ids=' + ','.join(bookIds)
-        parsedCalibreRestBooksUrl = ParseResult(
-            parsedOpdsUrl.scheme,
-            parsedOpdsUrl.netloc,
-            '/ajax/books',
-            '',
-            bookIdsGetArgument,
-            '',
-        )
-        calibreRestBooksResponse = urlopen(parsedCalibreRestBooksUrl.geturl())
-        booksDictionary = json.load(calibreRestBooksResponse)
-        self.updateTimestampInMetadata(bookIds, booksDictionary)
-    
-    def updateTimestampInMetadata(self, bookIds, booksDictionary):
-        bookMetadataById = {}
-        for bookId in bookIds:
-            bookMetadata = booksDictionary[bookId]
-            uuid = bookMetadata['uuid']
-            bookMetadataById[uuid] = bookMetadata
-        for book in self.books:
-            bookMetadata = bookMetadataById[book.uuid]
-            rawTimestamp = bookMetadata['timestamp']
-            timestamp = parse_timestamp(rawTimestamp)
+                    high = middle
+            if places and places[-1][0] == low:
+                places[-1][1].append(bookId)
+            else:
+                places.append((low, [bookId]))
+        # From the last place: the rows before are not moved
+        for row, insertedIds in reversed(places):
+            self.beginInsertRows(QModelIndex(), row, row + len(insertedIds) - 1)
+            rows[row:row] = array('I', insertedIds)
+            self.endInsertRows()
+    
+    def filterBooks(self) -> bool:
+        self.metrics.count('model resets')
+        with self.metrics.phase('model reset'):
+            self.beginResetModel()
+            self.rows = self.sortBooks(self.acceptedBookIds())
+            self.endResetModel()
+    
+    def acceptedBookIds(self, start=0) -> List[int]:
+        '''The books not hidden by the filters and found by the search, from the book "start"'''
+        bookIds = self.filters.visibleIndexes(start)
+        if self.searchMatches is None:
+            return bookIds
+        return [bookId for bookId in bookIds if bookId in self.searchMatches]
+    
+    def countLibraryLookups(self, books):
+        # Counted by batch, the lookups are too fast to be measured one by one
+        self.metrics.count('library lookups', books)
+    
+    def isInLibrary(self, book) -> bool:
+        return self.getLibraryIndex().hasBook(book)
+    
+    def getLibraryIndex(self) -> LibraryIndex:
+        # Built once for the session of the dialog, then updated with the downloaded books
+        if self.libraryIndex is None:
+            with self.metrics.phase('library index'):
+                self.libraryIndex = LibraryIndex(self.dbAPI)
+            debug_print('Library index built:', len(self.libraryIndex), 'books')
+        return self.libraryIndex
+    
+    def addBooksToLibrary(self, books):
+        self.getLibraryIndex().addBooks(books)
+        bookIds = self.books.bookIds(books)
+        if self.filters.isComputed(FILTER_IN_LIBRARY):
+            self.filters.compute(FILTER_IN_LIBRARY, self.books, bookIds)
+        if not self.filterBooksThatAreAlreadyInLibrary:
+            return
+        bookIds = set(bookIds)
+        for row in reversed(range(len(self.rows))):
+            if self.rows[row] in bookIds:
+                self.beginRemoveRows(QModelIndex(), row, row)
+                del self.rows[row]
+                self.endRemoveRows()
+    
+    def makeEntriesFromParsedOpds(self, books) -> List[CatalogEntry]:
+        return entriesFromOpds(books)
+    
+    def updateTimestamps(self, timestamps):
+        # List of tuples (book, timestamp), the books not found in the calibre server keep their timestamp
+        for book, timestamp in timestamps:
             book.timestamp = timestamp
-        self.filterBooks()
+        self.books.updateBooks(book for book, _timestamp in timestamps)
+        if self.rows:
+            self.dataChanged.emit(self.index(0, 2), self.index(len(self.rows) - 1, 2))
+        if self.sortColumn == 2:
+            self.sortPending = True
+    
+    def updateSources(self, books):
+        # The books found on another server, with the links of this server
+        self.books.updateBooks(books)
+        if self.rows:
+            self.dataChanged.emit(self.index(0, 3), self.index(len(self.rows) - 1, 3))
+        if self.sortColumn == 3:
+            self.sortPending = True
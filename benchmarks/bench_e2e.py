@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+# End-to-end benchmarks of the plugin against the synthetic server (benchmarks/server.py):
+#   calibre-debug -e benchmarks/bench_e2e.py -- [--books 20000] [--latency 0.005] [--save] [--compare]
+#
+# --save appends the results to benchmarks/results.json, labelled with the current git commit,
+# --compare shows the difference with the last saved results.
+
+import argparse
+import datetime
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import importPlugin, measure, report
+from server import CATALOGS, SyntheticServer
+
+try:
+    from qt.core import QApplication, Qt
+except ImportError:
+    from PyQt5.Qt import QApplication, Qt
+
+RESULTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results.json')
+
+# Difference with the previous results shown as a regression
+REGRESSION_THRESHOLD = 0.10
+
+
+class SyntheticLibrary:
+    '''The new_api of a calibre library holding every other book of the catalog'''
+    
+    def __init__(self, books):
+        self.books = dict(enumerate(books[::2], 1))
+    
+    def all_book_ids(self):
+        return set(self.books)
+    
+    def all_field_for(self, field, bookIds):
+        if field == 'identifiers':
+            return {bookId: {} for bookId in bookIds}
+        return {bookId: getattr(self.books[bookId], field) for bookId in bookIds}
+
+
+def gitLabel() -> str:
+    try:
+        return subprocess.check_output(
+            ['git', 'describe', '--always', '--dirty'], cwd=os.path.dirname(RESULTS_FILE), text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def loadResults():
+    if not os.path.exists(RESULTS_FILE):
+        return []
+    with open(RESULTS_FILE, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def saveResults(runs):
+    with open(RESULTS_FILE, 'w', encoding='utf-8') as f:
+        json.dump(runs, f, indent=2)
+        f.write('\n')
+
+
+def compareResults(previous, parameters, results):
+    print()
+    print('Compared with {} ({})'.format(previous['label'], previous['date']))
+    if previous.get('parameters') != parameters:
+        print('Warning: the parameters were different:', previous.get('parameters'))
+    for name, seconds in results.items():
+        previousSeconds = previous['results'].get(name)
+        if not previousSeconds:
+            continue
+        change = seconds / previousSeconds - 1
+        flag = '  <- regression' if change > REGRESSION_THRESHOLD else ''
+        print('{:<40s} {:10.2f} ms {:+7.1%}{}'.format(name, seconds * 1000, change, flag))
+
+
+def runBenchmarks(server, total):
+    from opds_reader.action import OpdsBooksModel
+    from opds_reader.calibre_rest import downloadCalibreTimestamps
+    from opds_reader.catalog_entry import entriesFromOpds
+    from opds_reader.feed_cache import FeedCache
+    from opds_reader.fetcher import PageFetcher, loadRootCatalog
+    from opds_reader.search_index import SearchIndex
+    
+    results = {}
+    
+    def run(name, function, repeat=1, count=None):
+        seconds, result = measure(function, repeat)
+        results[name] = seconds
+        report(name, seconds, count)
+        return result
+    
+    catalogUrl = server.url.replace('/opds', '') + CATALOGS['Newest']
+    
+    def loadCatalog(maxConcurrency, cache=None):
+        books = []
+        for page in PageFetcher(maxConcurrency, cache=cache).pages(catalogUrl):
+            books.extend(entriesFromOpds(page.entries()))
+        assert len(books) == total, len(books)
+        return books
+    
+    run('root catalog', lambda: loadRootCatalog(server.url), repeat=3)
+    run('catalog, 1 connection', lambda: loadCatalog(1), repeat=3, count=total)
+    books = run('catalog, 8 connections', lambda: loadCatalog(8), repeat=3, count=total)
+    
+    cacheDirectory = tempfile.mkdtemp()
+    try:
+        cache = FeedCache(os.path.join(cacheDirectory, 'cache.sqlite'))
+        run('catalog, 8 connections, cache filled', lambda: loadCatalog(8, cache), count=total)
+        run('catalog, 8 connections, not modified', lambda: loadCatalog(8, cache), repeat=3, count=total)
+        cache.close()
+    finally:
+        shutil.rmtree(cacheDirectory, ignore_errors=True)
+    
+    model = OpdsBooksModel(None, [], SyntheticLibrary(books))
+    
+    def appendPages():
+        model.clearBooks()
+        for i in range(0, total, server.pageSize):
+            model.appendBooks(books[i:i + server.pageSize])
+    
+    run('model, append the pages', appendPages, repeat=3, count=total)
+    
+    def filterBooks():
+        model.filterBooksThatAreNewspapers = model.filterBooksThatAreAlreadyInLibrary = True
+        model.filterBooks()
+        model.filterBooksThatAreNewspapers = model.filterBooksThatAreAlreadyInLibrary = False
+        model.filterBooks()
+    
+    run('model, filterBooks', filterBooks, repeat=3, count=total)
+    run('model, sort by title', lambda: model.sort(0, Qt.AscendingOrder) or model.sort(-1), repeat=3, count=total)
+    run('toMetadata', lambda: [book.toMetadata() for book in books], count=total)
+    
+    def buildSearchIndex():
+        index = SearchIndex()
+        index.addBooks(books)
+        return index
+    
+    searchIndex = run('search, index', buildSearchIndex, repeat=3, count=total)
+    run('search, query', lambda: [searchIndex.search(q) for q in ('author 7', 'title:volume tag:fiction')], repeat=5)
+    run('calibre REST timestamps', lambda: sum(map(len, downloadCalibreTimestamps(books, 4))), repeat=3, count=total)
+    return results
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description='End-to-end benchmarks against the synthetic server')
+    parser.add_argument('--books', type=int, default=20000)
+    parser.add_argument('--page', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.005, help='delay of each response, in seconds')
+    parser.add_argument('--save', action='store_true', help='append the results to ' + RESULTS_FILE)
+    parser.add_argument('--compare', action='store_true', help='compare with the last saved results')
+    args = parser.parse_args(args)
+    
+    app = QApplication.instance() or QApplication([])  # noqa: F841
+    importPlugin()
+    print('{} books, pages of {}, latency {:.0f} ms'.format(args.books, args.page, args.latency * 1000))
+    with SyntheticServer(args.books, args.page, args.latency) as server:
+        results = runBenchmarks(server, args.books)
+    
+    parameters = {'books': args.books, 'page': args.page, 'latency': args.latency}
+    runs = loadResults()
+    if args.compare and runs:
+        compareResults(runs[-1], parameters, results)
+    if args.save:
+        runs.append({
+            'label': gitLabel(),
+            'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'parameters': parameters,
+            'results': results,
+        })
+        saveResults(runs)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
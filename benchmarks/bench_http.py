@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+# Load time of a catalog of the synthetic server (benchmarks/server.py) with a new connection
+# for each request (urlopen, the previous implementation) and with the pooled HTTP client:
+#   calibre-debug -e benchmarks/bench_http.py -- [--books 10000] [--latency 0.005] [--connect-latency 0.03]
+#
+# --connect-latency delays each new connection, like the TCP and TLS handshakes with a remote server.
+
+import argparse
+import os
+import sys
+from urllib.request import Request, urlopen
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import importPlugin, measure, report
+from server import CATALOGS, SyntheticServer
+
+
+def urlopenUrl(url, timeout=60, headers=None):
+    '''The previous implementation of fetcher.openUrl'''
+    from opds_reader.fetcher import USER_AGENT
+    
+    requestHeaders = {'User-Agent': USER_AGENT, 'Accept': 'application/atom+xml,application/xml,*/*'}
+    requestHeaders.update(headers or {})
+    return urlopen(Request(url, headers=requestHeaders), timeout=timeout)
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description='Catalog load time with and without the pooled HTTP client')
+    parser.add_argument('--books', type=int, default=10000)
+    parser.add_argument('--page', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.005, help='delay of each response, in seconds')
+    parser.add_argument('--connect-latency', type=float, default=0.03, help='delay of each new connection')
+    args = parser.parse_args(args)
+    
+    importPlugin()
+    from opds_reader import fetcher
+    from opds_reader.catalog_entry import entriesFromOpds
+    from opds_reader.http_client import HttpClient
+    
+    pooledOpenUrl = fetcher.openUrl
+    print('{} books, pages of {}, latency {:.0f} ms, connection {:.0f} ms'.format(
+        args.books, args.page, args.latency * 1000, args.connect_latency * 1000,
+    ))
+    for compress in (False, True):
+        with SyntheticServer(args.books, args.page, args.latency, compress=compress,
+                             connectLatency=args.connect_latency) as server:
+            catalogUrl = server.url.replace('/opds', '') + CATALOGS['Newest']
+            
+            def loadCatalog(maxConcurrency):
+                books = []
+                for page in fetcher.PageFetcher(maxConcurrency).pages(catalogUrl):
+                    books.extend(entriesFromOpds(page.entries()))
+                assert len(books) == args.books, len(books)
+                return books
+            
+            for name, openUrl in (('urlopen', urlopenUrl), ('pooled client', pooledOpenUrl)):
+                if openUrl is urlopenUrl and compress:
+                    # urlopen doesn't ask for compression
+                    continue
+                fetcher.openUrl = openUrl
+                for maxConcurrency in (1, 8):
+                    fetcher.httpClient = HttpClient()
+                    server.connections = 0
+                    seconds = measure(lambda: loadCatalog(maxConcurrency), 3)[0]
+                    label = '{}{}, {} connections'.format(name, ', gzip' if compress else '', maxConcurrency)
+                    report(label, seconds, args.books)
+                    print('{:<40s} {:10d} connections opened'.format('', server.connections))
+    fetcher.openUrl = pooledOpenUrl
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+# Memory used per catalog entry: calibre Metadata (the previous records) against CatalogEntry
+#   calibre-debug -e benchmarks/bench_memory.py [entries]
+
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import importPlugin
+from synthetic import acquisitionFeed
+
+
+def measureMemory(function, entries):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    records = function(entries)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / len(records)
+
+
+def main(args):
+    importPlugin()
+    from opds_reader.catalog_entry import entryFromOpds
+    from opds_reader.opds_parser import parseFeed
+    from opds_reader.timestamps import parse_timestamp
+    
+    from calibre.ebooks.metadata.book.base import Metadata
+    
+    def metadataFromOpds(entry):
+        # The records used before CatalogEntry
+        entryRecord = entryFromOpds(entry)
+        metadata = Metadata(entry['title'], list(entryRecord.authors))
+        metadata.uuid = entryRecord.uuid
+        metadata.timestamp = parse_timestamp(entry['updated'])
+        metadata.tags = list(entryRecord.tags)
+        metadata.links = list(entryRecord.links)
+        return metadata
+    
+    total = int(args[0]) if args else 20000
+    entries = parseFeed(acquisitionFeed(0, total, total), 'http://localhost:8080/opds')[1]
+    print('{} entries'.format(total))
+    perEntry = measureMemory(lambda entries: [metadataFromOpds(e) for e in entries], entries)
+    print('  Metadata      {:8.0f} bytes/entry'.format(perEntry))
+    perEntry = measureMemory(lambda entries: [entryFromOpds(e) for e in entries], entries)
+    print('  CatalogEntry  {:8.0f} bytes/entry'.format(perEntry))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+# Compare the streaming OPDS parser with feedparser on large synthetic feeds
+#   calibre-debug -e benchmarks/bench_parser.py [entries ...]
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import importPlugin, measure, report
+from synthetic import acquisitionFeed
+
+
+def main(args):
+    importPlugin()
+    from opds_reader.opds_parser import OpdsFeedParser, entryFromFeedparser, parseFeed
+    
+    from calibre.web.feeds import feedparser
+    
+    baseUrl = 'http://localhost:8080/opds/navcatalog/4f6e6577657374'
+    for total in map(int, args or ['50', '1000', '10000']):
+        content = acquisitionFeed(0, total, total)
+        print('{} entries, {:.1f} KiB'.format(total, len(content) / 1024))
+        
+        def parseWithFeedparser():
+            feed = feedparser.parse(content, response_headers={'content-location': baseUrl})
+            return [entryFromFeedparser(e) for e in feed.entries]
+        
+        def parseStreaming():
+            return parseFeed(content, baseUrl)[1]
+        
+        def parseStreamingChunks():
+            parser = OpdsFeedParser(baseUrl)
+            entries = []
+            for i in range(0, len(content), 64 * 1024):
+                entries.extend(parser.feedData(content[i:i + 64 * 1024]))
+            entries.extend(parser.close())
+            return entries
+        
+        seconds, reference = measure(parseWithFeedparser, repeat=3)
+        report('  feedparser', seconds, total)
+        seconds, entries = measure(parseStreaming)
+        report('  OpdsFeedParser', seconds, total)
+        seconds, chunkedEntries = measure(parseStreamingChunks)
+        report('  OpdsFeedParser, 64 KiB chunks', seconds, total)
+        
+        assert len(entries) == len(reference) == len(chunkedEntries) == total
+        for entry, referenceEntry in zip(entries, reference):
+            assert entry['id'] == referenceEntry['id']
+            assert entry['title'] == referenceEntry['title']
+            assert [link['href'] for link in entry['links']] == [link['href'] for link in referenceEntry['links']]
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+# Search in the book list: the scan of all the rows (as QSortFilterProxyModel) against the SearchIndex
+#   calibre-debug -e benchmarks/bench_search.py [entries]
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import importPlugin, measure, report
+from synthetic import acquisitionFeed
+
+QUERIES = ('author 7', 'book 1234', 'tag:fiction', 'author:author title:book')
+
+
+def main(args):
+    importPlugin()
+    from opds_reader.catalog_entry import entryFromOpds
+    from opds_reader.opds_parser import parseFeed
+    from opds_reader.search_index import SearchIndex
+    
+    total = int(args[0]) if args else 20000
+    books = [entryFromOpds(e) for e in parseFeed(acquisitionFeed(0, total, total), 'http://localhost:8080/opds')[1]]
+    print('{} entries'.format(total))
+    
+    def scanRows(query):
+        # What the proxy model did: the display text of each column of each row
+        query = query.lower()
+        return [b for b in books
+                if any(query in text.lower() for text in (b.title, ' & '.join(b.authors), b.formatTimestamp()))]
+    
+    def buildIndex():
+        index = SearchIndex()
+        index.addBooks(books)
+        return index
+    
+    seconds, index = measure(buildIndex, repeat=3)
+    report('SearchIndex build', seconds, total)
+    for query in QUERIES:
+        seconds, matches = measure(lambda: scanRows(query))
+        report('scan     ' + query, seconds, len(matches))
+        seconds, matches = measure(lambda: index.search(query))
+        report('index    ' + query, seconds, len(matches))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+# Sort of the book list: QSortFilterProxyModel (the strings of data()) against OpdsBooksModel.sort()
+#   calibre-debug -e benchmarks/bench_sort.py [entries]
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import importPlugin, measure, report
+from synthetic import acquisitionFeed
+
+try:
+    from qt.core import QApplication, QSortFilterProxyModel, Qt
+except ImportError:
+    from PyQt5.Qt import QApplication, QSortFilterProxyModel, Qt
+
+
+def main(args):
+    app = QApplication.instance() or QApplication([])  # noqa: F841
+    importPlugin()
+    from opds_reader.action import OpdsBooksModel
+    from opds_reader.catalog_entry import entryFromOpds
+    from opds_reader.opds_parser import parseFeed
+    
+    total = int(args[0]) if args else 50000
+    books = [entryFromOpds(e) for e in parseFeed(acquisitionFeed(0, total, total), 'http://localhost:8080/opds')[1]]
+    print('{} entries'.format(total))
+    
+    for column, name in enumerate(OpdsBooksModel.column_headers):
+        model = OpdsBooksModel(None)
+        model.appendBooks(books)
+        proxy = QSortFilterProxyModel()
+        proxy.setSourceModel(model)
+        
+        def proxySort():
+            proxy.sort(-1)
+            proxy.sort(column, Qt.AscendingOrder)
+        
+        seconds = measure(proxySort, repeat=1)[0]
+        report('proxy sort  ' + name, seconds, total)
+        model.sort(column)
+        model.sort(-1)
+        seconds = measure(lambda: model.sort(column, Qt.AscendingOrder) or model.sort(-1), repeat=3)[0]
+        report('model sort  ' + name, seconds, total)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
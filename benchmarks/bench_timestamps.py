@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+# Parse of the timestamps: the previous regex and strptime against the RFC 3339 parser
+#   calibre-debug -e benchmarks/bench_timestamps.py [timestamps]
+
+import datetime
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import importPlugin, measure, report
+from synthetic import bookTimestamp
+
+
+def previousParseTimestamp(rawTimestamp):
+    # The UTC offset is dropped, not applied
+    parsableTimestamp = re.sub(r'((\.\d+)?(\+|-)0\d:00|Z)$', '', rawTimestamp)
+    return datetime.datetime.strptime(parsableTimestamp, '%Y-%m-%dT%H:%M:%S')
+
+
+def distinctTimestamp(i) -> str:
+    timestamp = datetime.datetime(2010, 1, 1) + datetime.timedelta(seconds=i * 997)
+    return timestamp.strftime('%Y-%m-%dT%H:%M:%S') + ('+00:00', '+02:00', '-05:00', 'Z')[i % 4]
+
+
+def main(args):
+    importPlugin()
+    from opds_reader.timestamps import parseTimestampsToEpoch, parseTimestampToEpoch
+    
+    total = int(args[0]) if args else 100000
+    cases = {
+        # All different, as the calibre REST API
+        'distinct': [distinctTimestamp(i) for i in range(total)],
+        # The same for all the entries, as the "updated" of a calibre feed
+        'repeated': [bookTimestamp(0)] * total,
+    }
+    print('{} timestamps'.format(total))
+    for name, timestamps in cases.items():
+        seconds = measure(lambda: [previousParseTimestamp(t) for t in timestamps], repeat=3)[0]
+        report('regex + strptime  ' + name, seconds, total)
+        
+        def parse():
+            parseTimestampToEpoch.cache_clear()
+            return parseTimestampsToEpoch(timestamps)
+        
+        seconds = measure(parse, repeat=3)[0]
+        report('parseTimestamps   ' + name, seconds, total)
+    
+    # The offset is applied
+    assert parseTimestampToEpoch('2015-10-21T09:28:00+02:00') == parseTimestampToEpoch('2015-10-21T07:28:00Z')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+# Helpers shared by the benchmarks. The benchmarks import the plugin from the source tree
+# and must be run with the calibre environment, by example:
+#   calibre-debug -e benchmarks/bench_parser.py
+
+import gc
+import importlib.util
+import os
+import sys
+import time
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLUGIN_PACKAGE = 'opds_reader'
+
+
+def importPlugin():
+    '''Import the plugin directory as the package "opds_reader"'''
+    if PLUGIN_PACKAGE not in sys.modules:
+        spec = importlib.util.spec_from_file_location(
+            PLUGIN_PACKAGE,
+            os.path.join(PLUGIN_DIR, '__init__.py'),
+            submodule_search_locations=[PLUGIN_DIR],
+        )
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[PLUGIN_PACKAGE] = module
+        spec.loader.exec_module(module)
+    return sys.modules[PLUGIN_PACKAGE]
+
+
+def measure(function, repeat=5):
+    '''Run the function "repeat" times, return the best time in seconds and the last result'''
+    best = None
+    result = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def report(name, seconds, count=None):
+    line = '{:<40s} {:10.2f} ms'.format(name, seconds * 1000)
+    if count:
+        line += ' {:10.2f} µs/item'.format(seconds * 1e6 / count)
+    print(line)
@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+# Local stand-in for a calibre content server, serving a synthetic catalog:
+#   python benchmarks/server.py [--books 100000] [--page 50] [--latency 0.05] [--port 8080] [--no-gzip]
+# then use http://localhost:8080/opds as OPDS URL in the plugin.
+#
+# Endpoints:
+#   /opds                             root catalog, with the links to the catalogs
+#   /opds/navcatalog/<name>?offset=   paginated acquisition feeds
+#   /opds/navcatalog/<authors>        navigation feeds: letters, then the authors of each letter
+#   /opds/category/authors/<name>     the books of an author, the co-authored books are in several feeds
+#   /opds/search, /opds/search/<terms> OpenSearch description and results
+#   /ajax/search?num=&offset=         ids of the books
+#   /ajax/books[/<library>]?ids=      metadata of the books (uuid, timestamp)
+#   /get/<format>/<id>[/<library>]    small book files
+
+import argparse
+import base64
+import gzip
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+from synthetic import FEED_HEADER, acquisitionFeed, bookEntry, bookFeed, bookTimestamp, bookUuid, navigationFeed
+
+CATALOGS = {
+    'Newest': '/opds/navcatalog/4f6e6577657374',
+    'Title': '/opds/navcatalog/4f7469746c65',
+    'Authors': '/opds/navcatalog/4f617574686f7273',
+}
+AUTHORS_PATH = '/opds/category/authors/'
+
+
+SEARCH_DESCRIPTION = b'''<?xml version="1.0" encoding="utf-8"?>
+<OpenSearchDescription xmlns="http://a9.com/-/spec/opensearch/1.1/">
+  <ShortName>calibre</ShortName>
+  <Url type="application/atom+xml" template="/opds/search/{searchTerms}"/>
+</OpenSearchDescription>
+'''
+
+
+def rootFeed() -> bytes:
+    parts = [FEED_HEADER.format(id='calibre:catalog', title='calibre Library')]
+    parts.append('  <link rel="search" type="application/opensearchdescription+xml" href="/opds/search"/>\n')
+    for title, path in CATALOGS.items():
+        parts.append(
+            '  <entry><title>{title}</title><id>{path}</id><updated>2024-01-01T00:00:00+00:00</updated>'
+            '<link type="application/atom+xml;profile=opds-catalog;kind=acquisition" href="{path}"/></entry>\n'
+            .format(title=title, path=path),
+        )
+    parts.append('</feed>\n')
+    return ''.join(parts).encode('utf-8')
+
+
+class SyntheticServer:
+    '''
+    Serve a synthetic catalog of "total" books by pages of "pageSize" books,
+    each request is answered after "latency" seconds, and each new connection after "connectLatency"
+    seconds (the TCP and TLS handshakes with a remote server).
+    Like calibre, the feeds and the JSON are compressed by gzip when the client accepts it.
+    With nextLinkLast, the link to the next page of the acquisition feeds follows the entries.
+    With credentials ("user:password"), the requests without their Basic authorization are refused.
+    '''
+    
+    def __init__(self, total=10000, pageSize=50, latency=0.0, port=0, compress=True, connectLatency=0.0,
+                 nextLinkLast=False, credentials=None):
+        self.total = total
+        self.pageSize = pageSize
+        self.nextLinkLast = nextLinkLast
+        self.latency = latency
+        self.compress = compress
+        self.connectLatency = connectLatency
+        self.authorization = None
+        if credentials is not None:
+            self.authorization = 'Basic ' + base64.b64encode(credentials.encode('utf-8')).decode('ascii')
+        self.requests = 0
+        self.connections = 0
+        self._authors = {}
+        self._authorsTotal = None
+        self.httpServer = ThreadingHTTPServer(('127.0.0.1', port), self.makeHandler())
+        self.httpServer.daemon_threads = True
+        self.thread = None
+    
+    @property
+    def url(self) -> str:
+        return 'http://127.0.0.1:{}/opds'.format(self.httpServer.server_port)
+    
+    def start(self):
+        self.thread = threading.Thread(target=self.httpServer.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+    
+    def stop(self):
+        self.httpServer.shutdown()
+        self.httpServer.server_close()
+    
+    def __enter__(self):
+        return self.start()
+    
+    def __exit__(self, *args):
+        self.stop()
+    
+    def makeHandler(self):
+        server = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # The headers and the body are written separately: without this, the kept-alive connections
+            # wait for the delayed ACK of the client
+            disable_nagle_algorithm = True
+            
+            def log_message(self, *args):
+                pass
+            
+            def setup(self):
+                BaseHTTPRequestHandler.setup(self)
+                server.connections += 1
+                if server.connectLatency:
+                    time.sleep(server.connectLatency)
+            
+            def do_GET(self):
+                server.requests += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                url = urlparse(self.path)
+                query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                try:
+                    if server.authorization and self.headers.get('Authorization') != server.authorization:
+                        status, contentType, body = 401, 'text/plain', b'Unauthorized'
+                    else:
+                        status, contentType, body = server.respond(url.path, query)
+                except ValueError:
+                    status, contentType, body = 400, 'text/plain', b'Bad request'
+                self.send(status, contentType, body)
+            
+            def send(self, status, contentType, body):
+                etag = '"{}"'.format(hashlib.md5(body).hexdigest())
+                if status == 200 and self.headers.get('If-None-Match') == etag:
+                    status, body = 304, b''
+                self.send_response(status)
+                self.send_header('Server', 'calibre 7.0.0 (synthetic)')
+                self.send_header('Content-Type', contentType)
+                if (server.compress and status == 200 and contentType != 'application/octet-stream'
+                        and 'gzip' in self.headers.get('Accept-Encoding', '')):
+                    body = gzip.compress(body, 6)
+                    self.send_header('Content-Encoding', 'gzip')
+                self.send_header('Content-Length', str(len(body)))
+                if status in (200, 304):
+                    self.send_header('ETag', etag)
+                self.end_headers()
+                self.wfile.write(body)
+        
+        return Handler
+    
+    def respond(self, path, query):
+        if path == '/opds':
+            return 200, 'application/atom+xml', rootFeed()
+        if path == CATALOGS['Authors']:
+            letters = [(letter, path + '/' + letter) for letter in sorted({name[0] for name in self.authors()})]
+            return 200, 'application/atom+xml', navigationFeed(0, len(letters), letters, path, 'navigation')
+        if path.startswith(CATALOGS['Authors'] + '/'):
+            letter = unquote(path.rsplit('/', 1)[1])
+            authors = [(name, AUTHORS_PATH + name.replace(' ', '_')) for name in self.authors() if name[0] == letter]
+            offset = int(query.get('offset', 0))
+            return 200, 'application/atom+xml', navigationFeed(offset, self.pageSize, authors, path)
+        if path.startswith(AUTHORS_PATH):
+            bookIds = self.authors().get(unquote(path[len(AUTHORS_PATH):]).replace('_', ' '), [])
+            return 200, 'application/atom+xml', bookFeed(int(query.get('offset', 0)), self.pageSize, bookIds, path)
+        if path in CATALOGS.values():
+            offset = int(query.get('offset', 0))
+            return 200, 'application/atom+xml', acquisitionFeed(offset, self.pageSize, self.total, path,
+                                                                self.nextLinkLast)
+        if path == '/opds/search':
+            return 200, 'application/opensearchdescription+xml', SEARCH_DESCRIPTION
+        if path.startswith('/opds/search/'):
+            return 200, 'application/atom+xml', self.searchFeed(unquote(path[len('/opds/search/'):]))
+        if path == '/ajax/search':
+            num, offset = int(query.get('num', 50)), int(query.get('offset', 0))
+            bookIds = list(range(self.total, 0, -1))[offset:offset + num]
+            return 200, 'application/json', json.dumps({'total_num': self.total, 'book_ids': bookIds}).encode()
+        if path == '/ajax/books' or path.startswith('/ajax/books/'):
+            books = {}
+            for bookId in query.get('ids', '').split(','):
+                if not bookId.isdigit():
+                    continue
+                if 1 <= int(bookId) <= self.total:
+                    books[bookId] = {'uuid': bookUuid(int(bookId)), 'timestamp': bookTimestamp(int(bookId))}
+                else:
+                    books[bookId] = None
+            return 200, 'application/json', json.dumps(books).encode()
+        if path.startswith('/get/'):
+            return 200, 'application/octet-stream', b'PK' + b'\0' * 4096
+        return 404, 'text/plain', b'Not found'
+    
+    def authors(self):
+        '''The ids of the books of each author, with the same authors as the books of synthetic.bookEntry'''
+        if self._authorsTotal != self.total:
+            self._authors = {}
+            for bookId in range(self.total, 0, -1):
+                self._authors.setdefault('Author {}'.format(bookId % 997), []).append(bookId)
+                if bookId % 5 == 0:
+                    self._authors.setdefault('Co Author {}'.format(bookId % 13), []).append(bookId)
+            self._authorsTotal = self.total
+        return self._authors
+    
+    def searchFeed(self, terms) -> bytes:
+        # The books whose id is one of the numbers of the terms
+        bookIds = [int(t) for t in terms.split() if t.isdigit() and 1 <= int(t) <= self.total]
+        parts = [FEED_HEADER.format(id='calibre-search', title='Search')]
+        parts.extend(bookEntry(bookId) for bookId in bookIds)
+        parts.append('</feed>\n')
+        return ''.join(parts).encode('utf-8')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Synthetic calibre content server')
+    parser.add_argument('--books', type=int, default=100000)
+    parser.add_argument('--page', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.0, help='delay of each response, in seconds')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--no-gzip', action='store_true', help='never compress the responses')
+    args = parser.parse_args()
+    server = SyntheticServer(args.books, args.page, args.latency, args.port, not args.no_gzip)
+    print('Serving {} books on {}'.format(args.books, server.url))
+    try:
+        server.httpServer.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
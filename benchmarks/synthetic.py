@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+# Generate synthetic OPDS feeds, in the format of the calibre content server
+
+import datetime
+import uuid
+from xml.sax.saxutils import escape, quoteattr
+
+FEED_HEADER = '''<?xml version="1.0" encoding="utf-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom" xmlns:dc="http://purl.org/dc/terms/"
+    xmlns:opds="http://opds-spec.org/2010/catalog" xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/">
+  <id>{id}</id>
+  <title>{title}</title>
+  <author><name>calibre</name><uri>https://calibre-ebook.com</uri></author>
+  <updated>2024-01-01T00:00:00+00:00</updated>
+'''
+
+FIRST_TIMESTAMP = datetime.datetime(2010, 1, 1)
+
+ENTRY = '''  <entry>
+    <title>{title}</title>
+    <author><name>{authors}</name></author>
+    <id>urn:uuid:{uuid}</id>
+    <updated>{updated}</updated>
+    <dc:date>{updated}</dc:date>
+    <link type="application/epub+zip" href="/get/epub/{book_id}/library" rel="http://opds-spec.org/acquisition"/>
+    <link type="application/x-mobipocket-ebook" href="/get/mobi/{book_id}/library"
+        rel="http://opds-spec.org/acquisition"/>
+    <link type="image/jpeg" href="/get/cover/{book_id}/library" rel="http://opds-spec.org/cover"/>
+    <link type="image/jpeg" href="/get/thumb/{book_id}/library" rel="http://opds-spec.org/thumbnail"/>
+    <content type="xhtml"><div xmlns="http://www.w3.org/1999/xhtml">RATING: ★★★<br/>
+TAGS: {tags}<br/>
+SERIES: Series {series} [1]<br/>
+<p>A short comment about the book {book_id}.</p></div></content>
+  </entry>
+'''
+
+
+def bookUuid(bookId) -> str:
+    return str(uuid.UUID(int=bookId))
+
+
+def bookTimestamp(bookId) -> str:
+    # Increase with the book id, like the date added of the books of the "Newest" catalog
+    timestamp = FIRST_TIMESTAMP + datetime.timedelta(seconds=bookId * 3571)
+    return timestamp.strftime('%Y-%m-%dT%H:%M:%S+00:00')
+
+
+def bookEntry(bookId) -> str:
+    authors = 'Author {}'.format(bookId % 997)
+    if bookId % 5 == 0:
+        authors += ' & Co Author {}'.format(bookId % 13)
+    tags = ['News'] if bookId % 20 == 0 else ['Fiction', 'Tag {}'.format(bookId % 50)]
+    return ENTRY.format(
+        title=escape('Book title {} – volume {}'.format(bookId, bookId % 7)),
+        authors=escape(authors),
+        uuid=bookUuid(bookId),
+        updated=bookTimestamp(bookId),
+        book_id=bookId,
+        tags=escape(', '.join(tags)),
+        series=bookId % 100,
+    )
+
+
+def acquisitionFeed(offset, pageSize, total, path='/opds/navcatalog/4f6e6577657374', nextLinkLast=False) -> bytes:
+    '''
+    A page of a calibre like acquisition feed of "total" books, starting at "offset".
+    With nextLinkLast, the link to the next page follows the entries, as some servers do.
+    '''
+    parts = [FEED_HEADER.format(id='calibre-all:timestamp', title='Newest')]
+    parts.append('  <opensearch:totalResults>{}</opensearch:totalResults>\n'.format(total))
+    parts.append('  <opensearch:itemsPerPage>{}</opensearch:itemsPerPage>\n'.format(pageSize))
+    parts.append('  <link rel="search" type="application/opensearchdescription+xml" href="/opds/search"/>\n')
+    nextLink = ''
+    if offset + pageSize < total:
+        nextHref = '{}?offset={}'.format(path, offset + pageSize)
+        nextLink = ('  <link rel="next" type="application/atom+xml;profile=opds-catalog;kind=acquisition" href={}/>\n'
+                    .format(quoteattr(nextHref)))
+    if not nextLinkLast:
+        parts.append(nextLink)
+    for index in range(offset, min(total, offset + pageSize)):
+        # calibre book ids start at 1
+        parts.append(bookEntry(total - index))
+    if nextLinkLast:
+        parts.append(nextLink)
+    parts.append('</feed>\n')
+    return ''.join(parts).encode('utf-8')
+
+
+NAVIGATION_ENTRY = '''  <entry>
+    <title>{title}</title>
+    <id>{href}</id>
+    <updated>2024-01-01T00:00:00+00:00</updated>
+    <link type="application/atom+xml;profile=opds-catalog;kind={kind}" href={quotedHref} rel="subsection"/>
+  </entry>
+'''
+
+
+def navigationFeed(offset, pageSize, items, path, kind='acquisition') -> bytes:
+    '''A page of a navigation feed, linking to the catalogs "items": a list of tuples (title, href)'''
+    parts = [FEED_HEADER.format(id=escape(path), title='Navigation')]
+    if offset + pageSize < len(items):
+        nextHref = '{}?offset={}'.format(path, offset + pageSize)
+        parts.append('  <link rel="next" type="application/atom+xml;profile=opds-catalog;kind=navigation" href={}/>\n'
+                     .format(quoteattr(nextHref)))
+    for title, href in items[offset:offset + pageSize]:
+        parts.append(NAVIGATION_ENTRY.format(title=escape(title), href=escape(href), quotedHref=quoteattr(href),
+                                             kind=kind))
+    parts.append('</feed>\n')
+    return ''.join(parts).encode('utf-8')
+
+
+def bookFeed(offset, pageSize, bookIds, path) -> bytes:
+    '''A page of a acquisition feed of the books "bookIds"'''
+    parts = [FEED_HEADER.format(id=escape(path), title='Books')]
+    if offset + pageSize < len(bookIds):
+        nextHref = '{}?offset={}'.format(path, offset + pageSize)
+        parts.append('  <link rel="next" type="application/atom+xml;profile=opds-catalog;kind=acquisition" href={}/>\n'
+                     .format(quoteattr(nextHref)))
+    parts.extend(bookEntry(bookId) for bookId in bookIds[offset:offset + pageSize])
+    parts.append('</feed>\n')
+    return ''.join(parts).encode('utf-8')
@@ -0,0 +1,355 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+import os
+import sqlite3
+import tempfile
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from .catalog_entry import CatalogEntry
+from .search_index import FIELDS, SearchIndex, parseQuery, tokenize
+from .thumbnails import LruCache
+
+# Rows of the SQLite store kept as CatalogEntry: the rows shown, and around
+HOT_ROWS = 2000
+# Rows read at once when all the books are iterated
+BATCH_SIZE = 1000
+# Below the limit of the parameters of a SQLite query
+MAX_PARAMETERS = 500
+# Separator of the values of the tuples of a CatalogEntry, in a column
+SEPARATOR = '\x1f'
+# Last character of Unicode: the upper bound of the tokens that start with a prefix
+MAX_CHARACTER = '\U0010ffff'
+
+
+def displayTexts(book: CatalogEntry) -> Tuple[str, str, str]:
+    '''The texts shown for the authors, the timestamp and the sources'''
+    return ' & '.join(book.authors), book.formatTimestamp(), ', '.join(book.sources)
+
+
+def titleSort(book: CatalogEntry) -> str:
+    return book.title.casefold()
+
+
+def authorSort(authors) -> str:
+    from calibre.ebooks.metadata import author_to_author_sort
+    return ' & '.join(map(author_to_author_sort, authors)).casefold()
+
+
+class BookStore:
+    '''
+    The books of a catalog, in memory: the default store of the book list.
+    
+    The books are identified by their position in the store, in the order they are appended.
+    The store also holds the search index of the books, the texts shown for each book
+    and the sort keys, computed once by book.
+    '''
+    
+    def __init__(self):
+        self.books: List[CatalogEntry] = []
+        self.searchIndex = SearchIndex()
+        self._bookIds: Dict[int, int] = {}
+        self._texts: Dict[int, Tuple[str, str, str]] = {}
+        # By column: the sort key of each book, computed at the first sort on the column
+        self._sortKeys: Dict[int, List[str]] = {}
+    
+    def __len__(self) -> int:
+        return len(self.books)
+    
+    def __getitem__(self, bookId) -> CatalogEntry:
+        return self.books[bookId]
+    
+    def __iter__(self) -> Iterator[CatalogEntry]:
+        return iter(self.books)
+    
+    def append(self, books: List[CatalogEntry]):
+        firstBookId = len(self.books)
+        self.books.extend(books)
+        self._bookIds.update((id(book), bookId) for bookId, book in enumerate(books, firstBookId))
+        self.searchIndex.addBooks(books)
+    
+    def clear(self):
+        self.books = []
+        self.searchIndex.clear()
+        self._bookIds.clear()
+        self._texts.clear()
+        self._sortKeys.clear()
+    
+    def close(self):
+        self.clear()
+    
+    def bookIds(self, books: Iterable[CatalogEntry]) -> List[int]:
+        '''The ids of the books of the store'''
+        bookIds = self._bookIds
+        return [bookIds[id(book)] for book in books if id(book) in bookIds]
+    
+    def updateBooks(self, books: Iterable[CatalogEntry]):
+        '''Save the timestamps, the links and the sources of the books changed since they were appended'''
+        for bookId in self.bookIds(books):
+            self._texts.pop(bookId, None)
+    
+    def displayTexts(self, bookId) -> Tuple[str, str, str]:
+        texts = self._texts.get(bookId)
+        if texts is None:
+            texts = self._texts[bookId] = displayTexts(self.books[bookId])
+        return texts
+    
+    def search(self, query) -> Optional[Set[int]]:
+        '''The ids of the books matching the query, None for a empty query (see SearchIndex)'''
+        return self.searchIndex.search(query)
+    
+    def sortedIds(self, bookIds: Iterable[int], column, reverse=False) -> array:
+        '''Sort the ids of books by a column of the book list, by their order in the catalog for a column < 0'''
+        key = self._sortKey(column)
+        if key is None:
+            return array('I', sorted(bookIds))
+        return array('I', sorted(bookIds, key=key, reverse=reverse))
+    
+    def sortKeys(self, bookIds: Iterable[int], column) -> Dict[int, object]:
+        '''The keys of the books for the sort by a column (0 to 3), in the same order as sortedIds'''
+        key = self._sortKey(column)
+        return {bookId: key(bookId) for bookId in bookIds}
+    
+    def _sortKey(self, column):
+        books = self.books
+        if column == 0 or column == 1:
+            keys = self._sortKeys.setdefault(column, [])
+            for book in books[len(keys):]:
+                keys.append(titleSort(book) if column == 0 else authorSort(book.authors))
+            return keys.__getitem__
+        if column == 2:
+            return lambda bookId: books[bookId].timestamp
+        if column == 3:
+            return lambda bookId: books[bookId].sources
+        return None
+
+
+class SqliteBookStore(BookStore):
+    '''
+    The books of a catalog in a SQLite database, for the catalogs too large to be held in memory.
+    
+    The books are written to the database as they are appended, with the words of their title,
+    authors and tags for the search: only the last HOT_ROWS books read are kept as CatalogEntry.
+    The sort is done by the indexes of the database, created at the first sort on a column in each order.
+    The memory used doesn't depend on the size of the catalog: the book list only keeps the ids
+    of its rows. The database is a temporary file, deleted by close().
+    The books changed after they were appended are found by their key (see CatalogEntry.key).
+    '''
+    
+    COLUMNS = 'title, authors, uuid, timestamp, tags, links, identifiers, sources, thumbnail'
+    SORT_COLUMNS = {0: 'titleSort', 1: 'authorSort', 2: 'timestamp', 3: 'sources'}
+    
+    def __init__(self, path=None):
+        if path is None:
+            handle, path = tempfile.mkstemp('.sqlite', 'opds_reader_books_')
+            os.close(handle)
+        self.path = path
+        self._hot = LruCache(HOT_ROWS)
+        self._count = 0
+        self._db = sqlite3.connect(path, isolation_level=None)
+        # A temporary database: nothing to recover after a crash
+        self._db.execute('PRAGMA journal_mode=OFF')
+        self._db.execute('PRAGMA synchronous=OFF')
+        self._db.execute('PRAGMA cache_size=-8192')
+        self._db.create_function('authorSort', 1, lambda authors: authorSort(splitValues(authors)))
+        self._createTables()
+    
+    def _createTables(self):
+        self._db.execute('''CREATE TABLE books (
+            id INTEGER PRIMARY KEY,
+            key TEXT NOT NULL,
+            title TEXT NOT NULL,
+            authors TEXT NOT NULL,
+            uuid TEXT NOT NULL,
+            timestamp INTEGER NOT NULL,
+            tags TEXT NOT NULL,
+            links TEXT NOT NULL,
+            identifiers TEXT NOT NULL,
+            sources TEXT NOT NULL,
+            thumbnail TEXT NOT NULL,
+            titleSort TEXT NOT NULL,
+            authorSort TEXT
+        )''')
+        self._db.execute('CREATE INDEX books_key ON books (key)')
+        # The words of the books by field (the index in FIELDS), searched by prefix
+        self._db.execute('''CREATE TABLE tokens (
+            token TEXT NOT NULL,
+            field INTEGER NOT NULL,
+            book INTEGER NOT NULL,
+            PRIMARY KEY (token, field, book)
+        ) WITHOUT ROWID''')
+    
+    def __len__(self) -> int:
+        return self._count
+    
+    def __getitem__(self, bookId) -> CatalogEntry:
+        item = self._hot.get(bookId)
+        if item is None:
+            if not 0 <= bookId < self._count:
+                raise IndexError(bookId)
+            row = self._db.execute(f'SELECT {self.COLUMNS} FROM books WHERE id = ?', (bookId,)).fetchone()
+            item = [rowToEntry(row), None]
+            self._hot.put(bookId, item, 1)
+        return item[0]
+    
+    def __iter__(self) -> Iterator[CatalogEntry]:
+        # By batches, without filling the hot rows
+        for start in range(0, self._count, BATCH_SIZE):
+            rows = self._db.execute(
+                f'SELECT {self.COLUMNS} FROM books WHERE id >= ? AND id < ? ORDER BY id', (start, start + BATCH_SIZE),
+            ).fetchall()
+            yield from map(rowToEntry, rows)
+    
+    def append(self, books: List[CatalogEntry]):
+        firstBookId = self._count
+        tokens = set()
+        for bookId, book in enumerate(books, firstBookId):
+            tokens.update((token, 0, bookId) for token in tokenize(book.title))
+            for field, values in ((1, book.authors), (2, book.tags)):
+                for value in values:
+                    tokens.update((token, field, bookId) for token in tokenize(value))
+        self._db.execute('BEGIN')
+        try:
+            self._db.executemany(
+                f'INSERT INTO books (id, key, {self.COLUMNS}, titleSort) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                ((bookId, book.key()) + entryToRow(book) + (titleSort(book),)
+                 for bookId, book in enumerate(books, firstBookId)),
+            )
+            self._db.executemany('INSERT INTO tokens (token, field, book) VALUES (?, ?, ?)', tokens)
+            self._db.execute('COMMIT')
+        except BaseException:
+            self._db.execute('ROLLBACK')
+            raise
+        self._count += len(books)
+    
+    def clear(self):
+        self._db.execute('DROP TABLE IF EXISTS books')
+        self._db.execute('DROP TABLE IF EXISTS tokens')
+        self._db.execute('VACUUM')
+        self._createTables()
+        self._count = 0
+        self._hot.clear()
+    
+    def close(self):
+        self._hot.clear()
+        self._db.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+    
+    def bookIds(self, books: Iterable[CatalogEntry]) -> List[int]:
+        keys = list({book.key() for book in books} - {''})
+        bookIds = []
+        for i in range(0, len(keys), MAX_PARAMETERS):
+            chunk = keys[i:i + MAX_PARAMETERS]
+            bookIds.extend(row[0] for row in self._db.execute(
+                'SELECT id FROM books WHERE key IN ({})'.format(', '.join('?' * len(chunk))), chunk,
+            ))
+        return sorted(bookIds)
+    
+    def updateBooks(self, books: Iterable[CatalogEntry]):
+        self._db.execute('BEGIN')
+        try:
+            self._db.executemany(
+                'UPDATE books SET timestamp = ?, links = ?, sources = ? WHERE key = ?',
+                ((book.timestamp, joinValues(book.links), joinValues(book.sources), book.key())
+                 for book in books if book.key()),
+            )
+            self._db.execute('COMMIT')
+        except BaseException:
+            self._db.execute('ROLLBACK')
+            raise
+        self._hot.clear()
+    
+    def displayTexts(self, bookId) -> Tuple[str, str, str]:
+        book = self[bookId]
+        item = self._hot.get(bookId)
+        if item[1] is None:
+            item[1] = displayTexts(book)
+        return item[1]
+    
+    def search(self, query) -> Optional[Set[int]]:
+        terms = parseQuery(query)
+        if not terms:
+            return None
+        matches = None
+        # The longest tokens first, like SearchIndex: they are the most selective
+        for field, token in sorted(((f, t) for f, tokens in terms for t in tokens), key=lambda ft: -len(ft[1])):
+            sql = 'SELECT DISTINCT book FROM tokens WHERE token >= ? AND token < ?'
+            parameters = [token, token + MAX_CHARACTER]
+            if field:
+                sql += ' AND field = ?'
+                parameters.append(FIELDS.index(field))
+            books = {row[0] for row in self._db.execute(sql, parameters)}
+            matches = books if matches is None else matches & books
+            if not matches:
+                break
+        return matches
+    
+    def sortedIds(self, bookIds: Iterable[int], column, reverse=False) -> array:
+        sortColumn = self.SORT_COLUMNS.get(column)
+        if sortColumn is None:
+            return array('I', sorted(bookIds))
+        self._updateAuthorSort(sortColumn)
+        # Like the stable sort of BookStore, the books of the same key stay in the order of the catalog
+        # in both orders: the reverse order has its own index, created at the first reverse sort
+        order, index = ('DESC', f'books_{sortColumn}_reverse') if reverse else ('ASC', f'books_{sortColumn}')
+        self._db.execute(f'CREATE INDEX IF NOT EXISTS {index} ON books ({sortColumn} {order}, id)')
+        # The ids of all the books in order, without the books not in bookIds
+        selected = bytearray(self._count)
+        for bookId in bookIds:
+            selected[bookId] = 1
+        rows = self._db.execute(f'SELECT id FROM books ORDER BY {sortColumn} {order}, id ASC')
+        return array('I', (bookId for bookId, in rows if selected[bookId]))
+    
+    def sortKeys(self, bookIds: Iterable[int], column) -> Dict[int, object]:
+        sortColumn = self.SORT_COLUMNS[column]
+        self._updateAuthorSort(sortColumn)
+        bookIds = list(bookIds)
+        keys = {}
+        for i in range(0, len(bookIds), MAX_PARAMETERS):
+            chunk = bookIds[i:i + MAX_PARAMETERS]
+            sql = f'SELECT id, {sortColumn} FROM books WHERE id IN ({",".join("?" * len(chunk))})'
+            keys.update(self._db.execute(sql, chunk))
+        return keys
+    
+    def _updateAuthorSort(self, sortColumn):
+        if sortColumn == 'authorSort':
+            # Computed at the first sort on the authors, then for the books appended after
+            self._db.execute('UPDATE books SET authorSort = authorSort(authors) WHERE authorSort IS NULL')
+
+
+def joinValues(values: Tuple[str, ...]) -> str:
+    return SEPARATOR.join(values)
+
+
+def splitValues(text) -> Tuple[str, ...]:
+    return tuple(text.split(SEPARATOR)) if text else ()
+
+
+def entryToRow(book: CatalogEntry) -> Tuple:
+    return (
+        book.title, joinValues(book.authors), book.uuid, book.timestamp, joinValues(book.tags),
+        joinValues(book.links), joinValues(key + ':' + value for key, value in book.identifiers),
+        joinValues(book.sources), book.thumbnail,
+    )
+
+
+def rowToEntry(row: Tuple) -> CatalogEntry:
+    title, authors, uuid, timestamp, tags, links, identifiers, sources, thumbnail = row
+    return CatalogEntry(
+        title=title,
+        authors=splitValues(authors) or ('',),
+        uuid=uuid,
+        timestamp=timestamp,
+        tags=splitValues(tags),
+        links=splitValues(links),
+        identifiers=tuple(tuple(identifier.split(':', 1)) for identifier in splitValues(identifiers)),
+        sources=splitValues(sources),
+        thumbnail=thumbnail,
+    )
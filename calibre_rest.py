@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+import json
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlencode, urlparse
+
+from .catalog_entry import CatalogEntry
+from .fetcher import LoadCancelled, fetchUrl
+from .metrics import NO_METRICS
+from .timestamps import parseTimestampsToEpoch
+
+# Number of book ids by request to /ajax/books, to keep the URLs and the responses small
+BOOKS_BY_REQUEST = 200
+
+# calibre download links: <prefix>/get/<format>/<book id>[/<library id>]
+_downloadLink = re.compile(r'^(?P<prefix>.*?)/get/[^/]+/(?P<id>\d+)(?:/(?P<library>[^/?#]+))?')
+
+
+def calibreBookId(url) -> Optional[Tuple[str, int]]:
+    '''
+    Return a tuple (books URL, book id) from a download link of a calibre server,
+    where "books URL" is the /ajax/books URL of the library of the book
+    '''
+    parsedUrl = urlparse(url)
+    match = _downloadLink.match(parsedUrl.path)
+    if not match:
+        return None
+    booksUrl = f'{parsedUrl.scheme}://{parsedUrl.netloc}{match.group("prefix")}/ajax/books'
+    if match.group('library'):
+        booksUrl += '/' + match.group('library')
+    return booksUrl, int(match.group('id'))
+
+
+def _booksByCalibreId(books: List[CatalogEntry]) -> Dict[str, Dict[int, CatalogEntry]]:
+    booksByUrl = {}
+    for book in books:
+        for link in book.links:
+            bookId = calibreBookId(link)
+            if bookId:
+                booksUrl, calibreId = bookId
+                booksByUrl.setdefault(booksUrl, {})[calibreId] = book
+                break
+    return booksByUrl
+
+
+def _downloadTimestamps(booksUrl, books: Dict[int, CatalogEntry], metrics=NO_METRICS) -> List[Tuple[CatalogEntry, int]]:
+    metrics.count('REST requests')
+    with metrics.phase('REST request'):
+        content = fetchUrl(booksUrl + '?' + urlencode({'ids': ','.join(map(str, books))}))[0]
+    metrics.count('REST bytes', len(content))
+    with metrics.phase('REST parse'):
+        return _readTimestamps(content, books)
+
+
+def _readTimestamps(content, books: Dict[int, CatalogEntry]) -> List[Tuple[CatalogEntry, int]]:
+    foundBooks = []
+    rawTimestamps = []
+    for bookId, bookMetadata in json.loads(content).items():
+        # The books not found (deleted since the catalog was loaded) are null
+        book = books.get(int(bookId))
+        if book is None or not bookMetadata or not bookMetadata.get('timestamp'):
+            continue
+        if bookMetadata.get('uuid') and book.uuid and bookMetadata['uuid'] != book.uuid:
+            continue
+        foundBooks.append(book)
+        rawTimestamps.append(bookMetadata['timestamp'])
+    timestamps = parseTimestampsToEpoch(rawTimestamps)
+    return [(book, timestamp) for book, timestamp in zip(foundBooks, timestamps) if timestamp is not None]
+
+
+def downloadCalibreTimestamps(books: List[CatalogEntry], maxConcurrency=4,
+                              cancelEvent=None, metrics=None) -> Iterator[List[Tuple[CatalogEntry, int]]]:
+    '''
+    Download the timestamps of the given books from the REST API of a calibre server.
+    
+    The "updated" values on the book metadata, in the OPDS returned by calibre, are unrelated
+    to the books they are returned with: the "updated" value is the same value for all books metadata,
+    and this value is the last modified date of the entire calibre database.
+    
+    The calibre id of each book is read from its download links, and the metadata of the books
+    are requested by chunks of BOOKS_BY_REQUEST ids, in parallel.
+    Yield a list of tuples (book, timestamp) by chunk, in the order they are received.
+    The books not found on the server are skipped.
+    '''
+    cancelEvent = cancelEvent or threading.Event()
+    requests = []
+    for booksUrl, booksById in _booksByCalibreId(books).items():
+        bookIds = sorted(booksById)
+        for i in range(0, len(bookIds), BOOKS_BY_REQUEST):
+            requests.append((booksUrl, {bookId: booksById[bookId] for bookId in bookIds[i:i + BOOKS_BY_REQUEST]}))
+    if not requests:
+        return
+    
+    with ThreadPoolExecutor(max_workers=max(1, maxConcurrency)) as executor:
+        futures = [
+            executor.submit(_downloadTimestamps, booksUrl, chunk, metrics or NO_METRICS) for booksUrl, chunk in requests
+        ]
+        try:
+            for future in as_completed(futures):
+                if cancelEvent.is_set():
+                    raise LoadCancelled()
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+import re
+import time
+from sys import intern
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .timestamps import epochToDatetime, parseTimestampsToEpoch, parseTimestampToEpoch
+
+DEFAULT_TIMESTAMP = '1980-01-01T00:00:00+00:00'
+DEFAULT_EPOCH = parseTimestampToEpoch(DEFAULT_TIMESTAMP)
+
+THUMBNAIL_REL = 'http://opds-spec.org/image/thumbnail'
+IMAGE_REL = 'http://opds-spec.org/image'
+# The rels of the first drafts of OPDS, still used by calibre
+OLD_THUMBNAIL_REL = 'http://opds-spec.org/thumbnail'
+OLD_IMAGE_REL = 'http://opds-spec.org/cover'
+# The thumbnails first, then the covers
+IMAGE_RELS = (THUMBNAIL_REL, OLD_THUMBNAIL_REL, IMAGE_REL, OLD_IMAGE_REL)
+
+_urn = re.compile(r'urn:(\w+):(.+)$')
+
+
+class CatalogEntry:
+    '''
+    Compact record of a book of a catalog, with only the values displayed and filtered.
+    
+    The authors and tags strings are interned (they are shared by many books), the timestamp
+    is in seconds since the epoch. The calibre Metadata is only created by toMetadata(),
+    when the book is downloaded or matched against the library.
+    
+    "sources" are the servers of the book when a catalog is loaded from several servers.
+    "thumbnail" is the URL of the cover thumbnail, downloaded when the book is shown.
+    '''
+    
+    __slots__ = ('authors', 'identifiers', 'links', 'sources', 'tags', 'thumbnail', 'timestamp', 'title', 'uuid')
+    
+    def __init__(self, title: str, authors: Tuple[str, ...], uuid: str, timestamp: int,
+                 tags: Tuple[str, ...] = (), links: Tuple[str, ...] = (), identifiers: Tuple = (),
+                 sources: Tuple[str, ...] = (), thumbnail: str = ''):
+        self.title = title
+        self.authors = authors
+        self.uuid = uuid
+        self.timestamp = timestamp
+        self.tags = tags
+        self.links = links
+        self.identifiers = identifiers
+        self.sources = sources
+        self.thumbnail = thumbnail
+    
+    def __repr__(self) -> str:
+        return f'CatalogEntry({self.title!r}, {self.authors!r}, {self.uuid!r})'
+    
+    def key(self) -> str:
+        '''The same book on several servers has the same UUID, else the same download link'''
+        return self.uuid or next(iter(self.links), '')
+    
+    def merge(self, other: 'CatalogEntry'):
+        '''Add the links and the sources of the same book found on another server'''
+        self.links = self.links + tuple(link for link in other.links if link not in self.links)
+        self.sources = self.sources + tuple(source for source in other.sources if source not in self.sources)
+    
+    def get_identifiers(self) -> Dict[str, str]:
+        # Same name as Metadata, for the code that use both
+        return dict(self.identifiers)
+    
+    def getTimestamp(self):
+        return epochToDatetime(self.timestamp)
+    
+    def formatTimestamp(self) -> str:
+        return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(self.timestamp))
+    
+    def toMetadata(self):
+        from calibre.ebooks.metadata.book.base import Metadata
+        
+        metadata = Metadata(self.title, list(self.authors))
+        metadata.uuid = self.uuid
+        metadata.timestamp = self.getTimestamp()
+        metadata.tags = list(self.tags)
+        if self.identifiers:
+            metadata.set_identifiers(self.get_identifiers())
+        metadata.links = list(self.links)
+        return metadata
+
+
+def entriesFromOpds(opdsEntries: Iterable[Dict]) -> List[CatalogEntry]:
+    '''Create the CatalogEntry of a page, the timestamps are parsed in one batch'''
+    opdsEntries = list(opdsEntries)
+    timestamps = parseTimestampsToEpoch((entry['updated'] or DEFAULT_TIMESTAMP for entry in opdsEntries), DEFAULT_EPOCH)
+    return [entryFromOpds(entry, timestamp) for entry, timestamp in zip(opdsEntries, timestamps)]
+
+
+def thumbnailUrl(links: List[Dict]) -> str:
+    '''The thumbnail of a entry, else its cover, else its first image'''
+    images = [
+        link for link in links
+        if link['type'].startswith('image/') or link['rel'].startswith(IMAGE_REL) or link['rel'] in IMAGE_RELS
+    ]
+    for rel in IMAGE_RELS:
+        for link in images:
+            if link['rel'] == rel:
+                return link['href']
+    return images[0]['href'] if images else ''
+
+
+def entryFromOpds(opdsEntry: Dict, timestamp: Optional[int] = None) -> CatalogEntry:
+    '''Create a CatalogEntry from a entry parsed by OpdsFeedParser'''
+    # calibre put all the authors in a single name: "Author 1 & Author 2"
+    authors = []
+    for author in opdsEntry['authors']:
+        authors.extend(intern(a.strip()) for a in author.split('&'))
+    
+    uuid = opdsEntry['id'].replace('urn:uuid:', '', 1)
+    # Other URNs are identifiers, like urn:isbn:9780000000000
+    identifiers = {}
+    for urn in [opdsEntry['id']] + opdsEntry['identifiers']:
+        urn = _urn.match(urn)
+        if urn and urn.group(1) != 'uuid':
+            identifiers[intern(urn.group(1))] = urn.group(2)
+    
+    if timestamp is None:
+        timestamp = parseTimestampsToEpoch([opdsEntry['updated'] or DEFAULT_TIMESTAMP], DEFAULT_EPOCH)[0]
+    
+    tags = ()
+    for summaryline in opdsEntry['summary'].splitlines():
+        if summaryline.startswith('TAGS: '):
+            tagsline = summaryline.replace('TAGS: ', '')
+            tagsline = tagsline.replace('<br />','')
+            tagsline = tagsline.replace(', ', ',')
+            tags = tuple(intern(tag) for tag in tagsline.split(','))
+    
+    bookDownloadUrls = []
+    for link in opdsEntry['links']:
+        url = link['href']
+        bookType = link['type']
+        # Skip covers and thumbnails
+        if not bookType.startswith('image/'):
+            if bookType == 'application/epub+zip':
+                # EPUB books are preferred and always put at the head of the list if found
+                bookDownloadUrls.insert(0, url)
+            else:
+                # Formats other than EPUB (like AZW), are appended as they are found
+                bookDownloadUrls.append(url)
+    
+    return CatalogEntry(
+        title=opdsEntry['title'],
+        authors=tuple(authors) or ('',),
+        uuid=uuid,
+        timestamp=timestamp,
+        tags=tags,
+        links=tuple(bookDownloadUrls),
+        identifiers=tuple(identifiers.items()),
+        thumbnail=thumbnailUrl(opdsEntry['links']),
+    )
@@ -10,13 +10,20 @@ except NameError:
     pass  # load_translations() added in calibre 1.9
 
 try:
-    from qt.core import QCheckBox, QComboBox, QGridLayout, QLabel, QWidget
+    from qt.core import QCheckBox, QComboBox, QGridLayout, QLabel, QLineEdit, QPushButton, QSpinBox, QWidget
 except ImportError:
-    from PyQt5.Qt import QCheckBox, QComboBox, QGridLayout, QLabel, QWidget
+    from PyQt5.Qt import QCheckBox, QComboBox, QGridLayout, QLabel, QLineEdit, QPushButton, QSpinBox, QWidget
 
+import os
 from typing import List
+from urllib.parse import urlparse
 
-from .common_utils import PREFS_json, debug_print
+from calibre.constants import config_dir
+
+from .book_store import BookStore, SqliteBookStore
+from .common_utils import PLUGIN_NAME, PREFS_json, debug_print
+from .feed_cache import FeedCache
+from .thumbnails import ThumbnailCache
 
 PLUGIN_ICON = 'images/plugin.png'
 
@@ -25,23 +32,151 @@ class KEY:
     OPDS_URL = 'opds_url'
     HIDE_NEWSPAPERS = 'hideNewspapers'
     HIDE_BOOK = 'hideBooksAlreadyInLibrary'
+    MAX_CONCURRENT_PAGES = 'maxConcurrentPages'
+    FEED_CACHE_SIZE = 'feedCacheSize'
+    MAX_DOWNLOADS_PER_HOST = 'maxDownloadsPerHost'
+    DELTA_CATALOGS = 'deltaCatalogs'
+    CRAWL_CATALOGS = 'crawlCatalogs'
+    MAX_CRAWL_DEPTH = 'maxCrawlDepth'
+    MAX_CRAWL_FEEDS = 'maxCrawlFeeds'
+    LOAD_ON_DEMAND = 'loadOnDemand'
+    SHOW_DIAGNOSTICS = 'showDiagnostics'
+    FEDERATED = 'federatedCatalogs'
+    FEDERATED_URLS = 'federatedUrls'
+    SHOW_THUMBNAILS = 'showThumbnails'
+    THUMBNAIL_CACHE_SIZE = 'thumbnailCacheSize'
+    HIDDEN_TAGS = 'hiddenTags'
+    DOWNLOAD_FORMATS = 'downloadFormats'
+    DISK_STORE = 'diskBookStore'
 
 
 class TEXT:
     OPDS_URL = _('OPDS URL:')
     HIDE_NEWSPAPERS = _('Hide Newspapers')
     HIDE_BOOK = _('Hide books already in library')
+    MAX_CONCURRENT_PAGES = _('Pages downloaded in parallel:')
+    FEED_CACHE_SIZE = _('Catalog cache size:')
+    MAX_DOWNLOADS_PER_HOST = _('Books downloaded in parallel by server:')
+    MAX_CRAWL_DEPTH = _('Levels of sub-catalogs:')
+    MAX_CRAWL_FEEDS = _('Maximum of sub-catalogs:')
+    MAX_CRAWL_FEEDS_TOOLTIP = _(
+        'The sub-catalogs beyond this number are not loaded, the progress tells when some were skipped',
+    )
+    CRAWL_CATALOGS = _('With sub-catalogs')
+    CRAWL_CATALOGS_TOOLTIP = _(
+        'Also load the books of the sub-catalogs (by author, series, tag...), '
+        'the books found in several catalogs are listed once',
+    )
+    LOAD_ON_DEMAND = _('Load the next pages of the catalog when scrolling')
+    LOAD_ON_DEMAND_TOOLTIP = _(
+        'Only load the first page, then the next pages when the list is scrolled to the end. '
+        'All the pages are loaded by a search, a sort or "Select all"',
+    )
+    SHOW_DIAGNOSTICS = _('Show the diagnostics of the load')
+    SHOW_THUMBNAILS = _('Show the covers')
+    THUMBNAIL_CACHE_SIZE = _('Covers cache size:')
+    HIDDEN_TAGS = _('Hide the books with the tags:')
+    DOWNLOAD_FORMATS = _('Only the books in the formats:')
+    DISK_STORE = _('Keep the books of the catalogs on disk')
+    DISK_STORE_TOOLTIP = _(
+        'For the very large catalogs: the books are kept in a temporary database instead of the memory, '
+        'the memory used stays the same whatever the size of the catalog. The list is slower to sort and search',
+    )
+    FEDERATED = _('All the servers')
+    FEDERATED_TOOLTIP = _(
+        'Load the catalog of the same name from all the servers at once, in a single list: '
+        'the books found on several servers are listed once, and downloaded from the fastest server. '
+        'The servers are chosen in the configuration, by default one OPDS URL by server',
+    )
+    FEDERATED_URLS = _('Servers of "All the servers":')
+    DELTA_CATALOG = _('Only new books')
+    DELTA_CATALOG_TOOLTIP = _(
+        'For the catalogs sorted by date added, the most recent first (like "Newest"): only download the books '
+        'added since the last load of the catalog, the other books come from the cache',
+    )
 
 
 PREFS = PREFS_json()
 PREFS.defaults[KEY.OPDS_URL] = ['http://localhost:8080/opds']
 PREFS.defaults[KEY.HIDE_NEWSPAPERS] = True
 PREFS.defaults[KEY.HIDE_BOOK] = True
+PREFS.defaults[KEY.MAX_CONCURRENT_PAGES] = 4
+PREFS.defaults[KEY.FEED_CACHE_SIZE] = 100  # MiB, 0 to disable the cache
+PREFS.defaults[KEY.MAX_DOWNLOADS_PER_HOST] = 2
+PREFS.defaults[KEY.DELTA_CATALOGS] = []  # URLs of the catalogs loaded by delta
+PREFS.defaults[KEY.CRAWL_CATALOGS] = False
+PREFS.defaults[KEY.MAX_CRAWL_DEPTH] = 3
+PREFS.defaults[KEY.MAX_CRAWL_FEEDS] = 1000
+PREFS.defaults[KEY.LOAD_ON_DEMAND] = False
+PREFS.defaults[KEY.SHOW_DIAGNOSTICS] = False
+PREFS.defaults[KEY.FEDERATED] = False
+PREFS.defaults[KEY.FEDERATED_URLS] = []  # The root catalog of each server of the OPDS URLs when empty
+PREFS.defaults[KEY.SHOW_THUMBNAILS] = True
+PREFS.defaults[KEY.THUMBNAIL_CACHE_SIZE] = 50  # MiB, 0 to disable the cache
+PREFS.defaults[KEY.HIDDEN_TAGS] = []
+PREFS.defaults[KEY.DOWNLOAD_FORMATS] = []  # All the formats when empty
+PREFS.defaults[KEY.DISK_STORE] = False
 
 if PREFS.defaults[KEY.OPDS_URL][0] not in PREFS[KEY.OPDS_URL]:
     PREFS[KEY.OPDS_URL] = PREFS[KEY.OPDS_URL] + PREFS.defaults[KEY.OPDS_URL]
 
 
+def feedCachePath() -> str:
+    # Next to the preferences file of the plugin
+    return os.path.join(config_dir, 'plugins', PLUGIN_NAME + ' cache.sqlite')
+
+
+def openFeedCache() -> FeedCache:
+    '''Return the persistent cache of the catalogs, None if it is disabled'''
+    if PREFS[KEY.FEED_CACHE_SIZE] <= 0:
+        return None
+    return FeedCache(feedCachePath(), PREFS[KEY.FEED_CACHE_SIZE] * 1024 * 1024)
+
+
+def thumbnailCachePath() -> str:
+    return os.path.join(config_dir, 'plugins', PLUGIN_NAME + ' covers.sqlite')
+
+
+def openThumbnailCache() -> ThumbnailCache:
+    '''Return the persistent cache of the covers, None if it is disabled'''
+    if PREFS[KEY.THUMBNAIL_CACHE_SIZE] <= 0:
+        return None
+    return ThumbnailCache(thumbnailCachePath(), PREFS[KEY.THUMBNAIL_CACHE_SIZE] * 1024 * 1024)
+
+
+def openBookStore() -> BookStore:
+    '''Return the store of the books of the book list, in memory or in a temporary database'''
+    if not PREFS[KEY.DISK_STORE]:
+        return BookStore()
+    from calibre.ptempfile import PersistentTemporaryFile
+    
+    # Also removed when calibre exits
+    with PersistentTemporaryFile('_opds_reader_books.sqlite') as f:
+        path = f.name
+    return SqliteBookStore(path)
+
+
+def rootOpdsUrls(opdsUrls) -> List[str]:
+    '''One URL by server, the shortest path: the sub-catalogs added by "Catalog to URL" are longer than their root'''
+    roots = {}
+    for opdsUrl in opdsUrls:
+        parsed = urlparse(opdsUrl)
+        server = (parsed.hostname, parsed.port)
+        if server not in roots or len(parsed.path) < len(urlparse(roots[server]).path):
+            roots[server] = opdsUrl
+    return list(roots.values())
+
+
+def federatedOpdsUrls() -> List[str]:
+    '''The OPDS URLs loaded by "All the servers"'''
+    return PREFS[KEY.FEDERATED_URLS] or rootOpdsUrls(PREFS[KEY.OPDS_URL])
+
+
+def splitList(text) -> List[str]:
+    '''The values of a list separated by commas'''
+    return [value.strip() for value in text.split(',') if value.strip()]
+
+
 def saveOpdsUrlCombobox(opdsUrlEditor) -> List[str]:
     opdsUrls = []
     debug_print('item count:', opdsUrlEditor.count())
@@ -85,10 +220,144 @@ class ConfigWidget(QWidget):
         self.layout.addWidget(self.hideBooksAlreadyInLibraryCheckbox, 2, 0)
         labelColumnWidths.append(self.layout.itemAtPosition(2, 0).sizeHint().width())
         
+        self.maxConcurrentPagesLabel = QLabel(TEXT.MAX_CONCURRENT_PAGES)
+        self.layout.addWidget(self.maxConcurrentPagesLabel, 3, 0)
+        labelColumnWidths.append(self.layout.itemAtPosition(3, 0).sizeHint().width())
+        
+        self.maxConcurrentPagesSpinBox = QSpinBox(self)
+        self.maxConcurrentPagesSpinBox.setRange(1, 16)
+        self.maxConcurrentPagesSpinBox.setValue(PREFS[KEY.MAX_CONCURRENT_PAGES])
+        self.layout.addWidget(self.maxConcurrentPagesSpinBox, 3, 1)
+        self.maxConcurrentPagesLabel.setBuddy(self.maxConcurrentPagesSpinBox)
+        
+        self.feedCacheSizeLabel = QLabel(TEXT.FEED_CACHE_SIZE)
+        self.layout.addWidget(self.feedCacheSizeLabel, 4, 0)
+        labelColumnWidths.append(self.layout.itemAtPosition(4, 0).sizeHint().width())
+        
+        self.feedCacheSizeSpinBox = QSpinBox(self)
+        self.feedCacheSizeSpinBox.setRange(0, 10000)
+        self.feedCacheSizeSpinBox.setSuffix(' ' + _('MiB'))
+        self.feedCacheSizeSpinBox.setSpecialValueText(_('Disabled'))
+        self.feedCacheSizeSpinBox.setValue(PREFS[KEY.FEED_CACHE_SIZE])
+        self.layout.addWidget(self.feedCacheSizeSpinBox, 4, 1)
+        self.feedCacheSizeLabel.setBuddy(self.feedCacheSizeSpinBox)
+        
+        self.purgeFeedCacheButton = QPushButton(_('Clear the cache'), self)
+        self.purgeFeedCacheButton.setAutoDefault(False)
+        self.purgeFeedCacheButton.clicked.connect(self.purgeFeedCache)
+        self.layout.addWidget(self.purgeFeedCacheButton, 4, 2)
+        
+        self.maxDownloadsPerHostLabel = QLabel(TEXT.MAX_DOWNLOADS_PER_HOST)
+        self.layout.addWidget(self.maxDownloadsPerHostLabel, 5, 0)
+        labelColumnWidths.append(self.layout.itemAtPosition(5, 0).sizeHint().width())
+        
+        self.maxDownloadsPerHostSpinBox = QSpinBox(self)
+        self.maxDownloadsPerHostSpinBox.setRange(1, 8)
+        self.maxDownloadsPerHostSpinBox.setValue(PREFS[KEY.MAX_DOWNLOADS_PER_HOST])
+        self.layout.addWidget(self.maxDownloadsPerHostSpinBox, 5, 1)
+        self.maxDownloadsPerHostLabel.setBuddy(self.maxDownloadsPerHostSpinBox)
+        
+        self.maxCrawlDepthLabel = QLabel(TEXT.MAX_CRAWL_DEPTH)
+        self.layout.addWidget(self.maxCrawlDepthLabel, 6, 0)
+        labelColumnWidths.append(self.layout.itemAtPosition(6, 0).sizeHint().width())
+        
+        self.maxCrawlDepthSpinBox = QSpinBox(self)
+        self.maxCrawlDepthSpinBox.setRange(1, 10)
+        self.maxCrawlDepthSpinBox.setValue(PREFS[KEY.MAX_CRAWL_DEPTH])
+        self.layout.addWidget(self.maxCrawlDepthSpinBox, 6, 1)
+        self.maxCrawlDepthLabel.setBuddy(self.maxCrawlDepthSpinBox)
+        
+        self.maxCrawlFeedsLabel = QLabel(TEXT.MAX_CRAWL_FEEDS)
+        self.maxCrawlFeedsLabel.setToolTip(TEXT.MAX_CRAWL_FEEDS_TOOLTIP)
+        self.layout.addWidget(self.maxCrawlFeedsLabel, 7, 0)
+        labelColumnWidths.append(self.layout.itemAtPosition(7, 0).sizeHint().width())
+        
+        self.maxCrawlFeedsSpinBox = QSpinBox(self)
+        self.maxCrawlFeedsSpinBox.setRange(10, 100000)
+        self.maxCrawlFeedsSpinBox.setValue(PREFS[KEY.MAX_CRAWL_FEEDS])
+        self.layout.addWidget(self.maxCrawlFeedsSpinBox, 7, 1)
+        self.maxCrawlFeedsLabel.setBuddy(self.maxCrawlFeedsSpinBox)
+        
+        self.loadOnDemandCheckbox = QCheckBox(TEXT.LOAD_ON_DEMAND, self)
+        self.loadOnDemandCheckbox.setToolTip(TEXT.LOAD_ON_DEMAND_TOOLTIP)
+        self.loadOnDemandCheckbox.setChecked(PREFS[KEY.LOAD_ON_DEMAND])
+        self.layout.addWidget(self.loadOnDemandCheckbox, 8, 0, 1, 2)
+        
+        self.showThumbnailsCheckbox = QCheckBox(TEXT.SHOW_THUMBNAILS, self)
+        self.showThumbnailsCheckbox.setChecked(PREFS[KEY.SHOW_THUMBNAILS])
+        self.layout.addWidget(self.showThumbnailsCheckbox, 9, 0, 1, 2)
+        
+        self.thumbnailCacheSizeLabel = QLabel(TEXT.THUMBNAIL_CACHE_SIZE)
+        self.layout.addWidget(self.thumbnailCacheSizeLabel, 10, 0)
+        labelColumnWidths.append(self.layout.itemAtPosition(10, 0).sizeHint().width())
+        
+        self.thumbnailCacheSizeSpinBox = QSpinBox(self)
+        self.thumbnailCacheSizeSpinBox.setRange(0, 10000)
+        self.thumbnailCacheSizeSpinBox.setSuffix(' ' + _('MiB'))
+        self.thumbnailCacheSizeSpinBox.setSpecialValueText(_('Disabled'))
+        self.thumbnailCacheSizeSpinBox.setValue(PREFS[KEY.THUMBNAIL_CACHE_SIZE])
+        self.layout.addWidget(self.thumbnailCacheSizeSpinBox, 10, 1)
+        self.thumbnailCacheSizeLabel.setBuddy(self.thumbnailCacheSizeSpinBox)
+        
+        self.hiddenTagsLabel = QLabel(TEXT.HIDDEN_TAGS)
+        self.layout.addWidget(self.hiddenTagsLabel, 11, 0)
+        labelColumnWidths.append(self.layout.itemAtPosition(11, 0).sizeHint().width())
+        
+        self.hiddenTagsEditor = QLineEdit(', '.join(PREFS[KEY.HIDDEN_TAGS]), self)
+        self.hiddenTagsEditor.setPlaceholderText(_('Tags separated by commas'))
+        self.layout.addWidget(self.hiddenTagsEditor, 11, 1, 1, 2)
+        self.hiddenTagsLabel.setBuddy(self.hiddenTagsEditor)
+        
+        self.downloadFormatsLabel = QLabel(TEXT.DOWNLOAD_FORMATS)
+        self.layout.addWidget(self.downloadFormatsLabel, 12, 0)
+        labelColumnWidths.append(self.layout.itemAtPosition(12, 0).sizeHint().width())
+        
+        self.downloadFormatsEditor = QLineEdit(', '.join(PREFS[KEY.DOWNLOAD_FORMATS]), self)
+        self.downloadFormatsEditor.setPlaceholderText(_('For example: epub, pdf (all the formats when empty)'))
+        self.layout.addWidget(self.downloadFormatsEditor, 12, 1, 1, 2)
+        self.downloadFormatsLabel.setBuddy(self.downloadFormatsEditor)
+        
+        self.diskStoreCheckbox = QCheckBox(TEXT.DISK_STORE, self)
+        self.diskStoreCheckbox.setToolTip(TEXT.DISK_STORE_TOOLTIP)
+        self.diskStoreCheckbox.setChecked(PREFS[KEY.DISK_STORE])
+        self.layout.addWidget(self.diskStoreCheckbox, 13, 0, 1, 2)
+        
+        self.federatedUrlsLabel = QLabel(TEXT.FEDERATED_URLS)
+        self.layout.addWidget(self.federatedUrlsLabel, 14, 0)
+        labelColumnWidths.append(self.layout.itemAtPosition(14, 0).sizeHint().width())
+        
+        self.federatedUrlsEditor = QLineEdit(', '.join(PREFS[KEY.FEDERATED_URLS]), self)
+        self.federatedUrlsEditor.setPlaceholderText(_('OPDS URLs separated by commas (one URL by server when empty)'))
+        self.layout.addWidget(self.federatedUrlsEditor, 14, 1, 1, 2)
+        self.federatedUrlsLabel.setBuddy(self.federatedUrlsEditor)
+        
         labelColumnWidth = max(labelColumnWidths)
         self.layout.setColumnMinimumWidth(1, labelColumnWidth * 2)
     
     def save_settings(self):
         PREFS[KEY.HIDE_NEWSPAPERS] = self.hideNewsCheckbox.isChecked()
         PREFS[KEY.HIDE_BOOK] = self.hideBooksAlreadyInLibraryCheckbox.isChecked()
+        PREFS[KEY.MAX_CONCURRENT_PAGES] = self.maxConcurrentPagesSpinBox.value()
+        PREFS[KEY.FEED_CACHE_SIZE] = self.feedCacheSizeSpinBox.value()
+        PREFS[KEY.MAX_DOWNLOADS_PER_HOST] = self.maxDownloadsPerHostSpinBox.value()
+        PREFS[KEY.MAX_CRAWL_DEPTH] = self.maxCrawlDepthSpinBox.value()
+        PREFS[KEY.MAX_CRAWL_FEEDS] = self.maxCrawlFeedsSpinBox.value()
+        PREFS[KEY.LOAD_ON_DEMAND] = self.loadOnDemandCheckbox.isChecked()
+        PREFS[KEY.SHOW_THUMBNAILS] = self.showThumbnailsCheckbox.isChecked()
+        PREFS[KEY.THUMBNAIL_CACHE_SIZE] = self.thumbnailCacheSizeSpinBox.value()
+        PREFS[KEY.HIDDEN_TAGS] = splitList(self.hiddenTagsEditor.text())
+        PREFS[KEY.DOWNLOAD_FORMATS] = [f.lower().lstrip('.') for f in splitList(self.downloadFormatsEditor.text())]
+        PREFS[KEY.DISK_STORE] = self.diskStoreCheckbox.isChecked()
+        PREFS[KEY.FEDERATED_URLS] = splitList(self.federatedUrlsEditor.text())
         PREFS[KEY.OPDS_URL] = saveOpdsUrlCombobox(self.opdsUrlEditor)
+    
+    def purgeFeedCache(self):
+        if os.path.exists(feedCachePath()):
+            feedCache = FeedCache(feedCachePath())
+            feedCache.purge()
+            feedCache.close()
+        if os.path.exists(thumbnailCachePath()):
+            thumbnailCache = ThumbnailCache(thumbnailCachePath())
+            thumbnailCache.purge()
+            thumbnailCache.close()
+        debug_print('Catalog and covers caches cleared')
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from .fetcher import LoadCancelled, PageFetcher, urlKey
+
+ACQUISITION_REL = 'http://opds-spec.org/acquisition'
+# Links of the entries that are not sub-catalogs
+NOT_CATALOG_RELS = (
+    'self', 'start', 'up', 'search', 'related',
+    ACQUISITION_REL, 'http://opds-spec.org/image', 'http://opds-spec.org/facet',
+)
+
+
+def isAcquisitionLink(link: Dict) -> bool:
+    return link['rel'].startswith(ACQUISITION_REL)
+
+
+def isCatalogLink(link: Dict) -> bool:
+    '''A link to a navigation or acquisition feed, not to a entry document'''
+    linkType = link['type'].lower()
+    if not linkType.startswith('application/atom+xml') or 'type=entry' in linkType:
+        return False
+    return not link['rel'].startswith(NOT_CATALOG_RELS)
+
+
+def isBookEntry(entry: Dict) -> bool:
+    '''
+    A entry of a acquisition feed: it has a acquisition link, or for the servers that don't
+    set the rel of the links, a link that is not a image nor a feed
+    '''
+    for link in entry['links']:
+        if isAcquisitionLink(link):
+            return True
+    for link in entry['links']:
+        linkType = link['type'].lower()
+        if not linkType.startswith(('image/', 'application/atom+xml', 'application/opensearchdescription+xml')):
+            return True
+    return False
+
+
+def entryKey(entry: Dict) -> str:
+    '''The same book found in several catalogs has the same OPDS id, else the same download link'''
+    if entry['id']:
+        return entry['id']
+    return next((link['href'] for link in entry['links'] if isAcquisitionLink(link)), '')
+
+
+class CrawledFeed(NamedTuple):
+    url: str
+    depth: int
+    # The books not found in the feeds crawled before
+    entries: List[Dict]
+    pages: int
+    size: int
+    fromCache: int
+
+
+class CatalogCrawler:
+    '''
+    Load a catalog and its sub-catalogs: the navigation feeds are walked breadth first,
+    up to "maxDepth" levels below the first feed, and at most "maxFeeds" feeds.
+    
+    The feeds of a level are loaded in parallel by "maxWorkers" threads, each feed with all its pages.
+    The books of the acquisition feeds are returned once, the first time they are found,
+    in the order of the feeds. The sub-catalogs that fail to load are skipped, and listed in "errors".
+    The sub-catalogs not loaded because of "maxFeeds" are counted in "skippedFeeds".
+    '''
+    
+    def __init__(self, maxWorkers=4, maxDepth=3, maxFeeds=1000, cache=None, cancelEvent=None, metrics=None):
+        self.maxWorkers = max(1, maxWorkers)
+        self.maxDepth = maxDepth
+        self.maxFeeds = maxFeeds
+        self.cache = cache
+        self.cancelEvent = cancelEvent or threading.Event()
+        self.metrics = metrics
+        self.feeds = 0
+        self.duplicates = 0
+        self.skippedFeeds = 0
+        self.errors: List[Tuple[str, Exception]] = []
+    
+    def crawl(self, url) -> Iterator[CrawledFeed]:
+        seenUrls = {urlKey(url)}
+        seenEntries = set()
+        futures = []
+        level = [url]
+        depth = 0
+        executor = ThreadPoolExecutor(max_workers=self.maxWorkers)
+        try:
+            while level and not self.cancelEvent.is_set():
+                futures = [executor.submit(self.loadFeed, feedUrl) for feedUrl in level]
+                nextLevel = []
+                for feedUrl, future in zip(level, futures):
+                    try:
+                        entries, catalogUrls, pages, size, fromCache = future.result()
+                    except LoadCancelled:
+                        raise
+                    except Exception as e:
+                        if depth == 0:
+                            raise
+                        self.errors.append((feedUrl, e))
+                        continue
+                    self.feeds += 1
+                    books = []
+                    for entry in entries:
+                        key = entryKey(entry)
+                        if key in seenEntries:
+                            self.duplicates += 1
+                        else:
+                            seenEntries.add(key)
+                            books.append(entry)
+                    if depth < self.maxDepth:
+                        for catalogUrl in catalogUrls:
+                            key = urlKey(catalogUrl)
+                            if key in seenUrls:
+                                continue
+                            seenUrls.add(key)
+                            if len(seenUrls) > self.maxFeeds:
+                                self.skippedFeeds += 1
+                            else:
+                                nextLevel.append(catalogUrl)
+                    yield CrawledFeed(feedUrl, depth, books, pages, size, fromCache)
+                level = nextLevel
+                depth += 1
+        finally:
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+        if self.cancelEvent.is_set():
+            raise LoadCancelled()
+    
+    def loadFeed(self, url) -> Tuple[List[Dict], List[str], int, int, int]:
+        '''
+        Load all the pages of a feed, return its book entries, the URLs of its sub-catalogs,
+        and the number of pages, their size and the number of pages from the cache
+        '''
+        entries = []
+        catalogUrls = []
+        pages = size = fromCache = 0
+        # The feeds are already loaded in parallel, one page ahead is enough
+        fetcher = PageFetcher(1, cache=self.cache, cancelEvent=self.cancelEvent, metrics=self.metrics)
+        for page in fetcher.pages(url):
+            for entry in page.entries():
+                if isBookEntry(entry):
+                    entries.append(entry)
+                    continue
+                catalogUrl = self.catalogUrl(entry)
+                if catalogUrl:
+                    catalogUrls.append(catalogUrl)
+            pages += 1
+            size += page.size
+            fromCache += page.fromCache
+        return entries, catalogUrls, pages, size, fromCache
+    
+    @staticmethod
+    def catalogUrl(entry: Dict) -> Optional[str]:
+        # The acquisition feeds first: "kind=acquisition" contain the books
+        links = [link for link in entry['links'] if isCatalogLink(link)]
+        links.sort(key=lambda link: 'kind=acquisition' not in link['type'])
+        return links[0]['href'] if links else None
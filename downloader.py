@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+try:
+    load_translations()
+except NameError:
+    pass  # load_translations() added in calibre 1.9
+
+import http.client
+import mimetypes
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Tuple
+from urllib.error import HTTPError, URLError
+from urllib.parse import unquote, urlparse
+
+from .fetcher import CHUNK_SIZE, DEFAULT_TIMEOUT, LoadCancelled, openUrl
+
+# HTTP status of the errors that can succeed when the request is retried
+TRANSIENT_HTTP_ERRORS = (408, 425, 429, 500, 502, 503, 504)
+
+# Weight of the last response time in the average response time of a server
+LATENCY_WEIGHT = 0.3
+
+
+def isTransientError(error) -> bool:
+    if isinstance(error, HTTPError):
+        return error.code in TRANSIENT_HTTP_ERRORS
+    return isinstance(error, (URLError, ConnectionError, TimeoutError, http.client.HTTPException))
+
+
+def retryDelay(error, attempt, backoff) -> float:
+    '''Delay before the next attempt: the Retry-After of the server, else an exponential backoff'''
+    if isinstance(error, HTTPError) and error.headers:
+        retryAfter = error.headers.get('Retry-After', '')
+        if retryAfter.isdigit():
+            return min(int(retryAfter), 300)
+    return backoff * 2 ** attempt
+
+
+def responseFilename(response, url) -> str:
+    filename = os.path.basename(response.headers.get_filename() or '')
+    if not filename:
+        filename = os.path.basename(unquote(urlparse(url).path)) or 'book'
+    if not os.path.splitext(filename)[1]:
+        filename += mimetypes.guess_extension(response.headers.get_content_type()) or ''
+    return filename
+
+
+class DownloadProgress:
+    def __init__(self):
+        self.start = time.monotonic()
+        self.queued = 0
+        self.completed = 0
+        self.failed = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+    
+    def addBytes(self, size):
+        with self._lock:
+            self.bytes += size
+    
+    def addCompleted(self):
+        with self._lock:
+            self.completed += 1
+    
+    def addFailed(self):
+        with self._lock:
+            self.failed += 1
+    
+    def isFinished(self) -> bool:
+        return self.completed + self.failed >= self.queued
+    
+    def rate(self) -> float:
+        return self.bytes / max(time.monotonic() - self.start, 0.001)
+    
+    def text(self) -> str:
+        return _('Downloaded {completed}/{queued} books, {failed} failed, {size:.1f} MiB ({rate:.0f} KiB/s)').format(
+            completed=self.completed,
+            queued=self.queued,
+            failed=self.failed,
+            size=self.bytes / (1024 * 1024),
+            rate=self.rate() / 1024,
+        )
+
+
+def _ignore(*args):
+    pass
+
+
+class DownloadQueue:
+    '''
+    Queue of the books to download, with a limited number of parallel downloads by server.
+    
+    A book is only queued once (by UUID and by URL). A download that fails with a transient error
+    is retried after an increasing delay, then the next link of the book is tried, in the threads
+    of the server of that link.
+    The downloaded files are passed to onDownloaded(book, path), in a new directory for each book.
+    The callbacks are called by the worker threads.
+    
+    The books found on several servers are downloaded from the server that answers the fastest:
+    the response times are measured by the downloads, and can be given by setHostLatencies().
+    '''
+    
+    def __init__(self, maxPerHost=2, retries=3, backoff=2.0, timeout=DEFAULT_TIMEOUT,
+                 onDownloaded=None, onFailed=None, onProgress=None, log=None):
+        self.maxPerHost = max(1, maxPerHost)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.onDownloaded = onDownloaded or _ignore
+        self.onFailed = onFailed or _ignore
+        self.onProgress = onProgress or _ignore
+        self.log = log or _ignore
+        self.directory = None
+        self.progress = DownloadProgress()
+        self.cancelEvent = threading.Event()
+        self._executors: Dict[str, ThreadPoolExecutor] = {}
+        self._queuedUuids = set()
+        self._queuedUrls = set()
+        self._hostLatencies: Dict[str, float] = {}
+        self._lock = threading.Lock()
+    
+    def addBooks(self, books: Iterable) -> int:
+        '''Queue the books not already queued, return the number of books queued'''
+        if self.progress.isFinished():
+            self.progress = DownloadProgress()
+        queued = 0
+        for book in books:
+            with self._lock:
+                if not book.links or (book.uuid and book.uuid in self._queuedUuids):
+                    continue
+                if any(url in self._queuedUrls for url in book.links):
+                    continue
+                if book.uuid:
+                    self._queuedUuids.add(book.uuid)
+                self._queuedUrls.update(book.links)
+            self.progress.queued += 1
+            queued += 1
+            self._submit(book, self.orderedLinks(book), self.progress, self.cancelEvent)
+        if queued:
+            self.onProgress(self.progress)
+        return queued
+    
+    def setHostLatencies(self, latencies: Dict[str, float]):
+        '''The response times of the servers (by host), measured by the catalog loads'''
+        with self._lock:
+            for host, latency in latencies.items():
+                self._hostLatencies.setdefault(host, latency)
+    
+    def orderedLinks(self, book) -> Tuple[str, ...]:
+        '''The links of the fastest servers first, the order of the catalog is kept for each server'''
+        with self._lock:
+            latencies = dict(self._hostLatencies)
+        if not latencies:
+            return book.links
+        return tuple(sorted(book.links, key=lambda url: latencies.get(urlparse(url).netloc, float('inf'))))
+    
+    def cancel(self):
+        self.cancelEvent.set()
+        self.cancelEvent = threading.Event()
+        self.progress = DownloadProgress()
+        with self._lock:
+            executors = list(self._executors.values())
+            self._executors.clear()
+        for executor in executors:
+            executor.shutdown(wait=False)
+    
+    def isActive(self) -> bool:
+        return not self.progress.isFinished()
+    
+    def wait(self):
+        '''Block until the queued books are downloaded'''
+        while True:
+            # The downloads that fall back on the link of another server are submitted to its executor,
+            # a new one when it was already waited for
+            with self._lock:
+                executors = list(self._executors.values())
+                self._executors.clear()
+            if not executors:
+                return
+            for executor in executors:
+                executor.shutdown(wait=True)
+    
+    def _executor(self, url) -> ThreadPoolExecutor:
+        host = urlparse(url).netloc
+        with self._lock:
+            executor = self._executors.get(host)
+            if executor is None:
+                executor = self._executors[host] = ThreadPoolExecutor(max_workers=self.maxPerHost)
+            return executor
+    
+    def _submit(self, book, links, progress, cancelEvent):
+        '''Download the book from the first link, in the executor of its server'''
+        while not cancelEvent.is_set():
+            executor = self._executor(links[0])
+            try:
+                executor.submit(self._download, book, links, progress, cancelEvent)
+                return
+            except RuntimeError:
+                # Shut down by wait() since it was taken: it is no longer in the executors
+                continue
+        self._forget(book)
+    
+    def _forget(self, book):
+        # A book that is not downloaded can be queued again
+        with self._lock:
+            self._queuedUuids.discard(book.uuid)
+            self._queuedUrls.difference_update(book.links)
+    
+    # Called by the worker threads
+    
+    def _observeLatency(self, url, seconds):
+        host = urlparse(url).netloc
+        with self._lock:
+            latency = self._hostLatencies.get(host)
+            if latency is None:
+                self._hostLatencies[host] = seconds
+            else:
+                self._hostLatencies[host] = latency + LATENCY_WEIGHT * (seconds - latency)
+    
+    def _download(self, book, links, progress, cancelEvent):
+        '''Download the book from the first link, then from the next links in the executors of their servers'''
+        url = links[0]
+        error = None
+        for attempt in range(self.retries + 1):
+            if cancelEvent.is_set():
+                self._forget(book)
+                return
+            try:
+                path = self._downloadUrl(url, progress, cancelEvent)
+            except LoadCancelled:
+                self._forget(book)
+                return
+            except Exception as e:
+                error = e
+                if not isTransientError(e) or attempt == self.retries:
+                    self.log('Failed downloading', url, e)
+                    break
+                delay = retryDelay(e, attempt, self.backoff)
+                self.log(f'Download of {url} failed ({e}), retry in {delay:.0f}s')
+                cancelEvent.wait(delay)
+            else:
+                progress.addCompleted()
+                self.onDownloaded(book, path)
+                self.onProgress(progress)
+                return
+        if len(links) > 1:
+            self._submit(book, links[1:], progress, cancelEvent)
+            return
+        progress.addFailed()
+        self._forget(book)
+        self.onFailed(book, error)
+        self.onProgress(progress)
+    
+    def _downloadUrl(self, url, progress, cancelEvent) -> str:
+        directory = tempfile.mkdtemp(dir=self.directory)
+        try:
+            start = time.monotonic()
+            with openUrl(url, self.timeout, {'Accept': '*/*'}) as response:
+                self._observeLatency(url, time.monotonic() - start)
+                path = os.path.join(directory, responseFilename(response, url))
+                with open(path, 'wb') as f:
+                    for chunk in iter(lambda: response.read(CHUNK_SIZE), b''):
+                        if cancelEvent.is_set():
+                            raise LoadCancelled()
+                        f.write(chunk)
+                        progress.addBytes(len(chunk))
+            return path
+        except BaseException:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
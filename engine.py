@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+# Synchronization of OPDS catalogs into a calibre library, without GUI:
+# used by the command line of the plugin (calibre-debug -r "OPDS Reader"), must not import Qt.
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from .calibre_rest import downloadCalibreTimestamps
+from .catalog_entry import CatalogEntry, entriesFromOpds
+from .crawler import CatalogCrawler
+from .downloader import DownloadQueue
+from .fetcher import PageFetcher, loadRootCatalog
+from .library_index import LibraryIndex
+
+
+def _ignore(*args):
+    pass
+
+
+def newSyncStats(opdsUrl) -> Dict:
+    return {
+        'url': opdsUrl,
+        'catalog': None,
+        'server': None,
+        'feeds': 1,
+        'skippedFeeds': 0,
+        'books': 0,
+        'news': 0,
+        'inLibrary': 0,
+        'missing': 0,
+        'downloaded': 0,
+        'failed': 0,
+        'added': 0,
+        'duplicates': 0,
+        'timestampsLoaded': 0,
+        'timestampsFixed': 0,
+        'bytes': 0,
+        'seconds': 0.0,
+        'error': None,
+    }
+
+
+class SyncEngine:
+    '''
+    Mirror the catalogs of OPDS servers into a calibre library: the books of the catalog
+    that are not in the library are downloaded and added with the metadata of the catalog.
+    
+    With crawlDepth, the sub-catalogs are also mirrored, at most maxFeeds catalogs (see CatalogCrawler):
+    the sub-catalogs skipped beyond maxFeeds are counted in the statistics.
+    With deltaLoad, only the beginning of the catalogs sorted by date added is downloaded (see PageFetcher.deltaPages).
+    For a calibre server, the timestamps of the books are loaded from its REST API while the books
+    are downloaded, then the timestamps of the books already in the library are fixed.
+    Several servers are synchronized in parallel, a book found on several servers is added once.
+    
+    "db" is the new_api of the library, the statistics of each server are returned as a dict.
+    '''
+    
+    def __init__(self, db, maxConcurrentPages=4, maxDownloadsPerHost=2, feedCache=None,
+                 hideNewspapers=True, fixTimestamps=True, dryRun=False, deltaLoad=False, crawlDepth=0,
+                 maxFeeds=1000, log=None):
+        self.db = db
+        self.maxConcurrentPages = maxConcurrentPages
+        self.maxDownloadsPerHost = maxDownloadsPerHost
+        self.feedCache = feedCache
+        self.hideNewspapers = hideNewspapers
+        self.fixTimestamps = fixTimestamps
+        self.dryRun = dryRun
+        self.deltaLoad = deltaLoad and feedCache is not None
+        self.crawlDepth = crawlDepth
+        self.maxFeeds = maxFeeds
+        self.log = log or _ignore
+        self.cancelEvent = threading.Event()
+        self._libraryIndex = None
+        self._lock = threading.Lock()
+    
+    def cancel(self):
+        self.cancelEvent.set()
+    
+    def libraryIndex(self) -> LibraryIndex:
+        with self._lock:
+            if self._libraryIndex is None:
+                self._libraryIndex = LibraryIndex(self.db)
+            return self._libraryIndex
+    
+    def syncAll(self, opdsUrls: List[str], catalogTitle=None) -> List[Dict]:
+        '''Synchronize the servers in parallel, return their statistics in the same order'''
+        self.libraryIndex()
+        with ThreadPoolExecutor(max_workers=max(1, len(opdsUrls))) as executor:
+            return list(executor.map(lambda url: self.sync(url, catalogTitle), opdsUrls))
+    
+    def sync(self, opdsUrl, catalogTitle=None) -> Dict:
+        '''Synchronize a server, the errors are reported in the statistics'''
+        stats = newSyncStats(opdsUrl)
+        start = time.monotonic()
+        try:
+            self._sync(opdsUrl, catalogTitle, stats)
+        except Exception as e:
+            self.log('Failed synchronizing', opdsUrl, e)
+            stats['error'] = str(e) or type(e).__name__
+        stats['seconds'] = round(time.monotonic() - start, 3)
+        return stats
+    
+    def _sync(self, opdsUrl, catalogTitle, stats):
+        rootCatalog = loadRootCatalog(opdsUrl)
+        catalogTitle = catalogTitle or rootCatalog.firstTitle
+        if catalogTitle not in rootCatalog.catalogs:
+            raise ValueError(f'No catalog {catalogTitle!r} in {opdsUrl}')
+        stats['catalog'] = catalogTitle
+        stats['server'] = rootCatalog.serverHeader
+        
+        books = self.loadCatalog(rootCatalog.catalogs[catalogTitle], stats)
+        if self.hideNewspapers:
+            stats['news'] = sum(1 for book in books if 'News' in book.tags)
+            books = [book for book in books if 'News' not in book.tags]
+        
+        # Books already in the library, or being added from another server
+        libraryIndex = self.libraryIndex()
+        with self._lock:
+            missingBooks = [book for book in books if not libraryIndex.hasBook(book)]
+            if not self.dryRun:
+                libraryIndex.addBooks(missingBooks)
+        stats['missing'] = len(missingBooks)
+        stats['inLibrary'] = len(books) - len(missingBooks)
+        self.log(opdsUrl, ':', stats['books'], 'books,', len(missingBooks), 'not in the library')
+        if self.dryRun:
+            return
+        
+        # The timestamps are loaded while the books are downloaded
+        directory = tempfile.mkdtemp(prefix='opds_reader_')
+        try:
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                timestamps = None
+                if rootCatalog.serverHeader.startswith('calibre'):
+                    timestamps = executor.submit(self.loadTimestamps, books, stats)
+                downloaded = self.downloadBooks(missingBooks, directory, stats)
+                if timestamps is not None:
+                    timestamps.result()
+                    if self.fixTimestamps:
+                        missingIds = set(map(id, missingBooks))
+                        self.fixLibraryTimestamps([book for book in books if id(book) not in missingIds], stats)
+            self.addBooks(downloaded, stats)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+    
+    def loadCatalog(self, catalogUrl, stats) -> List[CatalogEntry]:
+        if self.crawlDepth > 0:
+            crawler = CatalogCrawler(self.maxConcurrentPages, self.crawlDepth, self.maxFeeds, cache=self.feedCache,
+                                     cancelEvent=self.cancelEvent)
+            books = []
+            for feed in crawler.crawl(catalogUrl):
+                books.extend(entriesFromOpds(feed.entries))
+            stats['books'] = len(books)
+            stats['feeds'] = crawler.feeds
+            stats['skippedFeeds'] = crawler.skippedFeeds
+            if crawler.skippedFeeds:
+                self.log('Maximum of sub-catalogs reached,', crawler.skippedFeeds, 'not mirrored:', catalogUrl)
+            for url, error in crawler.errors:
+                self.log('Failed loading the sub-catalog', url, error)
+            return books
+        fetcher = PageFetcher(self.maxConcurrentPages, cache=self.feedCache, cancelEvent=self.cancelEvent)
+        books = []
+        for page in fetcher.deltaPages(catalogUrl) if self.deltaLoad else fetcher.pages(catalogUrl):
+            books.extend(entriesFromOpds(page.entries()))
+        stats['books'] = len(books)
+        return books
+    
+    def loadTimestamps(self, books: List[CatalogEntry], stats):
+        for timestamps in downloadCalibreTimestamps(books, self.maxConcurrentPages, self.cancelEvent):
+            for book, timestamp in timestamps:
+                book.timestamp = timestamp
+            stats['timestampsLoaded'] += len(timestamps)
+    
+    def fixLibraryTimestamps(self, books: List[CatalogEntry], stats):
+        matches = self.libraryIndex().matchTimestamps(books)
+        currentTimestamps = self.db.all_field_for('timestamp', matches.timestamps)
+        # Only write the timestamps that changed
+        changed = {
+            bookId: timestamp for bookId, timestamp in matches.timestamps.items()
+            if currentTimestamps.get(bookId) != timestamp
+        }
+        if changed:
+            self.db.set_field('timestamp', changed)
+        stats['timestampsFixed'] = len(changed)
+    
+    def downloadBooks(self, books: List[CatalogEntry], directory, stats) -> Dict[CatalogEntry, str]:
+        '''Download the books in the directory, return the path of the file of each book'''
+        downloaded = {}
+        queue = DownloadQueue(
+            self.maxDownloadsPerHost,
+            onDownloaded=downloaded.__setitem__,
+            log=self.log,
+        )
+        queue.cancelEvent = self.cancelEvent
+        queue.directory = directory
+        queue.addBooks(books)
+        queue.wait()
+        stats['downloaded'] = queue.progress.completed
+        stats['failed'] = queue.progress.failed
+        stats['bytes'] = queue.progress.bytes
+        return downloaded
+    
+    def addBooks(self, downloaded: Dict[CatalogEntry, str], stats):
+        '''Add the downloaded books to the library, with the metadata of the catalog'''
+        if not downloaded:
+            return
+        books = []
+        for book, path in downloaded.items():
+            bookFormat = os.path.splitext(path)[1][1:].upper() or 'EPUB'
+            books.append((book.toMetadata(), {bookFormat: path}))
+        # The UUID of the server is kept, to find the books at the next synchronization
+        bookIds, duplicates = self.db.add_books(books, add_duplicates=False, preserve_uuid=True)
+        stats['added'] = len(bookIds)
+        stats['duplicates'] = len(duplicates)
+
+
+def formatStats(stats: List[Dict]) -> Dict:
+    '''The statistics of the servers and their totals, for the JSON output of the command line'''
+    keys = ('books', 'missing', 'downloaded', 'failed', 'added', 'timestampsFixed', 'skippedFeeds', 'bytes')
+    return {
+        'servers': stats,
+        'total': {key: sum(s[key] for s in stats) for key in keys},
+        'errors': sum(1 for s in stats if s['error']),
+    }
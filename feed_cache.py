@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, List, NamedTuple, Optional
+
+
+class CachedPage(NamedTuple):
+    url: str
+    etag: Optional[str]
+    lastModified: Optional[str]
+    header: Dict
+    entries: List[Dict]
+
+
+class CachedCatalog(NamedTuple):
+    url: str
+    entries: List[Dict]
+
+
+class FeedCache:
+    '''
+    Persistent cache of the parsed pages of the feeds, in a SQLite database.
+    
+    Each page is stored with its ETag and Last-Modified values, so it can be revalidated
+    by a conditional request and reused when the server answer "304 Not Modified".
+    The size of the cache is bounded: the pages used the least recently are removed first.
+    The cache can be used by several threads.
+    
+    The cache also keeps the entries of the last complete load of each catalog, for the delta loads.
+    '''
+    
+    def __init__(self, path, maxSize=100 * 1024 * 1024):
+        self.path = path
+        self.maxSize = maxSize
+        self._lock = threading.Lock()
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('''CREATE TABLE IF NOT EXISTS pages (
+            url TEXT PRIMARY KEY,
+            etag TEXT,
+            last_modified TEXT,
+            data BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            last_used REAL NOT NULL
+        )''')
+        self._db.execute('CREATE INDEX IF NOT EXISTS pages_last_used ON pages (last_used)')
+        self._db.execute('''CREATE TABLE IF NOT EXISTS delta_catalogs (
+            url TEXT PRIMARY KEY,
+            data BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            last_used REAL NOT NULL
+        )''')
+    
+    def close(self):
+        with self._lock:
+            self._db.close()
+    
+    def get(self, url) -> Optional[CachedPage]:
+        with self._lock:
+            row = self._db.execute('SELECT etag, last_modified, data FROM pages WHERE url = ?', (url,)).fetchone()
+        if row is None:
+            return None
+        etag, lastModified, data = row
+        header, entries = json.loads(zlib.decompress(data))
+        return CachedPage(url, etag, lastModified, header, entries)
+    
+    def put(self, url, etag, lastModified, header, entries):
+        data = zlib.compress(json.dumps([header, entries], separators=(',', ':')).encode('utf-8'))
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO pages (url, etag, last_modified, data, size, last_used)'
+                ' VALUES (?, ?, ?, ?, ?, ?)',
+                (url, etag, lastModified, data, len(data), time.time()),
+            )
+    
+    def getCatalog(self, url) -> Optional[CachedCatalog]:
+        with self._lock:
+            row = self._db.execute('SELECT data FROM delta_catalogs WHERE url = ?', (url,)).fetchone()
+        if row is None:
+            return None
+        return CachedCatalog(url, json.loads(zlib.decompress(row[0])))
+    
+    def putCatalog(self, url, entries):
+        data = zlib.compress(json.dumps(entries, separators=(',', ':')).encode('utf-8'))
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO delta_catalogs (url, data, size, last_used) VALUES (?, ?, ?, ?)',
+                (url, data, len(data), time.time()),
+            )
+    
+    def touch(self, url):
+        with self._lock:
+            self._db.execute('UPDATE pages SET last_used = ? WHERE url = ?', (time.time(), url))
+    
+    def size(self) -> int:
+        with self._lock:
+            return self._size()
+    
+    def _size(self) -> int:
+        return self._db.execute(
+            'SELECT (SELECT COALESCE(SUM(size), 0) FROM pages) + (SELECT COALESCE(SUM(size), 0) FROM delta_catalogs)',
+        ).fetchone()[0]
+    
+    def evict(self):
+        '''Remove the least recently used pages and catalogs until the cache fits in its maximum size'''
+        with self._lock:
+            total = self._size()
+            if total <= self.maxSize:
+                return
+            removed = {'pages': [], 'delta_catalogs': []}
+            rows = self._db.execute(
+                'SELECT ?, url, size, last_used FROM pages'
+                ' UNION ALL SELECT ?, url, size, last_used FROM delta_catalogs ORDER BY last_used',
+                ('pages', 'delta_catalogs'),
+            ).fetchall()
+            for table, url, size, _lastUsed in rows:
+                if total <= self.maxSize:
+                    break
+                removed[table].append((url,))
+                total -= size
+            self._db.executemany('DELETE FROM pages WHERE url = ?', removed['pages'])
+            self._db.executemany('DELETE FROM delta_catalogs WHERE url = ?', removed['delta_catalogs'])
+    
+    def purge(self):
+        with self._lock:
+            self._db.execute('DELETE FROM pages')
+            self._db.execute('DELETE FROM delta_catalogs')
+            self._db.execute('VACUUM')
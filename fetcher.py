@@ -0,0 +1,408 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue
+from typing import Dict, Iterator, List, NamedTuple, Optional
+from urllib.error import HTTPError
+from urllib.parse import parse_qsl, urlencode, urlparse
+
+from .http_client import httpClient
+from .metrics import NO_METRICS
+from .opds_parser import OpdsFeedParser, parseFeed
+
+# Query parameters used by the servers to page through a feed:
+# calibre use "offset", OpenSearch use "startIndex"
+OFFSET_PARAMETERS = ('offset', 'startIndex')
+
+DEFAULT_TIMEOUT = 60
+CHUNK_SIZE = 64 * 1024
+# Consecutive entries of the last load that end a delta load
+DELTA_KNOWN_ENTRIES = 20
+USER_AGENT = 'calibre OPDS Reader'
+
+
+class LoadCancelled(Exception):
+    pass
+
+
+class RootCatalog(NamedTuple):
+    firstTitle: Optional[str]
+    catalogs: Dict[str, str]
+    serverHeader: str
+    header: Dict
+
+
+def openUrl(url, timeout=DEFAULT_TIMEOUT, headers=None):
+    requestHeaders = {'User-Agent': USER_AGENT, 'Accept': 'application/atom+xml,application/xml,*/*'}
+    requestHeaders.update(headers or {})
+    return httpClient.open(url, timeout, requestHeaders)
+
+
+def fetchUrl(url, timeout=DEFAULT_TIMEOUT):
+    '''Download the content of a URL, return a tuple (content, headers) with lowercased header names'''
+    with openUrl(url, timeout) as response:
+        headers = {k.lower(): v for k,v in response.headers.items()}
+        return response.read(), headers
+
+
+def loadRootCatalog(opdsUrl) -> RootCatalog:
+    '''Download the root catalog of a OPDS server: the first link of each entry is a catalog'''
+    # The links of the catalogs are without the credentials, kept by the HTTP client
+    opdsUrl = httpClient.addCredentials(opdsUrl)
+    content, headers = fetchUrl(opdsUrl)
+    header, entries = parseFeed(content, opdsUrl)
+    catalogs = {}
+    firstTitle = None
+    for entry in entries:
+        title = entry['title'] or 'No title'
+        if firstTitle is None:
+            firstTitle = title
+        firstLink = next(iter(entry['links']), None)
+        if firstLink is not None:
+            catalogs[title] = firstLink['href']
+    return RootCatalog(firstTitle, catalogs, headers.get('server', 'none'), header)
+
+
+def _splitUrl(url):
+    parsed = urlparse(url)
+    return parsed, parse_qsl(parsed.query, keep_blank_values=True)
+
+
+def urlKey(url) -> tuple:
+    '''Key of a URL, the same for the URLs that differ only by the order and the encoding of their query parameters'''
+    parsed, query = _splitUrl(url)
+    return parsed._replace(query='', fragment=''), tuple(sorted(query))
+
+
+def isSameUrl(url, otherUrl) -> bool:
+    return urlKey(url) == urlKey(otherUrl)
+
+
+class OffsetPredictor:
+    '''
+    Predict the URLs of the following pages of a feed that is paginated by an offset parameter,
+    from the URLs of two consecutive pages.
+    '''
+    
+    def __init__(self, parsedUrl, query, parameter, lastValue, step, totalResults):
+        self.parsedUrl = parsedUrl
+        self.query = query
+        self.parameter = parameter
+        self.lastValue = lastValue
+        self.step = step
+        self.totalResults = totalResults
+    
+    @classmethod
+    def fromUrls(cls, pageUrl, nextUrl, totalResults=None):
+        parsed, query = _splitUrl(pageUrl)
+        nextParsed, nextQuery = _splitUrl(nextUrl)
+        if parsed._replace(query='') != nextParsed._replace(query=''):
+            return None
+        values = dict(query)
+        nextValues = dict(nextQuery)
+        for parameter in OFFSET_PARAMETERS:
+            value, nextValue = values.get(parameter, ''), nextValues.get(parameter, '')
+            if not (value.isdigit() and nextValue.isdigit()):
+                continue
+            step = int(nextValue) - int(value)
+            if step <= 0:
+                return None
+            # All the other parameters must be identical
+            if sorted((k,v) for k,v in query if k != parameter) != sorted((k,v) for k,v in nextQuery if k != parameter):
+                return None
+            return cls(nextParsed, nextQuery, parameter, int(nextValue), step, totalResults)
+        return None
+    
+    def predictNextUrl(self) -> Optional[str]:
+        value = self.lastValue + self.step
+        if self.totalResults is not None:
+            # OpenSearch "startIndex" is 1-based
+            if value >= self.totalResults + (1 if self.parameter == 'startIndex' else 0):
+                return None
+        self.lastValue = value
+        query = [(k, str(value) if k == self.parameter else v) for k,v in self.query]
+        return self.parsedUrl._replace(query=urlencode(query)).geturl()
+
+
+_endOfPage = object()
+
+
+class FeedPage:
+    '''
+    A page of a feed, downloaded and parsed in a worker thread.
+    
+    The header of the feed (and so the link to the next page) is available as soon as it is read,
+    and the entries can be iterated while the rest of the page is still downloaded.
+    The header read before the entries is replaced by the final header of the page once it is parsed,
+    with the values of the feed that follow the entries.
+    '''
+    
+    def __init__(self, url):
+        self.url = url
+        self.headers = {}
+        self.header = {}
+        self.error = None
+        self.fromCache = False
+        self.size = 0
+        self._headerRead = threading.Event()
+        self._finished = threading.Event()
+        self._entries = Queue()
+    
+    @classmethod
+    def fromEntries(cls, url, header, entries, fromCache=False, size=0) -> 'FeedPage':
+        '''A page whose entries are already read'''
+        page = cls(url)
+        page.fromCache = fromCache
+        page.size = size
+        page._setHeader(header)
+        page._putEntries(entries)
+        page._finish()
+        return page
+    
+    @property
+    def nextUrl(self) -> Optional[str]:
+        return self.header.get('next')
+    
+    @property
+    def totalResults(self) -> Optional[int]:
+        return self.header.get('totalResults')
+    
+    def waitHeader(self):
+        self._headerRead.wait()
+        if self.error is not None:
+            raise self.error
+    
+    def waitFinished(self):
+        '''Wait for the end of the page, the header is then final'''
+        self._finished.wait()
+    
+    def entries(self) -> Iterator[Dict]:
+        while True:
+            batch = self._entries.get()
+            if batch is _endOfPage:
+                if self.error is not None:
+                    raise self.error
+                return
+            yield from batch
+    
+    # Called by the worker thread
+    
+    def _setHeader(self, header):
+        # Set again with the final header at the end of the page
+        self.header = header
+        self._headerRead.set()
+    
+    def _putEntries(self, entries: List[Dict]):
+        if entries:
+            self._entries.put(entries)
+    
+    def _finish(self, error=None):
+        self.error = error
+        self._headerRead.set()
+        self._finished.set()
+        self._entries.put(_endOfPage)
+
+
+class PageFetcher:
+    '''
+    Download and parse the pages of a paginated feed.
+    
+    The next page is requested as soon as its URL is read in the header of the current page,
+    while the entries of the current page are parsed and returned to the caller.
+    When the pages are selected by an offset parameter, a window of the following pages is downloaded
+    in parallel. The pages are always returned in the order of the feed.
+    The requests, the download and the parsing of the pages are measured in "metrics" (see LoadMetrics).
+    '''
+    
+    def __init__(self, maxConcurrency=4, window=None, timeout=DEFAULT_TIMEOUT, cache=None, cancelEvent=None,
+                 metrics=None):
+        self.maxConcurrency = max(1, maxConcurrency)
+        self.window = max(1, window or self.maxConcurrency * 2)
+        self.timeout = timeout
+        self.cache = cache
+        # Set from another thread to stop the download, the pages raise LoadCancelled
+        self.cancelEvent = cancelEvent or threading.Event()
+        self.metrics = metrics or NO_METRICS
+    
+    def checkCancelled(self):
+        if self.cancelEvent.is_set():
+            raise LoadCancelled()
+    
+    def load(self, page: FeedPage):
+        metrics = self.metrics
+        start = time.perf_counter()
+        cached = None
+        if self.cache:
+            with metrics.phase('cache read'):
+                cached = self.cache.get(page.url)
+        requestHeaders = {}
+        if cached:
+            if cached.etag:
+                requestHeaders['If-None-Match'] = cached.etag
+            if cached.lastModified:
+                requestHeaders['If-Modified-Since'] = cached.lastModified
+        try:
+            self.checkCancelled()
+            metrics.count('requests')
+            try:
+                with metrics.phase('request'):
+                    response = openUrl(page.url, self.timeout, requestHeaders)
+            except HTTPError as e:
+                if cached and e.code == 304:
+                    metrics.count('not modified')
+                    self.cache.touch(page.url)
+                    page.fromCache = True
+                    page._setHeader(cached.header)
+                    page._putEntries(cached.entries)
+                    page._finish()
+                    metrics.event('page', url=page.url, entries=len(cached.entries), bytes=0, fromCache=True,
+                                  seconds=round(time.perf_counter() - start, 6))
+                    return
+                raise
+            with response:
+                page.headers = {k.lower(): v for k,v in response.headers.items()}
+                parser = OpdsFeedParser(response.geturl() or page.url)
+                pageEntries = []
+                while True:
+                    with metrics.phase('download'):
+                        chunk = response.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    self.checkCancelled()
+                    page.size += len(chunk)
+                    with metrics.phase('parse'):
+                        entries = parser.feedData(chunk)
+                    if parser.headerComplete and not page._headerRead.is_set():
+                        # A copy: the parser still adds the values of the feed that follow the entries
+                        page._setHeader(dict(parser.header, links=list(parser.header['links'])))
+                    page._putEntries(entries)
+                    pageEntries.extend(entries)
+                with metrics.phase('parse'):
+                    entries = parser.close()
+                if parser.isMalformed:
+                    metrics.count('feedparser fallbacks')
+                page._setHeader(parser.header)
+                page._putEntries(entries)
+                pageEntries.extend(entries)
+            metrics.count('bytes', page.size)
+            etag, lastModified = page.headers.get('etag'), page.headers.get('last-modified')
+            if self.cache and (etag or lastModified):
+                with metrics.phase('cache write'):
+                    self.cache.put(page.url, etag, lastModified, parser.header, pageEntries)
+        except Exception as e:
+            metrics.count('failed requests')
+            page._finish(e)
+        else:
+            page._finish()
+            metrics.event('page', url=page.url, entries=len(pageEntries), bytes=page.size, fromCache=False,
+                          seconds=round(time.perf_counter() - start, 6))
+    
+    def pages(self, url, window=None) -> Iterator[FeedPage]:
+        window = window or self.window
+        # The pages are cached and shown without the credentials
+        url = httpClient.addCredentials(url)
+        executor = ThreadPoolExecutor(max_workers=self.maxConcurrency)
+        pending = deque()
+        
+        def submit(url):
+            page = FeedPage(url)
+            pending.append((page, executor.submit(self.load, page)))
+        
+        try:
+            submit(url)
+            predictor = None
+            while pending:
+                self.checkCancelled()
+                page, _ = pending.popleft()
+                page.waitHeader()
+                # Without "next" link before the entries, the link can still follow them: it is read
+                # in the final header, once the page is returned and parsed. The predicted pages are kept until then
+                lateLink = page.nextUrl is None
+                if lateLink:
+                    yield page
+                    page.waitFinished()
+                nextUrl = page.nextUrl
+                
+                if nextUrl is None:
+                    self._cancel(pending)
+                    predictor = None
+                elif not pending or not isSameUrl(pending[0][0].url, nextUrl):
+                    # Nothing requested yet, or a wrong prediction: follow the link of the feed
+                    self._cancel(pending)
+                    submit(nextUrl)
+                    predictor = OffsetPredictor.fromUrls(page.url, nextUrl, page.totalResults)
+                
+                if predictor:
+                    while len(pending) < window:
+                        predictedUrl = predictor.predictNextUrl()
+                        if predictedUrl is None:
+                            break
+                        submit(predictedUrl)
+                
+                if not lateLink:
+                    yield page
+        finally:
+            # The loads already running are waited for: none of them writes in the cache after the pages are closed
+            self._cancel(pending)
+            executor.shutdown(wait=True)
+    
+    def deltaPages(self, url) -> Iterator[FeedPage]:
+        '''
+        Load only the beginning of a feed sorted by date added, the most recent first (like the "Newest"
+        catalog of calibre): the pages are loaded until a run of DELTA_KNOWN_ENTRIES consecutive entries
+        of the last load, then the other entries of the last load are returned as a last page, from the cache.
+        
+        The entries are recognized by their id, not by their "updated" date: calibre gives to all
+        the entries the date of the last change of the library, and the other servers don't always
+        sort the feed by this date. The changes of the entries after the run are not loaded.
+        The entries of the feed are saved once they are all returned.
+        Without cache or without previous load, all the pages are loaded.
+        The entries removed from the feed since the last complete load are not detected.
+        '''
+        url = httpClient.addCredentials(url)
+        previous = self.cache.getCatalog(url) if self.cache else None
+        if previous is None:
+            entries = []
+            for page in self.pages(url):
+                pageEntries = list(page.entries())
+                entries.extend(pageEntries)
+                yield FeedPage.fromEntries(page.url, page.header, pageEntries, page.fromCache, page.size)
+            if self.cache:
+                self.cache.putCatalog(url, entries)
+            return
+        
+        knownIds = {entry['id'] for entry in previous.entries if entry['id']}
+        newEntries = []
+        knownRun = 0
+        # The following pages are probably not needed, don't request them in advance
+        for page in self.pages(url, window=1):
+            pageEntries = list(page.entries())
+            for entry in pageEntries:
+                knownRun = knownRun + 1 if entry['id'] in knownIds else 0
+                if knownRun >= DELTA_KNOWN_ENTRIES:
+                    break
+            newEntries.extend(pageEntries)
+            yield FeedPage.fromEntries(page.url, page.header, pageEntries, page.fromCache, page.size)
+            if knownRun >= DELTA_KNOWN_ENTRIES:
+                break
+        
+        entries = newEntries
+        if knownRun >= DELTA_KNOWN_ENTRIES:
+            # The entries loaded again replace their previous version
+            newIds = {entry['id'] for entry in newEntries if entry['id']}
+            oldEntries = [entry for entry in previous.entries if not entry['id'] or entry['id'] not in newIds]
+            yield FeedPage.fromEntries(url, {}, oldEntries, fromCache=True)
+            entries = newEntries + oldEntries
+        self.cache.putCatalog(url, entries)
+    
+    def _cancel(self, pending):
+        for _, future in pending:
+            future.cancel()
+        pending.clear()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+import re
+from array import array
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from .catalog_entry import CatalogEntry
+
+BITS_TYPE = 'I'
+MAX_PREDICATES = array(BITS_TYPE).itemsize * 8
+
+# calibre download links: .../get/<format>/<book id>..., else the extension of the file
+_calibreFormat = re.compile(r'/get/([^/]+)/\d+')
+_extension = re.compile(r'\.(\w+)$')
+
+
+def linkFormat(url) -> str:
+    '''The format of a download link, in lower case, "" if unknown'''
+    path = url.split('?', 1)[0].split('#', 1)[0]
+    match = _calibreFormat.search(path) or _extension.search(path)
+    return match.group(1).lower() if match else ''
+
+
+def tagPredicate(tags: Iterable[str]) -> Callable[[CatalogEntry], bool]:
+    '''Hide the books with one of the tags'''
+    tags = frozenset(tags)
+    return lambda book: not tags.isdisjoint(book.tags)
+
+
+def formatPredicate(formats: Iterable[str]) -> Callable[[CatalogEntry], bool]:
+    '''Hide the books that can't be downloaded in one of the formats'''
+    formats = frozenset(f.lower() for f in formats)
+    return lambda book: not any(linkFormat(url) in formats for url in book.links)
+
+
+class FilterBits:
+    '''
+    Result of the filters of the book list, computed once by book.
+    
+    Each filter is a predicate (True to hide the book) with a bit in the mask of each book:
+    the predicate of a filter is only evaluated for all the books when the filter is first enabled,
+    then for the books appended. Enabling or disabling a filter again only changes the mask
+    of the active filters, the books shown are selected from the cached bits.
+    The books are identified by their index in the list of the model.
+    '''
+    
+    def __init__(self):
+        self._bits = array(BITS_TYPE)
+        self._predicates: Dict[str, Tuple[int, Callable[[CatalogEntry], bool]]] = {}
+        # The filters whose bits are computed for all the books, and the filters enabled
+        self._computed = 0
+        self._active = 0
+    
+    def __len__(self) -> int:
+        return len(self._bits)
+    
+    def setPredicate(self, name, predicate: Callable[[CatalogEntry], bool], books: List[CatalogEntry] = ()):
+        '''Add a filter, or replace the predicate of a filter: the bits of a enabled filter are computed again'''
+        if name in self._predicates:
+            bit = self._predicates[name][0]
+            self._computed &= ~bit
+        else:
+            used = 0
+            for bit, _predicate in self._predicates.values():
+                used |= bit
+            bit = next((1 << i for i in range(MAX_PREDICATES) if not used & (1 << i)), 0)
+            if not bit:
+                raise ValueError(f'More than {MAX_PREDICATES} filters')
+        self._predicates[name] = (bit, predicate)
+        if self._active & bit:
+            self.compute(name, books)
+    
+    def removePredicate(self, name):
+        bit, _predicate = self._predicates.pop(name, (0, None))
+        self._computed &= ~bit
+        self._active &= ~bit
+        if bit:
+            bits = self._bits
+            for i in range(len(bits)):
+                bits[i] &= ~bit
+    
+    def hasPredicate(self, name) -> bool:
+        return name in self._predicates
+    
+    def isComputed(self, name) -> bool:
+        return name in self._predicates and bool(self._computed & self._predicates[name][0])
+    
+    def isActive(self, name) -> bool:
+        return name in self._predicates and bool(self._active & self._predicates[name][0])
+    
+    def setActive(self, name, active, books: List[CatalogEntry]) -> bool:
+        '''Enable or disable a filter, return True if it changed'''
+        bit = self._predicates[name][0]
+        if bool(self._active & bit) == bool(active):
+            return False
+        if active:
+            if not self._computed & bit:
+                self.compute(name, books)
+            self._active |= bit
+        else:
+            self._active &= ~bit
+        return True
+    
+    def compute(self, name, books: List[CatalogEntry], indexes: Iterable[int] = None):
+        '''Evaluate a predicate for all the books, or only the books of the indexes'''
+        bit, predicate = self._predicates[name]
+        bits = self._bits
+        # All the books are read in order: the store of the books may not be in memory
+        for i, book in enumerate(books) if indexes is None else ((i, books[i]) for i in indexes):
+            if predicate(book):
+                bits[i] |= bit
+            else:
+                bits[i] &= ~bit
+        if indexes is None:
+            self._computed |= bit
+    
+    def append(self, books: List[CatalogEntry]):
+        '''Compute the bits of the books appended to the list, for the filters already computed'''
+        predicates = [(bit, predicate) for bit, predicate in self._predicates.values() if self._computed & bit]
+        for book in books:
+            mask = 0
+            for bit, predicate in predicates:
+                if predicate(book):
+                    mask |= bit
+            self._bits.append(mask)
+    
+    def clear(self):
+        # Without books, the filters computed stay computed: the bits of the next books are computed when appended
+        self._bits = array(BITS_TYPE)
+    
+    def isHidden(self, index) -> bool:
+        return bool(self._bits[index] & self._active)
+    
+    def visibleIndexes(self, start=0) -> List[int]:
+        '''The indexes of the books not hidden by the active filters, from the index "start"'''
+        active = self._active
+        bits = self._bits
+        if not active:
+            return list(range(start, len(bits)))
+        return [i for i in range(start, len(bits)) if not bits[i] & active]
@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+import base64
+import http.client
+import io
+import ssl
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+from urllib.error import HTTPError, URLError
+from urllib.parse import unquote, urljoin, urlparse
+from urllib.request import Request, getproxies, proxy_bypass, urlopen
+
+CONNECT_TIMEOUT = 15
+# The servers close the idle connections after a while, don't reuse the older ones
+MAX_IDLE_TIME = 30
+MAX_REDIRECTS = 10
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+# The body of the error responses is read to reuse the connection, up to this size
+MAX_ERROR_BODY = 64 * 1024
+READ_SIZE = 64 * 1024
+
+
+def splitCredentials(url) -> Tuple[str, Optional[str]]:
+    '''The URL without its user:password, and the value of their Basic Authorization header (None without them)'''
+    parsed = urlparse(url)
+    if parsed.username is None:
+        return url, None
+    credentials = (unquote(parsed.username) + ':' + unquote(parsed.password or '')).encode('utf-8')
+    netloc = parsed.netloc.rpartition('@')[2]
+    return parsed._replace(netloc=netloc).geturl(), 'Basic ' + base64.b64encode(credentials).decode('ascii')
+
+
+class HttpResponse:
+    '''
+    Response of HttpClient, with the interface of the responses of urlopen used by the plugin.
+    The content is decompressed while it is read. The connection goes back to the pool
+    when the response is closed after reading the whole content.
+    '''
+    
+    def __init__(self, client, key, connection, response, url):
+        self._client = client
+        self._key = key
+        self._connection = connection
+        self._response = response
+        self.url = url
+        self.status = self.code = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+        self._buffer = b''
+        self._eof = False
+        encoding = response.headers.get('Content-Encoding', '').strip().lower()
+        if encoding in ('gzip', 'x-gzip'):
+            self._decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            self._decoder = zlib.decompressobj()
+        else:
+            self._decoder = None
+        self._firstChunk = True
+    
+    def geturl(self) -> str:
+        return self.url
+    
+    def getcode(self) -> int:
+        return self.status
+    
+    def info(self):
+        return self.headers
+    
+    def read(self, size=-1) -> bytes:
+        if size is None or size < 0:
+            chunks = [self._buffer]
+            self._buffer = b''
+            while not self._eof:
+                chunks.append(self._readChunk())
+            return b''.join(chunks)
+        while len(self._buffer) < size and not self._eof:
+            self._buffer += self._readChunk()
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+    
+    def _readChunk(self) -> bytes:
+        data = self._response.read(READ_SIZE)
+        if not data:
+            self._eof = True
+            return self._decoder.flush() if self._decoder else b''
+        if self._decoder is None:
+            return data
+        if self._firstChunk:
+            self._firstChunk = False
+            try:
+                return self._decoder.decompress(data)
+            except zlib.error:
+                # Some servers send "deflate" without the zlib header
+                self._decoder = zlib.decompressobj(-zlib.MAX_WBITS)
+        return self._decoder.decompress(data)
+    
+    def close(self):
+        if self._connection is None:
+            return
+        connection, self._connection = self._connection, None
+        if self._eof and not self._response.will_close:
+            self._client._release(self._key, connection)
+        else:
+            connection.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *args):
+        self.close()
+
+
+class HttpClient:
+    '''
+    HTTP client shared by all the requests of the plugin: the connections are kept alive in a pool
+    by server and reused by the next requests (the TLS handshake is done once by connection),
+    the content is transferred compressed when the server supports it.
+    
+    Like urlopen, the redirections are followed and the errors are raised as HTTPError
+    (also for "304 Not Modified") or URLError. When a proxy is configured, the requests
+    are made by urlopen.
+    
+    The user:password of a URL are sent as Basic authorization, also to the other URLs of the
+    same server (the next pages, the books and the covers have no credentials in their links).
+    '''
+    
+    def __init__(self, maxIdlePerHost=8, connectTimeout=CONNECT_TIMEOUT):
+        self.maxIdlePerHost = maxIdlePerHost
+        self.connectTimeout = connectTimeout
+        self.connectionsOpened = 0
+        self.requests = 0
+        self._idle: Dict[Tuple[str, str, int], List[Tuple[http.client.HTTPConnection, float]]] = {}
+        self._authorizations: Dict[Tuple[str, str, int], str] = {}
+        self._lock = threading.Lock()
+        self._proxies = getproxies()
+        self._sslContext = None
+    
+    def open(self, url, timeout, headers: Optional[Dict[str, str]] = None) -> HttpResponse:
+        headers = dict(headers or {})
+        url = self.addCredentials(url)
+        if self._useProxy(url):
+            return urlopen(Request(url, headers=self._authorize(url, headers)), timeout=timeout)
+        headers.setdefault('Accept-Encoding', 'gzip, deflate')
+        for _redirect in range(MAX_REDIRECTS + 1):
+            response = self._request(url, timeout, headers)
+            if response.status in REDIRECT_STATUSES and response.headers.get('Location'):
+                self._discard(response)
+                url = self.addCredentials(urljoin(url, response.headers['Location']))
+                continue
+            if response.status >= 300:
+                body = self._discard(response)
+                raise HTTPError(url, response.status, response.reason, response.headers, io.BytesIO(body))
+            return response
+        raise HTTPError(url, response.status, 'Too many redirections', response.headers, None)
+    
+    def closeIdleConnections(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection, _lastUsed in connections:
+                connection.close()
+    
+    @staticmethod
+    def _key(parsed) -> Tuple[str, str, int]:
+        return parsed.scheme, parsed.hostname, parsed.port or (443 if parsed.scheme == 'https' else 80)
+    
+    def addCredentials(self, url) -> str:
+        '''Keep the credentials of the URL for its server, return the URL without them'''
+        url, authorization = splitCredentials(url)
+        if authorization is not None:
+            with self._lock:
+                self._authorizations[self._key(urlparse(url))] = authorization
+        return url
+    
+    def _authorize(self, url, headers) -> Dict[str, str]:
+        '''The headers of a request, with the authorization of its server'''
+        with self._lock:
+            authorization = self._authorizations.get(self._key(urlparse(url)))
+        if authorization is not None and 'Authorization' not in headers:
+            headers = dict(headers, Authorization=authorization)
+        return headers
+    
+    def _useProxy(self, url) -> bool:
+        scheme = urlparse(url).scheme
+        return scheme in self._proxies and not proxy_bypass(urlparse(url).hostname or '')
+    
+    def _request(self, url, timeout, headers) -> HttpResponse:
+        parsed = urlparse(url)
+        if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+            raise URLError(f'unknown url type: {url}')
+        key = self._key(parsed)
+        path = (parsed.path or '/') + ('?' + parsed.query if parsed.query else '')
+        headers = self._authorize(url, headers)
+        with self._lock:
+            self.requests += 1
+        while True:
+            connection, reused = self._acquire(key, timeout)
+            try:
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+            except (ConnectionResetError, BrokenPipeError, http.client.BadStatusLine) as e:
+                connection.close()
+                if reused:
+                    # Closed by the server while it was idle, try the next one
+                    continue
+                raise URLError(e) from e
+            except OSError as e:
+                connection.close()
+                raise URLError(e) from e
+            except BaseException:
+                connection.close()
+                raise
+            return HttpResponse(self, key, connection, response, url)
+    
+    def _acquire(self, key, timeout) -> Tuple[http.client.HTTPConnection, bool]:
+        now = time.monotonic()
+        with self._lock:
+            connections = self._idle.get(key, [])
+            while connections:
+                connection, lastUsed = connections.pop()
+                if now - lastUsed < MAX_IDLE_TIME:
+                    connection.sock.settimeout(timeout)
+                    return connection, True
+                connection.close()
+        return self._connect(key, timeout), False
+    
+    def _connect(self, key, timeout) -> http.client.HTTPConnection:
+        scheme, host, port = key
+        if scheme == 'https':
+            if self._sslContext is None:
+                self._sslContext = ssl.create_default_context()
+            connection = http.client.HTTPSConnection(host, port, timeout=self.connectTimeout, context=self._sslContext)
+        else:
+            connection = http.client.HTTPConnection(host, port, timeout=self.connectTimeout)
+        try:
+            connection.connect()
+        except OSError as e:
+            connection.close()
+            raise URLError(e) from e
+        connection.sock.settimeout(timeout)
+        with self._lock:
+            self.connectionsOpened += 1
+        return connection
+    
+    def _release(self, key, connection):
+        with self._lock:
+            connections = self._idle.setdefault(key, [])
+            if len(connections) < self.maxIdlePerHost:
+                connections.append((connection, time.monotonic()))
+                return
+        connection.close()
+    
+    def _discard(self, response: HttpResponse) -> bytes:
+        '''Read the small bodies to reuse the connection'''
+        body = response.read(MAX_ERROR_BODY)
+        # Not reused if the body was not read to the end
+        response.close()
+        return body
+
+
+# The client of all the requests of the plugin
+httpClient = HttpClient()
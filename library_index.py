@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+import re
+from typing import Dict, Iterable, NamedTuple, Set
+
+_whitespaces = re.compile(r'\s+')
+
+
+def normalizeText(text) -> str:
+    '''Normalize a title or an author for the comparison: case and whitespaces are ignored'''
+    return _whitespaces.sub(' ', text or '').strip().casefold()
+
+
+class TimestampMatches(NamedTuple):
+    timestamps: Dict[int, object]
+    matched: int
+    ambiguous: int
+    unmatched: int
+
+
+class LibraryIndex:
+    '''
+    In-memory index of the books of the local library, to know if a book of a catalog
+    is already in the library without querying the database for each book.
+    
+    A book is found by its UUID, by one of its identifiers or by its title and one of its authors
+    (only by its title if it has no author).
+    Each key is mapped to the ids of the books of the library, the books added from a catalog have no id.
+    '''
+    
+    def __init__(self, db=None):
+        self.uuids: Dict[str, int] = {}
+        self.identifiers: Dict[tuple, Set[int]] = {}
+        self.titleAuthors: Dict[tuple, Set[int]] = {}
+        self.titles: Dict[str, Set[int]] = {}
+        if db is not None:
+            self.addLibrary(db)
+    
+    def __len__(self) -> int:
+        return len(self.uuids)
+    
+    def addLibrary(self, db):
+        bookIds = db.all_book_ids()
+        uuids = db.all_field_for('uuid', bookIds)
+        titles = db.all_field_for('title', bookIds)
+        authors = db.all_field_for('authors', bookIds)
+        identifiers = db.all_field_for('identifiers', bookIds)
+        for bookId in bookIds:
+            self.addEntry(uuids.get(bookId), titles.get(bookId), authors.get(bookId), identifiers.get(bookId), bookId)
+    
+    def addBook(self, book):
+        self.addEntry(book.uuid, book.title, book.authors, book.get_identifiers())
+    
+    def addBooks(self, books: Iterable):
+        for book in books:
+            self.addBook(book)
+    
+    def addEntry(self, uuid, title, authors, identifiers, bookId=None):
+        if uuid:
+            self.uuids.setdefault(uuid, bookId)
+        for key in self.identifierKeys(identifiers):
+            self.identifiers.setdefault(key, set()).add(bookId)
+        for key in self.titleAuthorKeys(title, authors):
+            self.titleAuthors.setdefault(key, set()).add(bookId)
+        title = normalizeText(title)
+        if title:
+            self.titles.setdefault(title, set()).add(bookId)
+    
+    def hasBook(self, book) -> bool:
+        # The UUID is the cheapest and most reliable test, and the most frequent
+        # with a calibre server, so check it first
+        if book.uuid and book.uuid in self.uuids:
+            return True
+        for key in self.identifierKeys(book.get_identifiers()):
+            if key in self.identifiers:
+                return True
+        for key in self.titleAuthorKeys(book.title, book.authors):
+            if key[1] and key in self.titleAuthors:
+                return True
+            if not key[1] and key[0] in self.titles:
+                return True
+        return False
+    
+    def findBookIds(self, book) -> Set[int]:
+        '''
+        Ids of the books of the library identical to a book: the book with the same UUID,
+        else the books with the same title and one of the same authors
+        '''
+        if book.uuid and self.uuids.get(book.uuid) is not None:
+            return {self.uuids[book.uuid]}
+        bookIds = set()
+        for key in self.titleAuthorKeys(book.title, book.authors):
+            if key[1]:
+                bookIds.update(self.titleAuthors.get(key, ()))
+            else:
+                bookIds.update(self.titles.get(key[0], ()))
+        bookIds.discard(None)
+        return bookIds
+    
+    def matchTimestamps(self, books: Iterable) -> TimestampMatches:
+        '''
+        Map the ids of the books of the library identical to the given books to the timestamps of these books.
+        A book is ambiguous when several books of the library are identical to it, they are all updated.
+        '''
+        timestamps = {}
+        matched = ambiguous = unmatched = 0
+        for book in books:
+            bookIds = self.findBookIds(book)
+            if not bookIds:
+                unmatched += 1
+                continue
+            if len(bookIds) == 1:
+                matched += 1
+            else:
+                ambiguous += 1
+            timestamp = book.getTimestamp()
+            for bookId in bookIds:
+                timestamps[bookId] = timestamp
+        return TimestampMatches(timestamps, matched, ambiguous, unmatched)
+    
+    @staticmethod
+    def identifierKeys(identifiers):
+        for identifierType, value in (identifiers or {}).items():
+            if value:
+                yield identifierType.lower(), value.strip().lower()
+    
+    @staticmethod
+    def titleAuthorKeys(title, authors):
+        title = normalizeText(title)
+        if not title:
+            return
+        authors = [normalizeText(a) for a in authors or []]
+        authors = [a for a in authors if a]
+        if not authors:
+            yield title, ''
+        for author in authors:
+            yield title, author
@@ -0,0 +1,522 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+try:
+    load_translations()
+except NameError:
+    pass  # load_translations() added in calibre 1.9
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from queue import Empty, Queue
+from typing import Dict, List, Set
+from urllib.parse import urlparse
+
+try:
+    from qt.core import QImage, QObject, QPixmap, Qt, QThread, pyqtSignal
+except ImportError:
+    from PyQt5.Qt import QImage, QObject, QPixmap, Qt, QThread, pyqtSignal
+
+from .calibre_rest import BOOKS_BY_REQUEST, downloadCalibreTimestamps
+from .catalog_entry import CatalogEntry, entriesFromOpds
+from .common_utils import debug_print
+from .crawler import CatalogCrawler
+from .downloader import DownloadQueue
+from .fetcher import LoadCancelled, PageFetcher, loadRootCatalog
+from .metrics import LoadMetrics
+from .opensearch import searchUrl
+from .thumbnails import LruCache, ThumbnailFetcher
+
+# Pages downloaded in advance in the on demand mode
+PREFETCH_PAGES = 2
+
+THUMBNAIL_HEIGHT = 60
+# Memory used by the thumbnails decoded, the least recently shown are removed
+THUMBNAIL_MEMORY = 32 * 1024 * 1024
+
+
+class LoadProgress:
+    def __init__(self):
+        self.start = time.monotonic()
+        self.pages = 0
+        self.entries = 0
+        self.bytes = 0
+        self.totalEntries = None
+        # The sub-catalogs not loaded, when the maximum of sub-catalogs is reached
+        self.skippedFeeds = 0
+    
+    def elapsed(self) -> float:
+        return time.monotonic() - self.start
+    
+    def rate(self) -> float:
+        return self.bytes / max(self.elapsed(), 0.001)
+    
+    def text(self) -> str:
+        text = _('{pages} pages, {entries} books, {size:.1f} MiB ({rate:.0f} KiB/s)').format(
+            pages=self.pages,
+            entries=self.entries,
+            size=self.bytes / (1024 * 1024),
+            rate=self.rate() / 1024,
+        )
+        if self.skippedFeeds:
+            text = _('{text}, maximum of sub-catalogs reached: {skipped} not loaded').format(
+                text=text, skipped=self.skippedFeeds,
+            )
+        return text
+
+
+class RootCatalogLoader(QThread):
+    '''Download the root catalog of a OPDS server in a worker thread'''
+    
+    rootCatalogLoaded = pyqtSignal(object)
+    loadFailed = pyqtSignal(object)
+    
+    def __init__(self, parent, opdsUrl):
+        QThread.__init__(self, parent)
+        self.opdsUrl = opdsUrl
+    
+    def run(self):
+        try:
+            self.rootCatalogLoaded.emit(loadRootCatalog(self.opdsUrl))
+        except Exception as e:
+            self.loadFailed.emit(e)
+
+
+class CatalogLoader(QThread):
+    '''
+    Download the pages of a catalog in a worker thread.
+    
+    The books of each page are sent to the GUI thread by booksLoaded. For a calibre server,
+    the timestamps of the books are sent by timestampsLoaded, as lists of tuples (book, timestamp):
+    they are requested by chunks of BOOKS_BY_REQUEST books while the next pages are loaded,
+    so the loader only holds the books of the chunks in progress.
+    cancel() stops the requests in progress.
+    
+    For a search on the server, the URL of the first page of the results is built
+    from the search link of the catalog and the search terms.
+    
+    For a delta load, only the books added since the last load of the catalog are downloaded,
+    the other books come from the cache (see PageFetcher.deltaPages).
+    With crawlDepth, the books of the sub-catalogs are also loaded, up to this depth and at most maxFeeds
+    catalogs (see CatalogCrawler). The sub-catalogs skipped beyond maxFeeds are counted in the progress.
+    
+    In the on demand mode, only the first page is loaded, then the loader waits (and sends waitingForDemand)
+    until loadMore() or loadAll() is called, with PREFETCH_PAGES pages downloaded in advance.
+    Before waiting, the timestamps of the last books loaded are requested from a calibre server.
+    
+    The phases of the load are measured in "metrics", shared with the model of the dialog.
+    '''
+    
+    booksLoaded = pyqtSignal(object)
+    timestampsLoaded = pyqtSignal(object)
+    progressChanged = pyqtSignal(object)
+    loadFailed = pyqtSignal(object)
+    waitingForDemand = pyqtSignal()
+    
+    def __init__(self, parent, catalogUrl, maxConcurrency, feedCache=None, calibreServer=False,
+                 searchLink=None, searchTerms=None, delta=False, crawlDepth=0, onDemand=False, maxFeeds=1000):
+        QThread.__init__(self, parent)
+        self.catalogUrl = catalogUrl
+        self.maxConcurrency = maxConcurrency
+        self.feedCache = feedCache
+        self.calibreServer = calibreServer
+        self.searchLink = searchLink
+        self.searchTerms = searchTerms
+        self.delta = delta and searchLink is None
+        self.crawlDepth = crawlDepth if searchLink is None else 0
+        self.maxFeeds = maxFeeds
+        self.cancelEvent = threading.Event()
+        self.progress = LoadProgress()
+        self.metrics = LoadMetrics(catalogUrl)
+        self.onDemand = onDemand and self.crawlDepth == 0
+        # The pages loaded before waiting for the demand, None to load all the pages
+        self.pagesWanted = 1 if self.onDemand else None
+        self.waiting = False
+        self._demand = threading.Condition()
+        # The books waiting for their timestamps, and the requests of the chunks
+        self._timestampBooks: List[CatalogEntry] = []
+        self._timestampFutures = []
+        self._timestampExecutor = None
+    
+    def cancel(self):
+        self.cancelEvent.set()
+        with self._demand:
+            self._demand.notify_all()
+    
+    def isCancelled(self) -> bool:
+        return self.cancelEvent.is_set()
+    
+    def canLoadMore(self) -> bool:
+        return self.waiting and not self.isCancelled()
+    
+    def loadMore(self, pages=1):
+        with self._demand:
+            if self.pagesWanted is not None:
+                self.pagesWanted = max(self.pagesWanted, self.progress.pages + pages)
+            self.waiting = False
+            self._demand.notify_all()
+    
+    def loadAll(self):
+        with self._demand:
+            self.pagesWanted = None
+            self.waiting = False
+            self._demand.notify_all()
+    
+    def run(self):
+        try:
+            if self.searchLink is not None:
+                self.catalogUrl = searchUrl(self.searchLink, self.searchTerms)
+                debug_print('Search URL:', self.catalogUrl)
+            self.loadCatalog()
+            self.waitTimestamps()
+        except LoadCancelled:
+            debug_print('Catalog loading cancelled:', self.catalogUrl)
+        except Exception as e:
+            debug_print('Failed loading the catalog:', self.catalogUrl, e)
+            self.loadFailed.emit(e)
+        finally:
+            if self._timestampExecutor is not None:
+                for future in self._timestampFutures:
+                    future.cancel()
+                self._timestampExecutor.shutdown(wait=False)
+            if self.feedCache:
+                with self.metrics.phase('cache eviction'):
+                    self.feedCache.evict()
+                self.feedCache.close()
+            self.metrics.finish()
+            debug_print('Catalog load metrics:', self.catalogUrl, '\n' + self.metrics.text())
+    
+    def loadCatalog(self):
+        if self.crawlDepth > 0:
+            self.crawlCatalog()
+            return
+        window = PREFETCH_PAGES if self.onDemand else None
+        fetcher = PageFetcher(self.maxConcurrency, window, cache=self.feedCache, cancelEvent=self.cancelEvent,
+                              metrics=self.metrics)
+        cachedPages = 0
+        pages = fetcher.deltaPages(self.catalogUrl) if self.delta else fetcher.pages(self.catalogUrl)
+        for page in pages:
+            with self.metrics.phase('wait for the pages'):
+                entries = list(page.entries())
+            with self.metrics.phase('convert'):
+                books = entriesFromOpds(entries)
+            self.metrics.count('pages')
+            self.metrics.count('books', len(books))
+            if self.isCancelled():
+                break
+            self.booksLoaded.emit(books)
+            if self.calibreServer:
+                self.queueTimestamps(books)
+            cachedPages += page.fromCache
+            self.progress.pages += 1
+            self.progress.entries += len(books)
+            self.progress.bytes += page.size
+            if page.totalResults is not None:
+                self.progress.totalEntries = page.totalResults
+            self.progressChanged.emit(self.progress)
+            if page.nextUrl:
+                self.waitForDemand()
+        debug_print('Pages not modified since the last load:', cachedPages)
+    
+    def waitForDemand(self):
+        '''In the on demand mode, wait until more pages are wanted'''
+        with self._demand:
+            if self.pagesWanted is None or self.progress.pages < self.pagesWanted:
+                return
+        # The books shown get their timestamps while waiting
+        self.queueTimestamps([], flush=True)
+        with self._demand:
+            if self.pagesWanted is None or self.progress.pages < self.pagesWanted or self.isCancelled():
+                return
+            self.waiting = True
+            self.waitingForDemand.emit()
+            with self.metrics.phase('wait for the demand'):
+                while self.waiting and not self.isCancelled():
+                    self._demand.wait()
+    
+    def crawlCatalog(self):
+        crawler = CatalogCrawler(self.maxConcurrency, self.crawlDepth, self.maxFeeds, cache=self.feedCache,
+                                 cancelEvent=self.cancelEvent, metrics=self.metrics)
+        for feed in crawler.crawl(self.catalogUrl):
+            with self.metrics.phase('convert'):
+                books = entriesFromOpds(feed.entries)
+            self.metrics.count('pages', feed.pages)
+            self.metrics.count('books', len(books))
+            if books:
+                self.booksLoaded.emit(books)
+                if self.calibreServer:
+                    self.queueTimestamps(books)
+            self.progress.pages += feed.pages
+            self.progress.entries += len(books)
+            self.progress.bytes += feed.size
+            self.progress.skippedFeeds = crawler.skippedFeeds
+            self.progressChanged.emit(self.progress)
+        self.metrics.count('feeds', crawler.feeds)
+        self.metrics.count('duplicated books', crawler.duplicates)
+        self.metrics.count('skipped feeds', crawler.skippedFeeds)
+        debug_print('Catalogs crawled:', crawler.feeds, 'duplicated books:', crawler.duplicates,
+                    'skipped:', crawler.skippedFeeds)
+        for url, error in crawler.errors:
+            debug_print('Failed loading the sub-catalog:', url, error)
+    
+    def queueTimestamps(self, books: List[CatalogEntry], flush=False):
+        '''
+        Request the timestamps of the books from the calibre server by chunks of BOOKS_BY_REQUEST books,
+        in parallel with the load of the pages. With flush, the last books are requested without waiting
+        for a full chunk.
+        '''
+        self._timestampBooks.extend(books)
+        while len(self._timestampBooks) >= BOOKS_BY_REQUEST or (flush and self._timestampBooks):
+            chunk = self._timestampBooks[:BOOKS_BY_REQUEST]
+            del self._timestampBooks[:BOOKS_BY_REQUEST]
+            if self._timestampExecutor is None:
+                self._timestampExecutor = ThreadPoolExecutor(max_workers=self.maxConcurrency)
+            # The requests done are forgotten, with their books
+            self._timestampFutures = [future for future in self._timestampFutures if not future.done()]
+            self._timestampFutures.append(self._timestampExecutor.submit(self.loadTimestamps, chunk))
+    
+    def waitTimestamps(self):
+        '''Wait for the timestamps of all the books, the first failed request raises its error'''
+        if self.isCancelled():
+            raise LoadCancelled()
+        self.queueTimestamps([], flush=True)
+        futures, self._timestampFutures = self._timestampFutures, []
+        for future in futures:
+            future.result()
+        debug_print('Timestamps loaded from the calibre server:', self.metrics.counters.get('timestamps', 0))
+    
+    def loadTimestamps(self, books: List[CatalogEntry]):
+        for timestamps in downloadCalibreTimestamps(books, 1, self.cancelEvent, self.metrics):
+            self.timestampsLoaded.emit(timestamps)
+            self.metrics.count('timestamps', len(timestamps))
+
+
+class FederatedLoader(CatalogLoader):
+    '''
+    Load the catalog of the same title from several OPDS servers at once, in a worker thread by server.
+    
+    The books found on several servers are sent once, with the links and the sources (the hosts)
+    of all the servers: the books already sent that get the links of another server are sent
+    by booksMerged. The servers that fail are listed in "errors", the load fails only if they all fail.
+    The response time of the root catalog of each server is kept in "hostLatencies",
+    to download the books from the fastest server.
+    
+    The catalog has a URL by server, kept in "catalogUrls" once the root catalogs are loaded.
+    The timestamps are only loaded for the books of the calibre servers, listed in "calibreSources".
+    '''
+    
+    booksMerged = pyqtSignal(object)
+    
+    def __init__(self, parent, opdsUrls: List[str], catalogTitle, maxConcurrency, feedCache=None):
+        CatalogLoader.__init__(self, parent, ', '.join(opdsUrls), maxConcurrency, feedCache)
+        self.opdsUrls = opdsUrls
+        self.catalogTitle = catalogTitle
+        self.catalogUrls: Dict[str, str] = {}
+        self.calibreSources: Set[str] = set()
+        self.hostLatencies: Dict[str, float] = {}
+        self.errors = []
+    
+    def loadCatalog(self):
+        pages = Queue()
+        executor = ThreadPoolExecutor(max_workers=max(1, len(self.opdsUrls)))
+        # The pages use the cache: unlike the root catalogs, they are waited for before the cache is closed
+        pagesExecutor = ThreadPoolExecutor(max_workers=max(1, len(self.opdsUrls)))
+        futures = [executor.submit(self.loadServer, opdsUrl, pages, pagesExecutor) for opdsUrl in self.opdsUrls]
+        booksByKey = {}
+        remainingServers = len(futures)
+        try:
+            while remainingServers and not self.isCancelled():
+                try:
+                    # The root catalogs can't be cancelled, don't wait for them
+                    source, page, entries = pages.get(timeout=0.5)
+                except Empty:
+                    continue
+                if page is None:
+                    remainingServers -= 1
+                    continue
+                with self.metrics.phase('convert'):
+                    books = entriesFromOpds(entries)
+                newBooks = []
+                mergedBooks = []
+                with self.metrics.phase('merge'):
+                    for book in books:
+                        book.sources = (source,)
+                        key = book.key()
+                        existingBook = booksByKey.get(key)
+                        if existingBook is None:
+                            booksByKey[key] = book
+                            newBooks.append(book)
+                        else:
+                            existingBook.merge(book)
+                            mergedBooks.append(existingBook)
+                self.metrics.count('pages')
+                self.metrics.count('books', len(newBooks))
+                self.metrics.count('duplicated books', len(mergedBooks))
+                if self.isCancelled():
+                    break
+                if newBooks:
+                    self.booksLoaded.emit(newBooks)
+                    if source in self.calibreSources:
+                        self.queueTimestamps(newBooks)
+                if mergedBooks:
+                    self.booksMerged.emit(mergedBooks)
+                self.progress.pages += 1
+                self.progress.entries += len(newBooks)
+                self.progress.bytes += page.size
+                self.progressChanged.emit(self.progress)
+        finally:
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+            # The fetchers stop at the cancel, the cache is closed once they are done
+            pagesExecutor.shutdown(wait=True)
+        if self.isCancelled():
+            raise LoadCancelled()
+        for opdsUrl, error in self.errors:
+            debug_print('Failed loading the catalog from', opdsUrl, error)
+        if len(self.errors) == len(self.opdsUrls):
+            raise self.errors[0][1]
+    
+    @staticmethod
+    def sourceOf(opdsUrl) -> str:
+        '''The server of an OPDS URL without its credentials, like the servers of the links of the books'''
+        return urlparse(opdsUrl).netloc.rpartition('@')[2]
+    
+    def loadServer(self, opdsUrl, pages: Queue, pagesExecutor: ThreadPoolExecutor):
+        '''Load the root catalog of a server, then its pages in pagesExecutor'''
+        source = self.sourceOf(opdsUrl)
+        try:
+            start = time.perf_counter()
+            rootCatalog = loadRootCatalog(opdsUrl)
+            self.hostLatencies[source] = time.perf_counter() - start
+            catalogUrl = rootCatalog.catalogs.get(self.catalogTitle)
+            if catalogUrl is None:
+                raise ValueError(_('No catalog {:s}').format(self.catalogTitle))
+            self.catalogUrls[opdsUrl] = catalogUrl
+            if rootCatalog.serverHeader.startswith('calibre'):
+                self.calibreSources.add(source)
+        except Exception as e:
+            self.errors.append((opdsUrl, e))
+            pages.put((source, None, None))
+            return
+        try:
+            pagesExecutor.submit(self.loadPages, opdsUrl, catalogUrl, pages)
+        except RuntimeError:
+            # The executor is shut down: the load is cancelled
+            pages.put((source, None, None))
+    
+    def loadPages(self, opdsUrl, catalogUrl, pages: Queue):
+        '''Load the pages of the catalog of a server, they are put in the queue with their source'''
+        source = self.sourceOf(opdsUrl)
+        try:
+            fetcher = PageFetcher(self.maxConcurrency, cache=self.feedCache, cancelEvent=self.cancelEvent,
+                                  metrics=self.metrics)
+            for page in fetcher.pages(catalogUrl):
+                pages.put((source, page, list(page.entries())))
+        except LoadCancelled:
+            pass
+        except Exception as e:
+            self.errors.append((opdsUrl, e))
+        finally:
+            pages.put((source, None, None))
+
+
+class BookDownloader(QObject):
+    '''
+    The DownloadQueue of the dialog: the downloaded files are sent to the GUI thread by bookDownloaded,
+    the failures by downloadFailed.
+    '''
+    
+    bookDownloaded = pyqtSignal(object, str)
+    downloadFailed = pyqtSignal(object, object)
+    progressChanged = pyqtSignal(object)
+    
+    def __init__(self, parent, maxPerHost=2, **kwargs):
+        QObject.__init__(self, parent)
+        self.queue = DownloadQueue(
+            maxPerHost,
+            onDownloaded=self.bookDownloaded.emit,
+            onFailed=self.downloadFailed.emit,
+            onProgress=self.progressChanged.emit,
+            log=debug_print,
+            **kwargs,
+        )
+    
+    @property
+    def directory(self):
+        return self.queue.directory
+    
+    @directory.setter
+    def directory(self, directory):
+        self.queue.directory = directory
+    
+    @property
+    def progress(self):
+        return self.queue.progress
+    
+    def addBooks(self, books) -> int:
+        return self.queue.addBooks(books)
+    
+    def setHostLatencies(self, latencies):
+        self.queue.setHostLatencies(latencies)
+    
+    def cancel(self):
+        self.queue.cancel()
+    
+    def isActive(self) -> bool:
+        return self.queue.isActive()
+
+
+class ThumbnailLoader(QObject):
+    '''
+    The thumbnails of the books shown by the dialog: requested when a row is shown, downloaded
+    and decoded by the threads of a ThumbnailFetcher, and kept in memory up to THUMBNAIL_MEMORY bytes.
+    thumbnailLoaded is sent in the GUI thread when a thumbnail is ready.
+    '''
+    
+    thumbnailLoaded = pyqtSignal(str)
+    _decoded = pyqtSignal(str, object)
+    
+    def __init__(self, parent, cache=None, maxPerHost=2, maxMemory=THUMBNAIL_MEMORY):
+        QObject.__init__(self, parent)
+        self.cache = cache
+        self.memory = LruCache(maxMemory)
+        self.fetcher = ThumbnailFetcher(
+            cache,
+            maxPerHost=maxPerHost,
+            decode=self.decode,
+            onLoaded=self._decoded.emit,
+            log=debug_print,
+        )
+        # The QPixmap are created in the GUI thread
+        self._decoded.connect(self.addThumbnail)
+    
+    def thumbnail(self, url):
+        '''The QPixmap of the thumbnail, None if it is not loaded yet: it is then requested'''
+        pixmap = self.memory.get(url)
+        if pixmap is None:
+            self.fetcher.request(url)
+        return pixmap
+    
+    @staticmethod
+    def decode(data):
+        image = QImage.fromData(data)
+        if image.isNull():
+            return None
+        return image.scaledToHeight(THUMBNAIL_HEIGHT, Qt.SmoothTransformation)
+    
+    def addThumbnail(self, url, image):
+        self.memory.put(url, QPixmap.fromImage(image), image.sizeInBytes())
+        self.fetcher.delivered(url)
+        self.thumbnailLoaded.emit(url)
+    
+    def close(self):
+        self.fetcher.close()
+        self.memory.clear()
+        if self.cache:
+            self.cache.evict()
+            self.cache.close()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List
+
+# Events kept for the trace of a load, the oldest are dropped
+MAX_EVENTS = 5000
+
+
+class LoadMetrics:
+    '''
+    Counters and durations of the phases of a catalog load, updated by all the threads of the load.
+    
+    The duration of a phase is the sum of the durations measured by each thread, so the phases
+    run in parallel (the requests, the parsing) can last longer than the load.
+    The events (one by page) are kept for the JSON trace.
+    Only a lock and two clock reads by measure: cheap enough to stay always on.
+    '''
+    
+    def __init__(self, name=''):
+        self.name = name
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self._end = None
+        self.counters: Dict[str, int] = {}
+        self.durations: Dict[str, float] = {}
+        self.calls: Dict[str, int] = {}
+        self.events: List[Dict] = []
+        self.droppedEvents = 0
+        self._lock = threading.Lock()
+    
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+    
+    def addTime(self, name, seconds):
+        with self._lock:
+            self.durations[name] = self.durations.get(name, 0.0) + seconds
+            self.calls[name] = self.calls.get(name, 0) + 1
+    
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.addTime(name, time.perf_counter() - start)
+    
+    def event(self, name, **fields):
+        fields['name'] = name
+        fields['time'] = round(self.elapsed(), 6)
+        fields['thread'] = threading.current_thread().name
+        with self._lock:
+            if len(self.events) >= MAX_EVENTS:
+                del self.events[0]
+                self.droppedEvents += 1
+            self.events.append(fields)
+    
+    def finish(self):
+        '''The end of the load, the elapsed time stops'''
+        if self._end is None:
+            self._end = time.perf_counter()
+    
+    def elapsed(self) -> float:
+        return (self._end or time.perf_counter()) - self._start
+    
+    def snapshot(self, events=True) -> Dict:
+        with self._lock:
+            snapshot = {
+                'name': self.name,
+                'started': self.started,
+                'elapsed': round(self.elapsed(), 6),
+                'counters': dict(self.counters),
+                'phases': {
+                    name: {'calls': self.calls[name], 'seconds': round(seconds, 6)}
+                    for name, seconds in sorted(self.durations.items(), key=lambda item: -item[1])
+                },
+            }
+            if events:
+                snapshot['events'] = list(self.events)
+                snapshot['droppedEvents'] = self.droppedEvents
+            return snapshot
+    
+    def toJson(self) -> str:
+        '''The JSON trace of the load'''
+        return json.dumps(self.snapshot(), indent=2)
+    
+    def text(self) -> str:
+        '''Summary of the counters and the phases, the longest first'''
+        snapshot = self.snapshot(events=False)
+        lines = ['{:<24s} {:10.1f} ms'.format('elapsed', snapshot['elapsed'] * 1000)]
+        for name, phase in snapshot['phases'].items():
+            lines.append('{:<24s} {:10.1f} ms {:8d} calls'.format(name, phase['seconds'] * 1000, phase['calls']))
+        for name, value in sorted(snapshot['counters'].items()):
+            lines.append('{:<24s} {:10d}'.format(name, value))
+        return '\n'.join(lines)
+
+
+class NoMetrics(LoadMetrics):
+    '''The metrics of the code run without load, nothing is recorded'''
+    
+    def count(self, name, value=1):
+        pass
+    
+    def addTime(self, name, seconds):
+        pass
+    
+    def event(self, name, **fields):
+        pass
+
+
+NO_METRICS = NoMetrics()
@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+import re
+from typing import Dict, List, Tuple
+from urllib.parse import urljoin, urlparse
+from xml.etree.ElementTree import ParseError, XMLPullParser
+
+ATOM_NS = 'http://www.w3.org/2005/Atom'
+DC_NAMESPACES = ('http://purl.org/dc/terms/', 'http://purl.org/dc/elements/1.1/')
+
+_htmlLineBreak = re.compile(r'<br\s*/?>', re.IGNORECASE)
+
+
+def _splitTag(tag) -> Tuple[str, str]:
+    if tag[0] == '{':
+        namespace, _, name = tag[1:].partition('}')
+        return namespace, name
+    return '', tag
+
+
+def _isAtom(namespace) -> bool:
+    return namespace == ATOM_NS or not namespace
+
+
+def _readText(elem) -> str:
+    '''Text of a Atom text construct, the line breaks of the HTML and XHTML content are kept as new lines'''
+    contentType = elem.get('type', 'text')
+    if contentType == 'xhtml':
+        parts = []
+        _readXhtml(elem, parts)
+        return ''.join(parts)
+    text = elem.text or ''
+    if contentType == 'html':
+        text = _htmlLineBreak.sub('\n', text)
+    return text
+
+
+def _readXhtml(elem, parts):
+    for child in elem:
+        if _splitTag(child.tag)[1] == 'br':
+            parts.append('\n')
+        else:
+            parts.append(child.text or '')
+            _readXhtml(child, parts)
+        parts.append(child.tail or '')
+
+
+def newEntry() -> Dict:
+    return {
+        'title': '',
+        'authors': [],
+        'id': '',
+        'updated': '',
+        'summary': '',
+        'identifiers': [],
+        'links': [],
+    }
+
+
+class OpdsFeedParser:
+    '''
+    Incremental parser of a OPDS (Atom) feed, that read only the values used by the plugin.
+    
+    The data is given by chunks to feedData(), that return the entries completed by each chunk,
+    so the entries can be converted while the rest of the feed is downloaded.
+    The values of the feed itself (title, links, OpenSearch values) are in "header". "headerComplete"
+    is True at the start of the first entry, where the header is usually complete: the values of the feed
+    that follow the entries (like a "next" link at the end of the feed) are still added until close().
+    
+    If the feed is not well-formed XML, the parser falls back on feedparser when it is closed,
+    and only return the entries not already returned.
+    '''
+    
+    def __init__(self, baseUrl=''):
+        self.baseUrl = baseUrl
+        parsedBaseUrl = urlparse(baseUrl)
+        self._origin = f'{parsedBaseUrl.scheme}://{parsedBaseUrl.netloc}' if parsedBaseUrl.netloc else None
+        self.header = {
+            'title': '',
+            'links': [],
+            'next': None,
+            'totalResults': None,
+            'itemsPerPage': None,
+        }
+        self.headerComplete = False
+        self.entriesCount = 0
+        self._parser = XMLPullParser(events=('start', 'end'))
+        self._stack = []
+        self._chunks = []
+        self._failed = False
+    
+    @property
+    def isMalformed(self) -> bool:
+        '''True when the feed is parsed by feedparser'''
+        return self._failed
+    
+    def feedData(self, data) -> List[Dict]:
+        self._chunks.append(data)
+        if self._failed:
+            return []
+        try:
+            self._parser.feed(data)
+            return self._readEvents()
+        except ParseError as e:
+            self._failed = True
+            self._parseError = e
+            return []
+    
+    def close(self) -> List[Dict]:
+        if not self._failed:
+            try:
+                self._parser.close()
+                entries = self._readEvents()
+                self.headerComplete = True
+                return entries
+            except ParseError as e:
+                self._failed = True
+                self._parseError = e
+        return self._fallback()
+    
+    def _readEvents(self) -> List[Dict]:
+        entries = []
+        for event, elem in self._parser.read_events():
+            if event == 'start':
+                if len(self._stack) == 1:
+                    namespace, name = _splitTag(elem.tag)
+                    if _isAtom(namespace) and name == 'entry':
+                        self.headerComplete = True
+                self._stack.append(elem)
+                continue
+            self._stack.pop()
+            if len(self._stack) != 1:
+                continue
+            # Direct child of the feed
+            namespace, name = _splitTag(elem.tag)
+            if _isAtom(namespace) and name == 'entry':
+                entries.append(self._readEntry(elem))
+                self.entriesCount += 1
+                self._stack[0].remove(elem)
+            else:
+                self._readHeaderElement(namespace, name, elem)
+        return entries
+    
+    def _readHeaderElement(self, namespace, name, elem):
+        if _isAtom(namespace):
+            if name == 'title':
+                self.header['title'] = _readText(elem).strip()
+            elif name == 'link':
+                link = self._readLink(elem)
+                self.header['links'].append(link)
+                if link['rel'] == 'next' and self.header['next'] is None:
+                    self.header['next'] = link['href']
+        elif name in ('totalResults', 'itemsPerPage'):
+            try:
+                self.header[name] = int((elem.text or '').strip())
+            except ValueError:
+                pass
+    
+    def _resolveUrl(self, href) -> str:
+        # Fast path for the most common links: absolute path (like calibre) and absolute URL
+        if self._origin and href.startswith('/') and not href.startswith('//'):
+            return self._origin + href
+        if href.startswith(('http://', 'https://')):
+            return href
+        return urljoin(self.baseUrl, href)
+    
+    def _readLink(self, elem) -> Dict:
+        return {
+            'href': self._resolveUrl(elem.get('href', '').strip()),
+            'type': elem.get('type', ''),
+            'rel': elem.get('rel', 'alternate'),
+            'title': elem.get('title', ''),
+        }
+    
+    def _readEntry(self, elem) -> Dict:
+        entry = newEntry()
+        content = ''
+        for child in elem:
+            namespace, name = _splitTag(child.tag)
+            if _isAtom(namespace):
+                if name == 'title':
+                    entry['title'] = _readText(child).strip()
+                elif name == 'author':
+                    for authorChild in child:
+                        if _splitTag(authorChild.tag)[1] == 'name' and authorChild.text:
+                            entry['authors'].append(authorChild.text.strip())
+                elif name == 'id':
+                    entry['id'] = (child.text or '').strip()
+                elif name == 'updated':
+                    entry['updated'] = (child.text or '').strip()
+                elif name == 'summary':
+                    entry['summary'] = _readText(child)
+                elif name == 'content':
+                    content = _readText(child)
+                elif name == 'link':
+                    entry['links'].append(self._readLink(child))
+            elif namespace in DC_NAMESPACES and name == 'identifier' and child.text:
+                entry['identifiers'].append(child.text.strip())
+        if not entry['summary']:
+            entry['summary'] = content
+        return entry
+    
+    def _fallback(self) -> List[Dict]:
+        from calibre.web.feeds import feedparser
+        
+        from .common_utils import debug_print
+        debug_print('Malformed feed, fallback on feedparser:', self.baseUrl, self._parseError)
+        
+        feed = feedparser.parse(b''.join(self._chunks), response_headers={'content-location': self.baseUrl})
+        self.header['title'] = feed.feed.get('title', '')
+        # The links read before the error are also in the links of feedparser
+        self.header['links'] = []
+        self.header['next'] = None
+        for link in feed.feed.get('links', []):
+            link = entryLinkFromFeedparser(link)
+            self.header['links'].append(link)
+            if link['rel'] == 'next' and self.header['next'] is None:
+                self.header['next'] = link['href']
+        self.headerComplete = True
+        entries = [entryFromFeedparser(e) for e in feed.entries[self.entriesCount:]]
+        self.entriesCount += len(entries)
+        return entries
+
+
+def entryLinkFromFeedparser(link) -> Dict:
+    return {
+        'href': link.get('href', ''),
+        'type': link.get('type', ''),
+        'rel': link.get('rel', 'alternate'),
+        'title': link.get('title', ''),
+    }
+
+
+def entryFromFeedparser(feedparserEntry) -> Dict:
+    '''Convert a entry parsed by feedparser to the same structure as OpdsFeedParser'''
+    entry = newEntry()
+    entry['title'] = feedparserEntry.get('title', '')
+    entry['authors'] = [a['name'] for a in feedparserEntry.get('authors', []) if a.get('name')]
+    if not entry['authors'] and feedparserEntry.get('author'):
+        entry['authors'] = [feedparserEntry['author']]
+    entry['id'] = feedparserEntry.get('id', '')
+    entry['updated'] = feedparserEntry.get('updated', '')
+    entry['summary'] = _htmlLineBreak.sub('\n', feedparserEntry.get('summary', ''))
+    entry['links'] = [entryLinkFromFeedparser(link) for link in feedparserEntry.get('links', [])]
+    # feedparser only keeps the last dc:identifier of each namespace
+    entry['identifiers'] = [feedparserEntry[key].strip() for key in ('dcterms_identifier', 'dc_identifier')
+                            if feedparserEntry.get(key)]
+    return entry
+
+
+def parseFeed(content, baseUrl='') -> Tuple[Dict, List[Dict]]:
+    '''Parse a complete feed, return a tuple (header, entries)'''
+    parser = OpdsFeedParser(baseUrl)
+    entries = parser.feedData(content)
+    entries.extend(parser.close())
+    return parser.header, entries
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+try:
+    load_translations()
+except NameError:
+    pass  # load_translations() added in calibre 1.9
+
+import re
+from typing import Dict, List, Optional
+from urllib.parse import quote, urljoin
+from xml.etree.ElementTree import fromstring
+
+from .fetcher import fetchUrl
+
+OPENSEARCH_NS = 'http://a9.com/-/spec/opensearch/1.1/'
+OPENSEARCH_DESCRIPTION_TYPE = 'application/opensearchdescription+xml'
+
+_templateParameter = re.compile(r'\{(\w+:)?(\w+)(\??)\}')
+
+
+def findSearchLink(links: List[Dict]) -> Optional[Dict]:
+    '''
+    The search link of a feed: a OpenSearch description, or a Atom URL template.
+    The description is preferred, as the Atom link is not always a template.
+    '''
+    searchLinks = [link for link in links if link['rel'] == 'search']
+    for link in searchLinks:
+        if link['type'] == OPENSEARCH_DESCRIPTION_TYPE:
+            return link
+    for link in searchLinks:
+        if link['type'].startswith('application/atom+xml') and '{searchTerms}' in link['href']:
+            return link
+    return None
+
+
+def parseSearchDescription(content, baseUrl='') -> Optional[str]:
+    '''Return the URL template of the Atom results from a OpenSearch description, None if there is none'''
+    templates = []
+    for elem in fromstring(content).iter(f'{{{OPENSEARCH_NS}}}Url'):
+        template = elem.get('template')
+        urlType = elem.get('type', '')
+        if template and urlType.startswith('application/atom+xml'):
+            templates.append((0 if 'opds-catalog' in urlType else 1, urljoin(baseUrl, template)))
+    return min(templates)[1] if templates else None
+
+
+def loadSearchTemplate(searchLink: Dict) -> str:
+    if searchLink['type'] != OPENSEARCH_DESCRIPTION_TYPE:
+        return searchLink['href']
+    content = fetchUrl(searchLink['href'])[0]
+    template = parseSearchDescription(content, searchLink['href'])
+    if template is None:
+        raise ValueError(_('No OPDS search in the OpenSearch description {:s}').format(searchLink['href']))
+    return template
+
+
+def expandTemplate(template, searchTerms) -> str:
+    '''Fill a OpenSearch URL template, the optional parameters other than the search terms are left empty'''
+    values = {
+        'searchTerms': quote(searchTerms, safe=''),
+        # The first page of the results, with the default size of the server
+        'startIndex': '1',
+        'startPage': '1',
+        'count': '',
+        'language': '*',
+        'inputEncoding': 'UTF-8',
+        'outputEncoding': 'UTF-8',
+    }
+    
+    def parameterValue(match):
+        prefix, name, optional = match.groups()
+        if optional and (prefix or name != 'searchTerms'):
+            return ''
+        if not prefix and name in values:
+            return values[name]
+        raise ValueError(f'Unknown OpenSearch parameter {match.group(0)} in {template}')
+    
+    return _templateParameter.sub(parameterValue, template)
+
+
+def searchUrl(searchLink: Dict, searchTerms) -> str:
+    '''Return the URL of the first page of the results of a search on the server'''
+    return expandTemplate(loadSearchTemplate(searchLink), searchTerms)
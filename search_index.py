@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+import re
+import unicodedata
+from bisect import bisect_left
+from sys import intern
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Fields of the qualified terms, like "author:tolkien", and their aliases
+FIELDS = ('title', 'author', 'tag')
+FIELD_ALIASES = {
+    'title': 'title',
+    'author': 'author',
+    'authors': 'author',
+    'tag': 'tag',
+    'tags': 'tag',
+}
+
+_words = re.compile(r'\w+')
+_terms = re.compile(r'(?:(\w+):)?("[^"]*"?|\S+)')
+
+
+def foldText(text) -> str:
+    '''Lowercase the text and remove the accents'''
+    if not text or text.isascii():
+        return (text or '').casefold()
+    text = unicodedata.normalize('NFKD', text)
+    return ''.join(c for c in text if not unicodedata.combining(c)).casefold()
+
+
+def tokenize(text) -> List[str]:
+    return _words.findall(foldText(text))
+
+
+def parseQuery(query) -> List[Tuple[Optional[str], List[str]]]:
+    '''
+    Split a query in terms: a list of tuples (field, tokens), the field is None for the unqualified terms.
+    A term can be quoted to search several words in the same field: author:"le guin"
+    '''
+    terms = []
+    for field, value in _terms.findall(query or ''):
+        field = field.lower()
+        if field and field not in FIELD_ALIASES:
+            # Not a field, search the whole term
+            value = field + ':' + value
+            field = ''
+        tokens = tokenize(value)
+        if tokens:
+            terms.append((FIELD_ALIASES.get(field), tokens))
+    return terms
+
+
+def matchingBooks(books: Iterable, query, firstBookId=0) -> Optional[Set[int]]:
+    '''
+    The ids of the books matching the query, like SearchIndex.search but without index:
+    for the few books of a page, numbered from "firstBookId". None for a empty query.
+    '''
+    terms = parseQuery(query)
+    if not terms:
+        return None
+    matches = set()
+    for bookId, book in enumerate(books, firstBookId):
+        words = {
+            'title': tokenize(book.title),
+            'author': [word for author in book.authors for word in tokenize(author)],
+            'tag': [word for tag in book.tags for word in tokenize(tag)],
+        }
+        allWords = words['title'] + words['author'] + words['tag']
+        if all(
+            any(word.startswith(token) for word in (words[field] if field else allWords))
+            for field, tokens in terms for token in tokens
+        ):
+            matches.add(bookId)
+    return matches
+
+
+class SearchIndex:
+    '''
+    Inverted index of the title, authors and tags of the books of a catalog.
+    
+    The books are identified by their position in the list of the loaded books, and added
+    as the pages are loaded. Each token of the query must be the prefix of a word of the book,
+    in any field or in the field of a qualified term (title:, author: or tag:).
+    '''
+    
+    def __init__(self):
+        self.clear()
+    
+    def __len__(self) -> int:
+        return self.count
+    
+    def clear(self):
+        self.count = 0
+        self._postings: Dict[str, Dict[str, Set[int]]] = {field: {} for field in FIELDS}
+        self._sortedTokens: Dict[str, List[str]] = {}
+    
+    def addBooks(self, books: Iterable):
+        for book in books:
+            self.addBook(book)
+    
+    def addBook(self, book) -> int:
+        bookId = self.count
+        self.count += 1
+        self._addTokens('title', bookId, tokenize(book.title))
+        for author in book.authors:
+            self._addTokens('author', bookId, tokenize(author))
+        for tag in book.tags:
+            self._addTokens('tag', bookId, tokenize(tag))
+        return bookId
+    
+    def _addTokens(self, field, bookId, tokens):
+        postings = self._postings[field]
+        for token in tokens:
+            books = postings.get(token)
+            if books is None:
+                postings[intern(token)] = {bookId}
+                # The sorted list of the tokens is built again at the next search
+                self._sortedTokens.pop(field, None)
+            else:
+                books.add(bookId)
+    
+    def search(self, query) -> Optional[Set[int]]:
+        '''Return the ids of the books matching all the terms of the query, None for a empty query'''
+        terms = parseQuery(query)
+        if not terms:
+            return None
+        matches = None
+        # The tokens are sorted by length, the longest are the most selective
+        for field, token in sorted(((f, t) for f, tokens in terms for t in tokens), key=lambda ft: -len(ft[1])):
+            books = set()
+            for f in (field,) if field else FIELDS:
+                books.update(self._prefixMatches(f, token, matches))
+            matches = books
+            if not matches:
+                break
+        return matches
+    
+    def _prefixMatches(self, field, prefix, candidates) -> Set[int]:
+        sortedTokens = self._sortedTokens.get(field)
+        if sortedTokens is None:
+            sortedTokens = self._sortedTokens[field] = sorted(self._postings[field])
+        postings = self._postings[field]
+        books = set()
+        for i in range(bisect_left(sortedTokens, prefix), len(sortedTokens)):
+            token = sortedTokens[i]
+            if not token.startswith(prefix):
+                break
+            if candidates is None:
+                books.update(postings[token])
+            else:
+                books.update(postings[token] & candidates)
+        return books
@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+# Run all the tests, those that need calibre are skipped without it:
+#   python tests/run.py
+#   calibre-debug -e tests/run.py
+
+import os
+import sys
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def main():
+    sys.path.insert(0, TESTS_DIR)
+    tests = unittest.defaultTestLoader.discover(TESTS_DIR, top_level_dir=TESTS_DIR)
+    result = unittest.TextTestRunner(verbosity=2).run(tests)
+    sys.exit(0 if result.wasSuccessful() else 1)
+
+
+if __name__ == '__main__':
+    main()
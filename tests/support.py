@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+# Helpers shared by the tests. The tests import the modules of the plugin from the source tree,
+# without the entry point of the plugin (__init__.py): the modules that don't use calibre nor Qt
+# are tested with python alone, the tests that need calibre are skipped without it.
+#   python tests/run.py
+#   calibre-debug -e tests/run.py
+
+import builtins
+import os
+import sys
+import types
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+PLUGIN_DIR = os.path.dirname(TESTS_DIR)
+PLUGIN_PACKAGE = 'opds_reader'
+# The synthetic server of the benchmarks
+sys.path.insert(0, os.path.join(PLUGIN_DIR, 'benchmarks'))
+
+try:
+    import calibre  # noqa: F401
+    HAS_CALIBRE = True
+except ImportError:
+    HAS_CALIBRE = False
+
+if not hasattr(builtins, '_'):
+    # The translation function installed by calibre
+    builtins._ = lambda text: text
+
+if PLUGIN_PACKAGE not in sys.modules:
+    package = types.ModuleType(PLUGIN_PACKAGE)
+    package.__path__ = [PLUGIN_DIR]
+    sys.modules[PLUGIN_PACKAGE] = package
+
+requiresCalibre = unittest.skipUnless(HAS_CALIBRE, 'needs calibre')
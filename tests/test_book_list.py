@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+import unittest
+
+import support
+from opds_reader.book_store import BookStore, SqliteBookStore
+from opds_reader.catalog_entry import CatalogEntry
+
+
+def book(i):
+    return CatalogEntry('Title {}'.format(i * 7 % 23), ('Author {}'.format(i % 4),), 'uuid-{}'.format(i),
+                        1600000000 + i * 11 % 17, sources=('host{}'.format(i % 2),))
+
+
+@support.requiresCalibre
+class SortedAppendTest(unittest.TestCase):
+    '''The pages appended to the sorted book list of the dialog'''
+    
+    def setUp(self):
+        try:
+            from qt.core import QCoreApplication, Qt
+        except ImportError:
+            from PyQt5.Qt import QCoreApplication, Qt
+        
+        from opds_reader.action import OpdsBooksModel
+        
+        self.app = QCoreApplication.instance() or QCoreApplication([])
+        self.orders = (Qt.AscendingOrder, Qt.DescendingOrder)
+        self.newModel = lambda store: OpdsBooksModel(None, [], None, store)
+        self.books = [book(i) for i in range(300)]
+    
+    def testRowsInSortedPlace(self):
+        for store in (BookStore, SqliteBookStore):
+            for column in range(4):
+                for order in self.orders:
+                    model = self.newModel(store())
+                    layoutChanges = []
+                    model.layoutChanged.connect(lambda *args: layoutChanges.append(args))
+                    model.sort(column, order)
+                    for i in range(0, len(self.books), 50):
+                        model.appendBooks(self.books[i:i + 50])
+                    # The same rows as a sort of all the books, without moving the rows already shown
+                    expected = model.books.sortedIds(range(len(self.books)), column, order == self.orders[1])
+                    self.assertEqual(list(model.rows), list(expected), (store.__name__, column, order))
+                    self.assertEqual(len(layoutChanges), 1)
+                    model.closeBookStore()
+
+
+if __name__ == '__main__':
+    unittest.main()
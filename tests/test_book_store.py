@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+import unittest
+
+import support
+from opds_reader.book_store import BookStore, SqliteBookStore, displayTexts
+from opds_reader.catalog_entry import CatalogEntry
+
+
+def book(i):
+    # Few distinct values: most of the books have the same key as others
+    return CatalogEntry('Title {}'.format(i % 3), ('Author {}'.format(i % 4),), 'uuid-{}'.format(i),
+                        1600000000 + i % 5, sources=('host{}'.format(i % 2),))
+
+
+class SortedIdsTest(unittest.TestCase):
+    def setUp(self):
+        self.books = [book(i) for i in range(60)]
+        self.memoryStore = BookStore()
+        self.memoryStore.append(self.books)
+        self.diskStore = SqliteBookStore()
+        self.diskStore.append(self.books)
+    
+    def tearDown(self):
+        self.memoryStore.close()
+        self.diskStore.close()
+    
+    def assertSameOrder(self, columns):
+        bookIds = list(range(0, 60, 2))
+        for column in columns:
+            for reverse in (False, True):
+                self.assertEqual(
+                    list(self.diskStore.sortedIds(bookIds, column, reverse)),
+                    list(self.memoryStore.sortedIds(bookIds, column, reverse)),
+                    (column, reverse),
+                )
+    
+    def testSameOrderWithDuplicateKeys(self):
+        self.assertSameOrder((0, 2, 3, -1))
+    
+    @support.requiresCalibre
+    def testSameOrderOfTheAuthors(self):
+        # The author sort of calibre
+        self.assertSameOrder((1,))
+    
+    def testTiesInCatalogOrderWhenReversed(self):
+        # All the books of "Title 2", then "Title 1", then "Title 0", each in the order of the catalog
+        expected = [i for title in (2, 1, 0) for i in range(60) if i % 3 == title]
+        self.assertEqual(list(self.diskStore.sortedIds(range(60), 0, reverse=True)), expected)
+        self.assertEqual(list(self.memoryStore.sortedIds(range(60), 0, reverse=True)), expected)
+
+
+class SortKeysTest(unittest.TestCase):
+    BOOKS = [
+        CatalogEntry('solaris', ('Stanisław Lem',), 'uuid-0', 1600000002, sources=('host1',)),
+        CatalogEntry('Foundation', ('Isaac Asimov',), 'uuid-1', 1600000000, sources=('host0', 'host1')),
+        CatalogEntry('Roadside Picnic', ('Arkady Strugatsky', 'Boris Strugatsky'), 'uuid-2', 1600000001,
+                     sources=('host0',)),
+    ]
+    
+    def setUp(self):
+        self.stores = (BookStore(), SqliteBookStore())
+        for store in self.stores:
+            store.append(self.BOOKS)
+    
+    def tearDown(self):
+        for store in self.stores:
+            store.close()
+    
+    def assertOrder(self, column, expected):
+        for store in self.stores:
+            self.assertEqual(list(store.sortedIds(range(len(store)), column)), expected, type(store).__name__)
+            self.assertEqual(list(store.sortedIds(range(len(store)), column, reverse=True)), expected[::-1])
+            # The keys of the sorted place of the appended rows
+            keys = store.sortKeys(range(len(store)), column)
+            self.assertEqual(sorted(keys, key=keys.__getitem__), expected, type(store).__name__)
+    
+    def testTitleWithoutCase(self):
+        self.assertOrder(0, [1, 2, 0])
+    
+    @support.requiresCalibre
+    def testAuthorSort(self):
+        # Asimov, Lem, Strugatsky
+        self.assertOrder(1, [1, 0, 2])
+    
+    def testTimestamp(self):
+        self.assertOrder(2, [1, 2, 0])
+    
+    def testSources(self):
+        self.assertOrder(3, [2, 1, 0])
+    
+    def testCatalogOrder(self):
+        for store in self.stores:
+            self.assertEqual(list(store.sortedIds([2, 0, 1], -1)), [0, 1, 2])
+    
+    def testBooksAppendedAfterTheSort(self):
+        for store in self.stores:
+            store.sortedIds(range(len(store)), 0)
+            store.append([CatalogEntry('Dune', ('Frank Herbert',), 'uuid-3', 1600000003)])
+            self.assertEqual(list(store.sortedIds(range(len(store)), 0)), [3, 1, 2, 0], type(store).__name__)
+    
+    def testDisplayTexts(self):
+        self.assertEqual(displayTexts(self.BOOKS[2]),
+                         ('Arkady Strugatsky & Boris Strugatsky', '2020-09-13 12:26:41', 'host0'))
+        for store in self.stores:
+            self.assertEqual(store.displayTexts(1), ('Isaac Asimov', '2020-09-13 12:26:40', 'host0, host1'))
+
+
+if __name__ == '__main__':
+    unittest.main()
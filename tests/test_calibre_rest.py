@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+import json
+import threading
+import unittest
+
+import support  # noqa: F401
+from opds_reader.calibre_rest import BOOKS_BY_REQUEST, _readTimestamps, calibreBookId, downloadCalibreTimestamps
+from opds_reader.catalog_entry import CatalogEntry
+from opds_reader.fetcher import LoadCancelled
+from opds_reader.timestamps import parseTimestampToEpoch
+from server import SyntheticServer
+from synthetic import bookTimestamp, bookUuid
+
+
+def calibreBook(baseUrl, bookId, uuid=None):
+    links = (f'{baseUrl}/get/epub/{bookId}/library', f'{baseUrl}/get/mobi/{bookId}/library')
+    return CatalogEntry(f'Book {bookId}', ('',), bookUuid(bookId) if uuid is None else uuid, 0, links=links)
+
+
+class CalibreBookIdTest(unittest.TestCase):
+    def testDownloadLinks(self):
+        self.assertEqual(calibreBookId('http://host/get/epub/12/library'), ('http://host/ajax/books/library', 12))
+        self.assertEqual(calibreBookId('http://host/get/epub/12'), ('http://host/ajax/books', 12))
+    
+    def testUrlPrefix(self):
+        # calibre served behind a reverse proxy, with --url-prefix
+        self.assertEqual(calibreBookId('https://host/calibre/get/mobi/7/Books'),
+                         ('https://host/calibre/ajax/books/Books', 7))
+    
+    def testOtherLinks(self):
+        self.assertIsNone(calibreBookId('http://host/books/12.epub'))
+        self.assertIsNone(calibreBookId('http://host/get/epub/cover'))
+
+
+class ReadTimestampsTest(unittest.TestCase):
+    def testSkippedBooks(self):
+        books = {1: calibreBook('http://host', 1), 2: calibreBook('http://host', 2), 3: calibreBook('http://host', 3),
+                 4: calibreBook('http://host', 4)}
+        content = json.dumps({
+            '1': {'uuid': bookUuid(1), 'timestamp': '2015-10-21T07:28:00+00:00'},
+            # Deleted since the catalog was loaded
+            '2': None,
+            # Another book with the same id: the library was changed
+            '3': {'uuid': 'another-uuid', 'timestamp': '2015-10-21T07:28:00+00:00'},
+            '4': {'uuid': bookUuid(4), 'timestamp': 'not a date'},
+        })
+        self.assertEqual(_readTimestamps(content, books), [(books[1], 1445412480)])
+
+
+class DownloadCalibreTimestampsTest(unittest.TestCase):
+    def setUp(self):
+        self.server = SyntheticServer(total=1000).start()
+        self.baseUrl = self.server.url.replace('/opds', '')
+    
+    def tearDown(self):
+        self.server.stop()
+    
+    def testAllBooksByChunks(self):
+        books = [calibreBook(self.baseUrl, bookId) for bookId in range(1, 1001)]
+        chunks = list(downloadCalibreTimestamps(books, 4))
+        self.assertEqual(len(chunks), 1000 // BOOKS_BY_REQUEST)
+        self.assertEqual(self.server.requests, len(chunks))
+        timestamps = {book.uuid: timestamp for chunk in chunks for book, timestamp in chunk}
+        self.assertEqual(len(timestamps), 1000)
+        self.assertEqual(timestamps[bookUuid(123)], parseTimestampToEpoch(bookTimestamp(123)))
+    
+    def testBooksNotFound(self):
+        books = [calibreBook(self.baseUrl, 1), calibreBook(self.baseUrl, 5000),
+                 CatalogEntry('Other', ('',), 'other', 0, links=('http://other/book.epub',))]
+        chunks = list(downloadCalibreTimestamps(books, 4))
+        self.assertEqual([[book.title for book, _timestamp in chunk] for chunk in chunks], [['Book 1']])
+    
+    def testWithoutCalibreLinks(self):
+        self.assertEqual(list(downloadCalibreTimestamps([CatalogEntry('Other', ('',), 'other', 0)])), [])
+        self.assertEqual(self.server.requests, 0)
+    
+    def testCancelled(self):
+        cancelEvent = threading.Event()
+        cancelEvent.set()
+        books = [calibreBook(self.baseUrl, bookId) for bookId in range(1, 1001)]
+        with self.assertRaises(LoadCancelled):
+            list(downloadCalibreTimestamps(books, 1, cancelEvent=cancelEvent))
+
+
+if __name__ == '__main__':
+    unittest.main()
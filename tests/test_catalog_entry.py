@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+import unittest
+
+import support
+from opds_reader.catalog_entry import DEFAULT_EPOCH, CatalogEntry, entriesFromOpds, entryFromOpds, thumbnailUrl
+from opds_reader.opds_parser import parseFeed
+from synthetic import FEED_HEADER, bookEntry
+
+
+def link(rel, href, type='image/jpeg'):
+    return {'rel': rel, 'href': href, 'type': type}
+
+
+def opdsEntry(**values):
+    entry = {
+        'title': 'Solaris',
+        'authors': ['Stanisław Lem'],
+        'id': 'urn:uuid:5b0c1a0e-0000-4000-8000-000000000001',
+        'updated': '2015-10-21T07:28:00+00:00',
+        'summary': '',
+        'identifiers': [],
+        'links': [],
+    }
+    entry.update(values)
+    return entry
+
+
+class ThumbnailUrlTest(unittest.TestCase):
+    def thumbnail(self, links):
+        return thumbnailUrl(links)
+    
+    def testCalibreLinks(self):
+        # calibre uses the rels of the first drafts of OPDS, the cover before the thumbnail
+        self.assertEqual(self.thumbnail([
+            link('http://opds-spec.org/acquisition', '/get/epub/1/library', 'application/epub+zip'),
+            link('http://opds-spec.org/cover', '/get/cover/1/library'),
+            link('http://opds-spec.org/thumbnail', '/get/thumb/1/library'),
+        ]), '/get/thumb/1/library')
+    
+    def testOpds12Links(self):
+        self.assertEqual(self.thumbnail([
+            link('http://opds-spec.org/image', '/cover.jpg'),
+            link('http://opds-spec.org/image/thumbnail', '/thumbnail.jpg'),
+        ]), '/thumbnail.jpg')
+    
+    def testCoverWithoutThumbnail(self):
+        self.assertEqual(self.thumbnail([
+            link('alternate', '/other.png', 'image/png'),
+            link('http://opds-spec.org/cover', '/cover.jpg'),
+        ]), '/cover.jpg')
+        self.assertEqual(self.thumbnail([link('alternate', '/other.png', 'image/png')]), '/other.png')
+        self.assertEqual(self.thumbnail([]), '')
+    
+    def testSyntheticFeed(self):
+        feed = FEED_HEADER.format(id='test', title='Test') + bookEntry(1) + '</feed>\n'
+        _header, (entry,) = parseFeed(feed.encode('utf-8'))
+        self.assertEqual(entryFromOpds(entry).thumbnail, '/get/thumb/1/library')
+
+
+class EntryFromOpdsTest(unittest.TestCase):
+    def testValues(self):
+        entry = entryFromOpds(opdsEntry())
+        self.assertEqual(entry.title, 'Solaris')
+        self.assertEqual(entry.authors, ('Stanisław Lem',))
+        self.assertEqual(entry.uuid, '5b0c1a0e-0000-4000-8000-000000000001')
+        self.assertEqual(entry.formatTimestamp(), '2015-10-21 07:28:00')
+    
+    def testAuthorsOfCalibre(self):
+        # calibre puts all the authors in a single name
+        entry = entryFromOpds(opdsEntry(authors=['Arkady Strugatsky & Boris Strugatsky']))
+        self.assertEqual(entry.authors, ('Arkady Strugatsky', 'Boris Strugatsky'))
+        self.assertEqual(entryFromOpds(opdsEntry(authors=[])).authors, ('',))
+    
+    def testIdentifiers(self):
+        entry = entryFromOpds(opdsEntry(id='urn:isbn:9780156027601', identifiers=['urn:uuid:1', 'urn:asin:B00A2MT4OO']))
+        self.assertEqual(entry.get_identifiers(), {'isbn': '9780156027601', 'asin': 'B00A2MT4OO'})
+    
+    def testTags(self):
+        entry = entryFromOpds(opdsEntry(summary='RATING: ★★★\nTAGS: Fiction, Science Fiction<br />\nSERIES: None'))
+        self.assertEqual(entry.tags, ('Fiction', 'Science Fiction'))
+    
+    def testEpubFirstWithoutImages(self):
+        entry = entryFromOpds(opdsEntry(links=[
+            link('http://opds-spec.org/acquisition', '/get/mobi/1', 'application/x-mobipocket-ebook'),
+            link('http://opds-spec.org/thumbnail', '/get/thumb/1'),
+            link('http://opds-spec.org/acquisition', '/get/epub/1', 'application/epub+zip'),
+        ]))
+        self.assertEqual(entry.links, ('/get/epub/1', '/get/mobi/1'))
+        self.assertEqual(entry.thumbnail, '/get/thumb/1')
+    
+    def testDefaultTimestamp(self):
+        self.assertEqual(entryFromOpds(opdsEntry(updated='')).timestamp, DEFAULT_EPOCH)
+        self.assertEqual(entryFromOpds(opdsEntry(updated='not a date')).timestamp, DEFAULT_EPOCH)
+    
+    def testTimestampsOfAPage(self):
+        entries = entriesFromOpds([opdsEntry(), opdsEntry(updated='2015-10-21T09:28:00+02:00'), opdsEntry(updated='')])
+        self.assertEqual([entry.timestamp for entry in entries], [1445412480, 1445412480, DEFAULT_EPOCH])
+
+
+class CatalogEntryTest(unittest.TestCase):
+    def testCompact(self):
+        # Slotted: no dictionary by book
+        self.assertFalse(hasattr(entryFromOpds(opdsEntry()), '__dict__'))
+    
+    def testKey(self):
+        self.assertEqual(CatalogEntry('Solaris', ('',), 'uuid-1', 0, links=('/get/epub/1',)).key(), 'uuid-1')
+        self.assertEqual(CatalogEntry('Solaris', ('',), '', 0, links=('/get/epub/1',)).key(), '/get/epub/1')
+    
+    def testMerge(self):
+        entry = CatalogEntry('Solaris', ('',), 'uuid-1', 0, links=('http://a/1', 'http://a/2'), sources=('a',))
+        entry.merge(CatalogEntry('Solaris', ('',), 'uuid-1', 0, links=('http://b/1', 'http://a/2'), sources=('b',)))
+        self.assertEqual(entry.links, ('http://a/1', 'http://a/2', 'http://b/1'))
+        self.assertEqual(entry.sources, ('a', 'b'))
+    
+    @support.requiresCalibre
+    def testToMetadata(self):
+        entry = entryFromOpds(opdsEntry(id='urn:isbn:9780156027601', summary='TAGS: Fiction',
+                                        links=[link('acquisition', '/get/epub/1', 'application/epub+zip')]))
+        metadata = entry.toMetadata()
+        self.assertEqual(metadata.title, 'Solaris')
+        self.assertEqual(metadata.authors, ['Stanisław Lem'])
+        self.assertEqual(metadata.tags, ['Fiction'])
+        self.assertEqual(metadata.links, ['/get/epub/1'])
+        self.assertEqual(metadata.timestamp, entry.getTimestamp())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+import unittest
+
+import support  # noqa: F401
+from opds_reader.crawler import CatalogCrawler
+from server import CATALOGS, SyntheticServer
+
+
+class MaxFeedsTest(unittest.TestCase):
+    def setUp(self):
+        self.server = SyntheticServer(total=200, pageSize=50).start()
+        self.catalogUrl = self.server.url.replace('/opds', '') + CATALOGS['Authors']
+    
+    def tearDown(self):
+        self.server.stop()
+    
+    def crawl(self, maxFeeds):
+        crawler = CatalogCrawler(4, 2, maxFeeds)
+        books = [entry['id'] for feed in crawler.crawl(self.catalogUrl) for entry in feed.entries]
+        return crawler, books
+    
+    def testAllFeeds(self):
+        crawler, books = self.crawl(1000)
+        self.assertEqual(crawler.skippedFeeds, 0)
+        self.assertEqual(len(books), 200)
+    
+    def testSkippedFeedsAreCounted(self):
+        allFeeds = self.crawl(1000)[0].feeds
+        crawler, books = self.crawl(10)
+        self.assertEqual(crawler.feeds, 10)
+        self.assertEqual(crawler.skippedFeeds, allFeeds - 10)
+        self.assertLess(len(books), 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+import shutil
+import tempfile
+import threading
+import unittest
+from urllib.parse import urlparse
+
+import support  # noqa: F401
+from opds_reader.catalog_entry import CatalogEntry
+from opds_reader.downloader import DownloadQueue
+from server import SyntheticServer
+
+
+class FallbackLinkTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.servers = [SyntheticServer(total=10).start(), SyntheticServer(total=10).start()]
+    
+    def tearDown(self):
+        for server in self.servers:
+            server.stop()
+        shutil.rmtree(self.directory, ignore_errors=True)
+    
+    def testNextLinkInTheExecutorOfItsServer(self):
+        first, second = (server.url.replace('/opds', '') for server in self.servers)
+        books = [
+            # Not found on the first server
+            CatalogEntry('Book {}'.format(i), ('Author',), 'uuid-{}'.format(i), 0,
+                         links=(first + '/missing/{}'.format(i), second + '/get/epub/{}/library'.format(i)))
+            for i in range(6)
+        ]
+        downloaded = []
+        queue = DownloadQueue(maxPerHost=1, retries=0, onDownloaded=lambda book, path: downloaded.append(book))
+        queue.directory = self.directory
+        threads = {}
+        downloadUrl = queue._downloadUrl
+        
+        def recordThread(url, *args):
+            # The executor of a thread is in its name: ThreadPoolExecutor-<executor>_<thread>
+            executor = threading.current_thread().name.rsplit('_', 1)[0]
+            threads.setdefault(urlparse(url).netloc, set()).add(executor)
+            return downloadUrl(url, *args)
+        
+        queue._downloadUrl = recordThread
+        queue.addBooks(books)
+        queue.wait()
+        self.assertEqual(len(downloaded), len(books))
+        self.assertEqual(queue.progress.failed, 0)
+        firstHost, secondHost = (urlparse(url).netloc for url in (first, second))
+        self.assertEqual(len(threads[firstHost]), 1)
+        self.assertEqual(len(threads[secondHost]), 1)
+        self.assertNotEqual(threads[firstHost], threads[secondHost])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+import datetime
+import threading
+import unittest
+
+import support
+from opds_reader.engine import SyncEngine, formatStats
+from server import SyntheticServer
+from synthetic import bookUuid
+
+OLD_TIMESTAMP = datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+class FakeLibrary:
+    '''The calls of the new_api of the calibre database used by the engine'''
+    
+    def __init__(self, bookIds=()):
+        self.books = {
+            bookId: {'uuid': bookUuid(bookId), 'title': f'Book {bookId}', 'authors': (), 'identifiers': {},
+                     'timestamp': OLD_TIMESTAMP}
+            for bookId in bookIds
+        }
+        self.addedBooks = []
+        self.fieldsSet = []
+        self._lock = threading.Lock()
+    
+    def all_book_ids(self):
+        return set(self.books)
+    
+    def all_field_for(self, field, bookIds):
+        return {bookId: self.books[bookId][field] for bookId in bookIds}
+    
+    def set_field(self, field, values):
+        self.fieldsSet.append((field, dict(values)))
+        for bookId, value in values.items():
+            self.books[bookId][field] = value
+    
+    def add_books(self, books, add_duplicates=True, preserve_uuid=False):
+        with self._lock:
+            self.addedBooks.extend(books)
+            return list(range(len(self.addedBooks) - len(books), len(self.addedBooks))), []
+
+
+class SyncEngineTest(unittest.TestCase):
+    def setUp(self):
+        # 100 books, 5 of them tagged News
+        self.server = SyntheticServer(total=100, pageSize=30).start()
+    
+    def tearDown(self):
+        self.server.stop()
+    
+    def testDryRun(self):
+        library = FakeLibrary(range(1, 11))
+        stats = SyncEngine(library, dryRun=True).sync(self.server.url, 'Newest')
+        self.assertIsNone(stats['error'])
+        self.assertEqual((stats['catalog'], stats['books'], stats['news']), ('Newest', 100, 5))
+        self.assertEqual((stats['inLibrary'], stats['missing'], stats['downloaded']), (10, 85, 0))
+        self.assertEqual((library.addedBooks, library.fieldsSet), ([], []))
+    
+    def testUnknownCatalog(self):
+        stats = SyncEngine(FakeLibrary()).sync(self.server.url, 'Popular')
+        self.assertIn('Popular', stats['error'])
+    
+    def testFixTimestamps(self):
+        # All the books are in the library: nothing is downloaded, the timestamps of the server are written once
+        library = FakeLibrary(range(1, 101))
+        stats = SyncEngine(library).sync(self.server.url, 'Newest')
+        self.assertEqual((stats['missing'], stats['timestampsLoaded'], stats['timestampsFixed']), (0, 95, 95))
+        (field, timestamps), = library.fieldsSet
+        self.assertEqual(field, 'timestamp')
+        self.assertEqual(timestamps[1], datetime.datetime(2010, 1, 1, 0, 59, 31, tzinfo=datetime.timezone.utc))
+        
+        stats = SyncEngine(library).sync(self.server.url, 'Newest')
+        self.assertEqual(stats['timestampsFixed'], 0)
+        self.assertEqual(len(library.fieldsSet), 1)
+    
+    def testWithoutFixTimestamps(self):
+        library = FakeLibrary(range(1, 101))
+        stats = SyncEngine(library, fixTimestamps=False).sync(self.server.url, 'Newest')
+        self.assertEqual((stats['timestampsLoaded'], stats['timestampsFixed'], library.fieldsSet), (95, 0, []))
+    
+    @support.requiresCalibre
+    def testMissingBooksAreAdded(self):
+        library = FakeLibrary(range(1, 51))
+        stats = SyncEngine(library).sync(self.server.url, 'Newest')
+        self.assertEqual((stats['missing'], stats['downloaded'], stats['failed'], stats['added']), (47, 47, 0, 47))
+        self.assertEqual({metadata.uuid for metadata, _formats in library.addedBooks},
+                         {bookUuid(bookId) for bookId in range(51, 101) if bookId % 20})
+        # One file by book
+        self.assertEqual({len(formats) for _metadata, formats in library.addedBooks}, {1})
+    
+    @support.requiresCalibre
+    def testBookOfSeveralServersAddedOnce(self):
+        with SyntheticServer(total=100, pageSize=30) as otherServer:
+            library = FakeLibrary()
+            stats = formatStats(SyncEngine(library).syncAll([self.server.url, otherServer.url], 'Newest'))
+        self.assertEqual(stats['errors'], 0)
+        self.assertEqual((stats['total']['books'], stats['total']['missing'], stats['total']['added']), (200, 95, 95))
+        self.assertEqual(len(library.addedBooks), 95)
+
+
+if __name__ == '__main__':
+    unittest.main()
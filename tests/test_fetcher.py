@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import support  # noqa: F401
+from opds_reader.feed_cache import FeedCache
+from opds_reader.fetcher import PageFetcher, loadRootCatalog
+from opds_reader.opds_parser import parseFeed
+from server import CATALOGS, SyntheticServer
+from synthetic import acquisitionFeed
+
+
+class NextLinkLastTest(unittest.TestCase):
+    def setUp(self):
+        self.server = SyntheticServer(total=2000, pageSize=500, nextLinkLast=True).start()
+        self.catalogUrl = self.server.url.replace('/opds', '') + CATALOGS['Newest']
+    
+    def tearDown(self):
+        self.server.stop()
+    
+    def testHeaderAfterTheEntries(self):
+        header, entries = parseFeed(acquisitionFeed(0, 500, 2000, nextLinkLast=True), self.catalogUrl)
+        self.assertEqual(len(entries), 500)
+        self.assertEqual(header['next'], self.catalogUrl + '?offset=500')
+    
+    def testAllPagesAreLoaded(self):
+        ids = []
+        for page in PageFetcher(4).pages(self.catalogUrl):
+            ids.extend(entry['id'] for entry in page.entries())
+        self.assertEqual(len(set(ids)), 2000)
+        self.assertEqual(self.server.requests, 4)
+
+
+class DeltaPagesTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = FeedCache(os.path.join(self.directory, 'cache.sqlite'))
+        self.server = SyntheticServer(total=5000, pageSize=50).start()
+        self.catalogUrl = self.server.url.replace('/opds', '') + CATALOGS['Newest']
+    
+    def tearDown(self):
+        self.server.stop()
+        self.cache.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+    
+    def loadIds(self):
+        ids = []
+        for page in PageFetcher(4, cache=self.cache).deltaPages(self.catalogUrl):
+            ids.extend(entry['id'] for entry in page.entries())
+        return ids
+    
+    def testNewBooksAreLoaded(self):
+        self.assertEqual(len(self.loadIds()), 5000)
+        self.server.total = 5012
+        self.server.requests = 0
+        ids = self.loadIds()
+        self.assertEqual(len(ids), 5012)
+        self.assertEqual(len(set(ids)), 5012)
+        # The 12 new books are on the first page, the next page ends the run of known books
+        self.assertLessEqual(self.server.requests, 2)
+    
+    def testWithoutNewBooks(self):
+        self.loadIds()
+        self.server.requests = 0
+        self.assertEqual(len(self.loadIds()), 5000)
+        self.assertEqual(self.server.requests, 1)
+
+
+class CredentialsTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = FeedCache(os.path.join(self.directory, 'cache.sqlite'))
+        self.server = SyntheticServer(total=200, pageSize=50, credentials='reader:secret').start()
+        self.opdsUrl = self.server.url.replace('http://', 'http://reader:secret@')
+    
+    def tearDown(self):
+        self.server.stop()
+        self.cache.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+    
+    def testRootCatalog(self):
+        rootCatalog = loadRootCatalog(self.opdsUrl)
+        self.assertIn('Newest', rootCatalog.catalogs)
+        for catalogUrl in rootCatalog.catalogs.values():
+            self.assertNotIn('secret', catalogUrl)
+    
+    def testAllPagesAreLoaded(self):
+        catalogUrl = self.opdsUrl.replace('/opds', '') + CATALOGS['Newest']
+        ids = []
+        pageUrls = []
+        for page in PageFetcher(4, cache=self.cache).pages(catalogUrl):
+            ids.extend(entry['id'] for entry in page.entries())
+            pageUrls.append(page.url)
+        self.assertEqual(len(set(ids)), 200)
+        # The pages are cached without the credentials
+        for pageUrl in pageUrls:
+            self.assertNotIn('secret', pageUrl)
+            self.assertIsNotNone(self.cache.get(pageUrl))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+import unittest
+
+import support  # noqa: F401
+from opds_reader.catalog_entry import CatalogEntry
+from opds_reader.filters import MAX_PREDICATES, FilterBits, formatPredicate, linkFormat, tagPredicate
+
+
+def book(i, tags=(), links=()):
+    return CatalogEntry(f'Title {i}', ('',), f'uuid-{i}', 0, tags=tuple(tags), links=tuple(links))
+
+
+class CountedPredicate:
+    '''A predicate that counts its calls'''
+    
+    def __init__(self, predicate):
+        self.predicate = predicate
+        self.calls = 0
+    
+    def __call__(self, book):
+        self.calls += 1
+        return self.predicate(book)
+
+
+class PredicatesTest(unittest.TestCase):
+    def testLinkFormat(self):
+        self.assertEqual(linkFormat('http://host/get/EPUB/12/library'), 'epub')
+        self.assertEqual(linkFormat('http://host/get/azw3/12'), 'azw3')
+        self.assertEqual(linkFormat('http://host/books/Solaris.PDF?download=1#page'), 'pdf')
+        self.assertEqual(linkFormat('http://host/download?id=12'), '')
+    
+    def testTagPredicate(self):
+        hideNews = tagPredicate(['News', 'Magazine'])
+        self.assertTrue(hideNews(book(0, ['Fiction', 'News'])))
+        self.assertFalse(hideNews(book(1, ['Fiction', 'news'])))
+        self.assertFalse(hideNews(book(2)))
+    
+    def testFormatPredicate(self):
+        # Hidden when none of the links is in one of the formats
+        onlyEpub = formatPredicate(['EPUB', 'pdf'])
+        self.assertFalse(onlyEpub(book(0, links=['http://host/get/mobi/0', 'http://host/get/epub/0'])))
+        self.assertTrue(onlyEpub(book(1, links=['http://host/get/mobi/1'])))
+        self.assertTrue(onlyEpub(book(2)))
+
+
+class FilterBitsTest(unittest.TestCase):
+    def setUp(self):
+        self.books = [book(i, ['News'] if i % 3 == 0 else ['Fiction'],
+                           [f'http://host/get/{"epub" if i % 2 else "mobi"}/{i}']) for i in range(12)]
+        self.filters = FilterBits()
+        self.filters.append(self.books)
+        self.news = CountedPredicate(tagPredicate(['News']))
+        self.formats = CountedPredicate(formatPredicate(['epub']))
+        self.filters.setPredicate('news', self.news)
+        self.filters.setPredicate('formats', self.formats)
+    
+    def testWithoutActiveFilter(self):
+        self.assertEqual(self.filters.visibleIndexes(), list(range(12)))
+        self.assertEqual(self.news.calls, 0)
+    
+    def testActiveFilters(self):
+        self.assertTrue(self.filters.setActive('news', True, self.books))
+        self.assertEqual(self.filters.visibleIndexes(), [1, 2, 4, 5, 7, 8, 10, 11])
+        self.filters.setActive('formats', True, self.books)
+        self.assertEqual(self.filters.visibleIndexes(), [1, 5, 7, 11])
+        self.assertEqual(self.filters.visibleIndexes(start=6), [7, 11])
+        self.assertTrue(self.filters.isHidden(0))
+        self.assertFalse(self.filters.isHidden(1))
+    
+    def testPredicateEvaluatedOnceByBook(self):
+        for active in (True, False, True, False, True):
+            self.filters.setActive('news', active, self.books)
+        self.assertFalse(self.filters.setActive('news', True, self.books))
+        self.assertEqual(self.news.calls, 12)
+        self.assertEqual(self.formats.calls, 0)
+    
+    def testAppendedBooks(self):
+        self.filters.setActive('news', True, self.books)
+        self.filters.append([book(12, ['News']), book(13)])
+        self.assertEqual(self.filters.visibleIndexes(start=12), [13])
+        self.assertEqual(self.news.calls, 14)
+        # Computed when the filter is enabled
+        self.assertEqual(self.formats.calls, 0)
+    
+    def testReplacedPredicate(self):
+        self.filters.setActive('news', True, self.books)
+        self.filters.setPredicate('news', tagPredicate(['Fiction']), self.books)
+        self.assertTrue(self.filters.isComputed('news'))
+        self.assertEqual(self.filters.visibleIndexes(), [0, 3, 6, 9])
+    
+    def testRemovedPredicate(self):
+        self.filters.setActive('news', True, self.books)
+        self.filters.removePredicate('news')
+        self.assertFalse(self.filters.hasPredicate('news'))
+        self.assertEqual(self.filters.visibleIndexes(), list(range(12)))
+    
+    def testComputeSomeBooks(self):
+        # Like the books added to the library
+        inLibrary = set()
+        self.filters.setPredicate('inLibrary', lambda book: book.title in inLibrary)
+        self.filters.setActive('inLibrary', True, self.books)
+        inLibrary.update(['Title 1', 'Title 2'])
+        self.filters.compute('inLibrary', self.books, [1, 2])
+        self.assertEqual(self.filters.visibleIndexes()[:3], [0, 3, 4])
+    
+    def testMaximumOfFilters(self):
+        for i in range(MAX_PREDICATES - 2):
+            self.filters.setPredicate(f'filter {i}', self.news)
+        with self.assertRaises(ValueError):
+            self.filters.setPredicate('one too many', self.news)
+        # The bit of a removed filter is reused
+        self.filters.removePredicate('filter 0')
+        self.filters.setPredicate('one too many', self.news)
+    
+    def testClear(self):
+        self.filters.setActive('news', True, self.books)
+        self.filters.clear()
+        self.filters.append(self.books[:4])
+        self.assertEqual(len(self.filters), 4)
+        self.assertEqual(self.filters.visibleIndexes(), [1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
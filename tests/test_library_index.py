@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+import datetime
+import unittest
+
+import support  # noqa: F401
+from opds_reader.catalog_entry import CatalogEntry
+from opds_reader.library_index import LibraryIndex, normalizeText
+
+
+class FakeLibrary:
+    '''The calls of the new_api of the calibre database used by the index'''
+    
+    def __init__(self, books):
+        # {bookId: (uuid, title, authors, identifiers)}
+        self.books = books
+    
+    def all_book_ids(self):
+        return set(self.books)
+    
+    def all_field_for(self, field, bookIds):
+        column = ('uuid', 'title', 'authors', 'identifiers').index(field)
+        return {bookId: self.books[bookId][column] for bookId in bookIds}
+
+
+LIBRARY = FakeLibrary({
+    1: ('uuid-1', 'The Left Hand of Darkness', ('Ursula K. Le Guin',), {'isbn': '9780441478125'}),
+    2: ('uuid-2', 'Solaris', ('Stanisław Lem',), {}),
+    3: ('uuid-3', 'Beowulf', (), {}),
+})
+
+
+def book(title='', authors=(), uuid='', identifiers=(), timestamp=0):
+    return CatalogEntry(title, tuple(authors), uuid, timestamp, identifiers=tuple(identifiers))
+
+
+class NormalizeTextTest(unittest.TestCase):
+    def testCaseAndWhitespaces(self):
+        self.assertEqual(normalizeText('  The  Left\tHand OF darkness '), 'the left hand of darkness')
+        self.assertEqual(normalizeText(None), '')
+
+
+class HasBookTest(unittest.TestCase):
+    def setUp(self):
+        self.index = LibraryIndex(LIBRARY)
+    
+    def testLibraryBooks(self):
+        self.assertEqual(len(self.index), 3)
+    
+    def testByUuid(self):
+        self.assertTrue(self.index.hasBook(book('Another title', ['Another author'], 'uuid-2')))
+    
+    def testByIdentifier(self):
+        # The type and the value of the identifiers are compared without case
+        self.assertTrue(self.index.hasBook(book('Another title', identifiers=[('ISBN', '9780441478125 ')])))
+        self.assertFalse(self.index.hasBook(book('Another title', identifiers=[('isbn', '9780000000000')])))
+    
+    def testByTitleAndAuthor(self):
+        self.assertTrue(self.index.hasBook(book('the left hand  of darkness', ['Someone', 'ursula k. le guin'])))
+        self.assertFalse(self.index.hasBook(book('The Left Hand of Darkness', ['Someone'])))
+        self.assertFalse(self.index.hasBook(book('Solaris', ['Ursula K. Le Guin'])))
+    
+    def testByTitleWithoutAuthor(self):
+        self.assertTrue(self.index.hasBook(book('beowulf')))
+        self.assertTrue(self.index.hasBook(book('Solaris')))
+        self.assertFalse(self.index.hasBook(book('The Dispossessed')))
+    
+    def testBooksAddedFromACatalog(self):
+        downloaded = book('The Dispossessed', ['Ursula K. Le Guin'], 'uuid-4')
+        self.assertFalse(self.index.hasBook(downloaded))
+        self.index.addBooks([downloaded])
+        self.assertTrue(self.index.hasBook(downloaded))
+        self.assertTrue(self.index.hasBook(book('The Dispossessed', ['Ursula K. Le Guin'])))
+        # Not in the library, no book to update
+        self.assertEqual(self.index.findBookIds(downloaded), set())
+
+
+class MatchTimestampsTest(unittest.TestCase):
+    def setUp(self):
+        self.index = LibraryIndex(FakeLibrary({
+            1: ('uuid-1', 'Solaris', ('Stanisław Lem',), {}),
+            # The same book twice in the library
+            2: ('uuid-2', 'Beowulf', ('Anonymous',), {}),
+            3: ('uuid-3', 'beowulf', ('anonymous',), {}),
+            4: ('uuid-4', 'The Dispossessed', ('Ursula K. Le Guin',), {}),
+        }))
+    
+    def testMatches(self):
+        matches = self.index.matchTimestamps([
+            # The UUID first: a single book even when the title is the same as another book
+            book('Beowulf', ['Anonymous'], 'uuid-3', timestamp=1445412480),
+            book('Solaris', ['Stanisław Lem'], timestamp=1445412481),
+            book('beowulf', ['ANONYMOUS'], timestamp=1445412482),
+            book('Roadside Picnic', ['Arkady Strugatsky'], timestamp=1445412483),
+        ])
+        utc = datetime.timezone.utc
+        self.assertEqual(matches.timestamps, {
+            1: datetime.datetime(2015, 10, 21, 7, 28, 1, tzinfo=utc),
+            # The ambiguous books are all updated, the last book of the selection wins
+            2: datetime.datetime(2015, 10, 21, 7, 28, 2, tzinfo=utc),
+            3: datetime.datetime(2015, 10, 21, 7, 28, 2, tzinfo=utc),
+        })
+        self.assertEqual((matches.matched, matches.ambiguous, matches.unmatched), (2, 1, 1))
+    
+    def testBooksAddedFromACatalogAreNotUpdated(self):
+        downloaded = book('Roadside Picnic', ['Arkady Strugatsky'], 'uuid-5')
+        self.index.addBooks([downloaded])
+        matches = self.index.matchTimestamps([downloaded])
+        self.assertEqual((matches.timestamps, matches.unmatched), ({}, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+import unittest
+
+import support
+from server import CATALOGS, SyntheticServer
+
+
+@support.requiresCalibre
+class CalibreTimestampsTest(unittest.TestCase):
+    def setUp(self):
+        self.server = SyntheticServer(total=1000, pageSize=50).start()
+        self.catalogUrl = self.server.url.replace('/opds', '') + CATALOGS['Newest']
+    
+    def tearDown(self):
+        self.server.stop()
+    
+    def testTimestampsByChunks(self):
+        # The loader is a QThread: imported with calibre, like the dialog
+        try:
+            from qt.core import QCoreApplication
+        except ImportError:
+            from PyQt5.Qt import QCoreApplication
+        
+        from opds_reader.calibre_rest import BOOKS_BY_REQUEST
+        from opds_reader.loader import CatalogLoader
+        
+        app = QCoreApplication.instance() or QCoreApplication([])
+        loader = CatalogLoader(None, self.catalogUrl, 4, calibreServer=True)
+        books = []
+        timestamps = []
+        heldBooks = []
+        
+        def booksLoaded(loadedBooks):
+            books.extend(loadedBooks)
+            heldBooks.append(len(loader._timestampBooks))
+        
+        loader.booksLoaded.connect(booksLoaded)
+        loader.timestampsLoaded.connect(timestamps.extend)
+        loader.loadFailed.connect(self.fail)
+        loader.finished.connect(app.quit)
+        loader.start()
+        app.exec_()
+        loader.wait()
+        self.assertEqual(len(books), 1000)
+        self.assertEqual({id(book) for book, _timestamp in timestamps}, {id(book) for book in books})
+        # The books waiting for their timestamps are less than a chunk
+        self.assertLess(max(heldBooks), BOOKS_BY_REQUEST)
+
+
+@support.requiresCalibre
+class OnDemandTest(unittest.TestCase):
+    '''The pages of the catalog loaded when the book list is scrolled to the end'''
+    
+    def setUp(self):
+        try:
+            from qt.core import QCoreApplication
+        except ImportError:
+            from PyQt5.Qt import QCoreApplication
+        
+        # Kept until the end of the test, with the book list
+        self.app = QCoreApplication.instance() or QCoreApplication([])
+        self.server = SyntheticServer(total=500, pageSize=50).start()
+        self.catalogUrl = self.server.url.replace('/opds', '') + CATALOGS['Newest']
+    
+    def tearDown(self):
+        self.server.stop()
+    
+    def load(self, onWaiting, model=None):
+        from opds_reader.loader import CatalogLoader
+        
+        loader = CatalogLoader(None, self.catalogUrl, 4, onDemand=True)
+        books = []
+        waits = []
+        
+        def waitingForDemand():
+            waits.append((len(books), self.server.requests))
+            onWaiting(loader, len(waits))
+        
+        loader.booksLoaded.connect(books.extend)
+        if model is not None:
+            model.pageLoader = loader
+            loader.booksLoaded.connect(model.appendBooks)
+        loader.waitingForDemand.connect(waitingForDemand)
+        loader.loadFailed.connect(self.fail)
+        loader.finished.connect(self.app.quit)
+        loader.start()
+        self.app.exec_()
+        loader.wait()
+        return books, waits
+    
+    def testPagesLoadedOnDemand(self):
+        from opds_reader.loader import PREFETCH_PAGES
+        
+        def onWaiting(loader, waitCount):
+            if waitCount < 3:
+                loader.loadMore()
+            else:
+                loader.loadAll()
+        
+        books, waits = self.load(onWaiting)
+        self.assertEqual([bookCount for bookCount, _requests in waits], [50, 100, 150])
+        # Only a few pages are requested ahead of the demand
+        for bookCount, requests in waits:
+            self.assertLessEqual(requests, bookCount // 50 + PREFETCH_PAGES)
+        self.assertEqual(len(books), 500)
+    
+    def testCancelWhileWaiting(self):
+        books, waits = self.load(lambda loader, waitCount: loader.cancel())
+        self.assertEqual((len(books), len(waits)), (50, 1))
+    
+    def testBookListFetchesMore(self):
+        try:
+            from qt.core import QModelIndex
+        except ImportError:
+            from PyQt5.Qt import QModelIndex
+        
+        from opds_reader.action import OpdsBooksModel
+        from opds_reader.book_store import BookStore
+        
+        model = OpdsBooksModel(None, [], None, BookStore())
+        
+        def onWaiting(loader, waitCount):
+            self.assertTrue(model.canFetchMore(QModelIndex()))
+            if waitCount == 1:
+                # Scrolled to the end
+                model.fetchMore(QModelIndex())
+            else:
+                # The sort needs all the books
+                model.sort(0)
+                self.assertFalse(model.canFetchMore(QModelIndex()))
+        
+        _books, waits = self.load(onWaiting, model)
+        self.assertEqual([bookCount for bookCount, _requests in waits], [50, 100])
+        self.assertEqual(model.rowCount(QModelIndex()), 500)
+        self.assertEqual(list(model.rows), list(model.books.sortedIds(range(500), 0)))
+        model.closeBookStore()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+import json
+import threading
+import time
+import unittest
+from unittest import mock
+
+import support  # noqa: F401
+from opds_reader import metrics
+from opds_reader.fetcher import PageFetcher
+from opds_reader.metrics import NO_METRICS, LoadMetrics
+from server import CATALOGS, SyntheticServer
+
+
+class LoadMetricsTest(unittest.TestCase):
+    def testCountersOfAllTheThreads(self):
+        loadMetrics = LoadMetrics('test')
+        
+        def countBooks():
+            for _ in range(1000):
+                loadMetrics.count('books')
+                loadMetrics.count('bytes', 10)
+        
+        threads = [threading.Thread(target=countBooks) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(loadMetrics.counters, {'books': 4000, 'bytes': 40000})
+    
+    def testPhases(self):
+        loadMetrics = LoadMetrics()
+        with loadMetrics.phase('parse'):
+            time.sleep(0.01)
+        # Also measured when the phase fails
+        with self.assertRaises(ValueError), loadMetrics.phase('parse'):
+            raise ValueError()
+        self.assertEqual(loadMetrics.calls['parse'], 2)
+        self.assertGreaterEqual(loadMetrics.durations['parse'], 0.01)
+    
+    def testOldestEventsDropped(self):
+        loadMetrics = LoadMetrics()
+        with mock.patch.object(metrics, 'MAX_EVENTS', 3):
+            for i in range(5):
+                loadMetrics.event('page', index=i)
+        self.assertEqual([event['index'] for event in loadMetrics.events], [2, 3, 4])
+        self.assertEqual(loadMetrics.droppedEvents, 2)
+        self.assertEqual(loadMetrics.events[0]['thread'], threading.current_thread().name)
+    
+    def testElapsedStopsAtTheEnd(self):
+        loadMetrics = LoadMetrics()
+        loadMetrics.finish()
+        elapsed = loadMetrics.elapsed()
+        time.sleep(0.01)
+        loadMetrics.finish()
+        self.assertEqual(loadMetrics.elapsed(), elapsed)
+    
+    def testTrace(self):
+        loadMetrics = LoadMetrics('http://host/opds')
+        loadMetrics.count('pages', 2)
+        loadMetrics.addTime('request', 0.5)
+        loadMetrics.addTime('parse', 0.25)
+        loadMetrics.addTime('request', 0.5)
+        loadMetrics.event('page', url='http://host/opds?offset=50')
+        trace = json.loads(loadMetrics.toJson())
+        self.assertEqual(trace['name'], 'http://host/opds')
+        self.assertEqual(trace['counters'], {'pages': 2})
+        # The longest phases first
+        self.assertEqual(list(trace['phases'].items()), [
+            ('request', {'calls': 2, 'seconds': 1.0}),
+            ('parse', {'calls': 1, 'seconds': 0.25}),
+        ])
+        self.assertEqual(trace['events'][0]['url'], 'http://host/opds?offset=50')
+        self.assertNotIn('events', loadMetrics.snapshot(events=False))
+        lines = loadMetrics.text().splitlines()
+        self.assertEqual([line.split()[0] for line in lines], ['elapsed', 'request', 'parse', 'pages'])
+    
+    def testNoMetrics(self):
+        NO_METRICS.count('books')
+        NO_METRICS.event('page')
+        with NO_METRICS.phase('parse'):
+            pass
+        self.assertEqual((NO_METRICS.counters, NO_METRICS.durations, NO_METRICS.events), ({}, {}, []))
+
+
+class PageMetricsTest(unittest.TestCase):
+    def setUp(self):
+        self.server = SyntheticServer(total=200, pageSize=50).start()
+    
+    def tearDown(self):
+        self.server.stop()
+    
+    def testEventByPage(self):
+        loadMetrics = LoadMetrics()
+        catalogUrl = self.server.url.replace('/opds', '') + CATALOGS['Newest']
+        for page in PageFetcher(4, metrics=loadMetrics).pages(catalogUrl):
+            list(page.entries())
+        self.assertEqual(loadMetrics.counters['requests'], 4)
+        self.assertEqual(sorted(event['entries'] for event in loadMetrics.events if event['name'] == 'page'),
+                         [50, 50, 50, 50])
+        self.assertEqual(loadMetrics.calls['request'], 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+import unittest
+
+import support
+from opds_reader.opds_parser import OpdsFeedParser
+
+BASE_URL = 'http://books.example.com/opds/navcatalog/4f6e6577657374'
+
+HEADER = '''<?xml version="1.0" encoding="utf-8"?>
+<feed{namespaces}>
+  <title>Newest</title>
+  <link rel="start" href="/opds"/>
+  <link rel="next" href="/opds/navcatalog/4f6e6577657374?offset=2"/>
+'''
+
+ENTRY = '''  <entry>
+    <title>{title}</title>
+    <id>urn:uuid:{id}</id>
+    <author><name>Author {id}</name></author>
+    <dc:identifier>urn:isbn:{id}</dc:identifier>
+    <link rel="http://opds-spec.org/acquisition" type="application/epub+zip" href="/get/epub/{id}/library"/>
+  </entry>
+'''
+
+ATOM_NAMESPACES = ' xmlns="http://www.w3.org/2005/Atom" xmlns:dc="http://purl.org/dc/terms/"'
+
+
+def chunk(text) -> bytes:
+    return text.encode('utf-8')
+
+
+class HeaderCompleteTest(unittest.TestCase):
+    def assertHeaderCompleteAtTheFirstEntry(self, namespaces):
+        parser = OpdsFeedParser(BASE_URL)
+        parser.feedData(chunk(HEADER.format(namespaces=namespaces)))
+        self.assertFalse(parser.headerComplete)
+        parser.feedData(chunk('  <entry>\n    <title>'))
+        self.assertTrue(parser.headerComplete)
+        self.assertEqual(parser.header['next'], 'http://books.example.com/opds/navcatalog/4f6e6577657374?offset=2')
+    
+    def testAtomNamespace(self):
+        self.assertHeaderCompleteAtTheFirstEntry(ATOM_NAMESPACES)
+    
+    def testWithoutNamespace(self):
+        # Some servers don't declare the Atom namespace
+        self.assertHeaderCompleteAtTheFirstEntry(' xmlns:dc="http://purl.org/dc/terms/"')
+
+
+@support.requiresCalibre
+class FallbackTest(unittest.TestCase):
+    def parse(self, *chunks):
+        parser = OpdsFeedParser(BASE_URL)
+        entries = []
+        for data in chunks:
+            entries.extend(parser.feedData(chunk(data)))
+        entries.extend(parser.close())
+        self.assertTrue(parser.isMalformed)
+        return parser.header, entries
+    
+    def testMalformedEntryAfterTheHeader(self):
+        # The header and the first entry are read before the error
+        header, entries = self.parse(
+            HEADER.format(namespaces=ATOM_NAMESPACES) + ENTRY.format(title='Title 1', id=1),
+            ENTRY.format(title='Title & 2', id=2) + '</feed>\n',
+        )
+        self.assertEqual([link['rel'] for link in header['links']], ['start', 'next'])
+        self.assertEqual(header['next'], 'http://books.example.com/opds/navcatalog/4f6e6577657374?offset=2')
+        self.assertEqual([entry['id'] for entry in entries], ['urn:uuid:1', 'urn:uuid:2'])
+    
+    def testEntriesOfFeedparser(self):
+        _header, entries = self.parse(
+            HEADER.format(namespaces=ATOM_NAMESPACES) + ENTRY.format(title='Title & 1', id=1) + '</feed>\n',
+        )
+        entry, = entries
+        self.assertEqual(entry['title'], 'Title & 1')
+        self.assertEqual(entry['authors'], ['Author 1'])
+        self.assertEqual(entry['identifiers'], ['urn:isbn:1'])
+        self.assertEqual(entry['links'][0]['href'], 'http://books.example.com/get/epub/1/library')
+
+
+if __name__ == '__main__':
+    unittest.main()
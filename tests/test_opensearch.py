@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+import unittest
+
+import support  # noqa: F401
+from opds_reader.fetcher import loadRootCatalog
+from opds_reader.opensearch import expandTemplate, findSearchLink, parseSearchDescription, searchUrl
+from server import SyntheticServer
+
+DESCRIPTION = b'''<?xml version="1.0" encoding="UTF-8"?>
+<OpenSearchDescription xmlns="http://a9.com/-/spec/opensearch/1.1/">
+  <ShortName>Books</ShortName>
+  <Url type="text/html" template="/search?q={searchTerms}"/>
+  <Url type="application/atom+xml" template="/atom/search?q={searchTerms}"/>
+  <Url type="application/atom+xml;profile=opds-catalog;kind=acquisition"
+       template="/opds/search?q={searchTerms}&amp;page={startPage?}"/>
+</OpenSearchDescription>
+'''
+
+
+def link(href, type, rel='search'):
+    return {'rel': rel, 'href': href, 'type': type, 'title': ''}
+
+
+class FindSearchLinkTest(unittest.TestCase):
+    def testDescriptionFirst(self):
+        description = link('/opds/search', 'application/opensearchdescription+xml')
+        self.assertIs(findSearchLink([
+            link('/opds/search/{searchTerms}', 'application/atom+xml'),
+            link('/opds', 'application/atom+xml', 'start'),
+            description,
+        ]), description)
+    
+    def testAtomTemplate(self):
+        template = link('/opds/search/{searchTerms}', 'application/atom+xml;profile=opds-catalog')
+        self.assertIs(findSearchLink([link('/opds/search', 'application/atom+xml'), template]), template)
+    
+    def testWithoutSearch(self):
+        self.assertIsNone(findSearchLink([link('/opds/search', 'application/atom+xml')]))
+        self.assertIsNone(findSearchLink([]))
+
+
+class ParseSearchDescriptionTest(unittest.TestCase):
+    def testOpdsTemplateFirst(self):
+        self.assertEqual(parseSearchDescription(DESCRIPTION, 'http://books.example.com/opds/description'),
+                         'http://books.example.com/opds/search?q={searchTerms}&page={startPage?}')
+    
+    def testWithoutAtomTemplate(self):
+        content = DESCRIPTION.replace(b'application/atom+xml', b'application/rss+xml')
+        self.assertIsNone(parseSearchDescription(content))
+
+
+class ExpandTemplateTest(unittest.TestCase):
+    def testSearchTermsAreEncoded(self):
+        self.assertEqual(expandTemplate('http://host/search/{searchTerms}', 'le guin & co/2'),
+                         'http://host/search/le%20guin%20%26%20co%2F2')
+    
+    def testParameters(self):
+        self.assertEqual(expandTemplate('http://host/s?q={searchTerms}&i={startIndex}&n={count}&l={language}', 'a'),
+                         'http://host/s?q=a&i=1&n=&l=*')
+    
+    def testOptionalParameters(self):
+        # Left empty, except the search terms
+        self.assertEqual(expandTemplate('http://host/s?q={searchTerms?}&p={startPage?}&g={geo:box?}', 'a'),
+                         'http://host/s?q=a&p=&g=')
+    
+    def testUnknownParameter(self):
+        with self.assertRaises(ValueError):
+            expandTemplate('http://host/s?q={searchTerms}&g={geo:box}', 'a')
+        with self.assertRaises(ValueError):
+            expandTemplate('http://host/s?q={searchTerms}&s={sort}', 'a')
+
+
+class SearchUrlTest(unittest.TestCase):
+    def setUp(self):
+        self.server = SyntheticServer(total=100).start()
+    
+    def tearDown(self):
+        self.server.stop()
+    
+    def testSearchOfTheServer(self):
+        searchLink = findSearchLink(loadRootCatalog(self.server.url).header['links'])
+        self.assertEqual(searchUrl(searchLink, 'le guin'), self.server.url + '/search/le%20guin')
+
+
+if __name__ == '__main__':
+    unittest.main()
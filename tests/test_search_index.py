@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+import unittest
+
+import support  # noqa: F401
+from opds_reader.catalog_entry import entryFromOpds
+from opds_reader.opds_parser import parseFeed
+from opds_reader.search_index import SearchIndex, matchingBooks
+from synthetic import acquisitionFeed
+
+QUERIES = ('author 7', 'book 1234', 'tag:fiction', 'author:author title:book', 'co', 'nothing', '')
+
+
+class MatchingBooksTest(unittest.TestCase):
+    def setUp(self):
+        entries = parseFeed(acquisitionFeed(0, 2000, 2000), 'http://localhost:8080/opds')[1]
+        self.books = [entryFromOpds(entry) for entry in entries]
+        self.index = SearchIndex()
+        self.index.addBooks(self.books)
+    
+    def testSameMatchesAsTheIndex(self):
+        for query in QUERIES:
+            self.assertEqual(matchingBooks(self.books, query), self.index.search(query), query)
+    
+    def testPagesAddedToTheMatches(self):
+        # The matches of the appended pages, as the model of the book list
+        for query in QUERIES[:-1]:
+            matches = matchingBooks(self.books[:50], query)
+            for firstBookId in range(50, len(self.books), 50):
+                matches |= matchingBooks(self.books[firstBookId:firstBookId + 50], query, firstBookId)
+            self.assertEqual(matches, self.index.search(query), query)
+
+
+if __name__ == '__main__':
+    unittest.main()
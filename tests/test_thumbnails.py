@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+import threading
+import unittest
+
+import support  # noqa: F401
+from opds_reader.thumbnails import ThumbnailFetcher
+from server import SyntheticServer
+
+
+class ThumbnailFetcherTest(unittest.TestCase):
+    def setUp(self):
+        self.server = SyntheticServer(total=10).start()
+        self.url = self.server.url.replace('/opds', '') + '/get/thumb/1/library'
+        self.loaded = threading.Event()
+        self.fetcher = ThumbnailFetcher(onLoaded=lambda url, thumbnail: self.loaded.set())
+    
+    def tearDown(self):
+        self.fetcher.close()
+        self.server.stop()
+    
+    def testRequestedUntilDelivered(self):
+        self.assertTrue(self.fetcher.request(self.url))
+        self.assertTrue(self.loaded.wait(10))
+        # Loaded, but not kept by the caller yet: a repaint doesn't download it again
+        self.assertFalse(self.fetcher.request(self.url))
+        self.assertEqual(self.server.requests, 1)
+        self.fetcher.delivered(self.url)
+        # Dropped by the caller since, it can be loaded again
+        self.loaded.clear()
+        self.assertTrue(self.fetcher.request(self.url))
+        self.assertTrue(self.loaded.wait(10))
+        self.assertEqual(self.server.requests, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
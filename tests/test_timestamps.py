@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+import datetime
+import unittest
+
+import support  # noqa: F401
+from opds_reader.timestamps import (
+    _parseTimestampToEpoch,
+    datetimeToEpoch,
+    epochToDatetime,
+    parseTimestampsToEpoch,
+    parseTimestampToEpoch,
+)
+
+# 2015-10-21T07:28:00Z
+EPOCH = 1445412480
+
+
+class FastPathTest(unittest.TestCase):
+    def testUtc(self):
+        self.assertEqual(parseTimestampToEpoch('2015-10-21T07:28:00Z'), EPOCH)
+        self.assertEqual(parseTimestampToEpoch('2015-10-21T07:28:00z'), EPOCH)
+        self.assertEqual(parseTimestampToEpoch('2015-10-21T07:28:00+00:00'), EPOCH)
+    
+    def testWithoutOffsetIsUtc(self):
+        self.assertEqual(parseTimestampToEpoch('2015-10-21T07:28:00'), EPOCH)
+        self.assertEqual(parseTimestampToEpoch('2015-10-21 07:28:00'), EPOCH)
+    
+    def testFractionOfSecond(self):
+        self.assertEqual(parseTimestampToEpoch('2015-10-21T07:28:00.999+00:00'), EPOCH)
+    
+    def testDate(self):
+        self.assertEqual(parseTimestampToEpoch('2015-10-21'), EPOCH - (7 * 60 + 28) * 60)
+
+
+class TimeZonesTest(unittest.TestCase):
+    def testOffsets(self):
+        self.assertEqual(parseTimestampToEpoch('2015-10-21T09:28:00+02:00'), EPOCH)
+        self.assertEqual(parseTimestampToEpoch('2015-10-21T02:28:00-05:00'), EPOCH)
+        self.assertEqual(parseTimestampToEpoch('2015-10-21T12:58:00+05:30'), EPOCH)
+    
+    def testOffsetOnTheDayBefore(self):
+        self.assertEqual(parseTimestampToEpoch('2015-10-20T23:28:00-08:00'), EPOCH)
+    
+    def testDatetimes(self):
+        timestamp = epochToDatetime(EPOCH)
+        self.assertEqual(timestamp, datetime.datetime(2015, 10, 21, 7, 28, tzinfo=datetime.timezone.utc))
+        self.assertEqual(datetimeToEpoch(timestamp), EPOCH)
+        # The naive datetimes are in UTC
+        self.assertEqual(datetimeToEpoch(datetime.datetime(2015, 10, 21, 7, 28)), EPOCH)
+
+
+class FallbackTest(unittest.TestCase):
+    def testSameAsTheFastPath(self):
+        for rawTimestamp in ('2015-10-21T07:28:00Z', '2015-10-21T09:28:00+02:00', '2015-10-21T02:28:00-05:00',
+                             '2015-10-21T07:28:00.123Z', '2015-10-21 07:28:00', '2015-10-21'):
+            self.assertEqual(_parseTimestampToEpoch(rawTimestamp), parseTimestampToEpoch(rawTimestamp), rawTimestamp)
+    
+    def testFormsRefusedByFromisoformat(self):
+        self.assertEqual(parseTimestampToEpoch(' 2015-10-21T07:28:00Z '), EPOCH)
+        self.assertEqual(parseTimestampToEpoch('2015-10-21T07:28:00,5Z'), EPOCH)
+        self.assertEqual(parseTimestampToEpoch('2015-10-21T09:28:00 +02'), EPOCH)
+    
+    def testLeapSecond(self):
+        self.assertEqual(parseTimestampToEpoch('2016-12-31T23:59:60Z'), parseTimestampToEpoch('2017-01-01T00:00:00Z'))
+    
+    def testLeapYear(self):
+        self.assertEqual(parseTimestampToEpoch('2016-02-29'), parseTimestampToEpoch('2016-03-01') - 24 * 3600)
+
+
+class InvalidTimestampTest(unittest.TestCase):
+    INVALID = (
+        '2015-02-31', '2015-02-29T00:00:00Z', '2015-04-31', '2015-13-01', '2015-00-10', '2015-10-00',
+        '2015-10-21T24:00:00Z', '2015-10-21T07:60:00Z', '2015-10-21T07:28:61Z', '2015-10-21T07:28:00+24:00',
+        'yesterday', '', '21/10/2015',
+    )
+    
+    def testFallbackReturnsNone(self):
+        for rawTimestamp in self.INVALID:
+            self.assertIsNone(_parseTimestampToEpoch(rawTimestamp), rawTimestamp)
+    
+    def testValueError(self):
+        for rawTimestamp in self.INVALID:
+            with self.assertRaises(ValueError, msg=rawTimestamp):
+                parseTimestampToEpoch(rawTimestamp)
+    
+    def testDefaultOfThePage(self):
+        self.assertEqual(parseTimestampsToEpoch(['2015-10-21T07:28:00Z', '2015-02-31', None], 0), [EPOCH, 0, 0])
+
+
+if __name__ == '__main__':
+    unittest.main()
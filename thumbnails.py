@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+from .fetcher import openUrl
+
+# Requests waiting for a worker: the oldest (the rows scrolled out of the view) are dropped
+MAX_PENDING = 100
+THUMBNAIL_TIMEOUT = 30
+
+
+class LruCache:
+    '''
+    Cache of at most "maxSize" bytes: the size of each value is given when it is added,
+    the values used the least recently are removed first. Used by a single thread.
+    '''
+    
+    def __init__(self, maxSize):
+        self.maxSize = maxSize
+        self.size = 0
+        self._values = OrderedDict()
+    
+    def __len__(self) -> int:
+        return len(self._values)
+    
+    def __contains__(self, key) -> bool:
+        return key in self._values
+    
+    def get(self, key, default=None):
+        item = self._values.get(key)
+        if item is None:
+            return default
+        self._values.move_to_end(key)
+        return item[0]
+    
+    def put(self, key, value, size):
+        if key in self._values:
+            self.size -= self._values.pop(key)[1]
+        if size > self.maxSize:
+            return
+        self._values[key] = (value, size)
+        self.size += size
+        while self.size > self.maxSize:
+            _key, (_value, oldSize) = self._values.popitem(last=False)
+            self.size -= oldSize
+    
+    def clear(self):
+        self._values.clear()
+        self.size = 0
+
+
+class ThumbnailCache:
+    '''
+    Persistent cache of the thumbnails, by URL, in a SQLite database.
+    The size of the cache is bounded: the thumbnails used the least recently are removed first.
+    The cache can be used by several threads.
+    '''
+    
+    def __init__(self, path, maxSize=50 * 1024 * 1024):
+        self.path = path
+        self.maxSize = maxSize
+        self._lock = threading.Lock()
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('''CREATE TABLE IF NOT EXISTS thumbnails (
+            url TEXT PRIMARY KEY,
+            data BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            last_used REAL NOT NULL
+        )''')
+        self._db.execute('CREATE INDEX IF NOT EXISTS thumbnails_last_used ON thumbnails (last_used)')
+    
+    def close(self):
+        with self._lock:
+            self._db.close()
+    
+    def get(self, url) -> Optional[bytes]:
+        with self._lock:
+            row = self._db.execute('SELECT data FROM thumbnails WHERE url = ?', (url,)).fetchone()
+            if row is not None:
+                self._db.execute('UPDATE thumbnails SET last_used = ? WHERE url = ?', (time.time(), url))
+        return row[0] if row else None
+    
+    def put(self, url, data):
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO thumbnails (url, data, size, last_used) VALUES (?, ?, ?, ?)',
+                (url, data, len(data), time.time()),
+            )
+    
+    def size(self) -> int:
+        with self._lock:
+            return self._db.execute('SELECT COALESCE(SUM(size), 0) FROM thumbnails').fetchone()[0]
+    
+    def evict(self):
+        '''Remove the least recently used thumbnails until the cache fits in its maximum size'''
+        with self._lock:
+            total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM thumbnails').fetchone()[0]
+            if total <= self.maxSize:
+                return
+            removed = []
+            for url, size in self._db.execute('SELECT url, size FROM thumbnails ORDER BY last_used'):
+                if total <= self.maxSize:
+                    break
+                removed.append((url,))
+                total -= size
+            self._db.executemany('DELETE FROM thumbnails WHERE url = ?', removed)
+    
+    def purge(self):
+        with self._lock:
+            self._db.execute('DELETE FROM thumbnails')
+            self._db.execute('VACUUM')
+
+
+def _ignore(*args):
+    pass
+
+
+class ThumbnailFetcher:
+    '''
+    Download the thumbnails requested by the view, in "maxWorkers" threads and at most "maxPerHost"
+    requests at a time by server.
+    
+    The last requested thumbnails are downloaded first (the rows shown now), and only the last
+    MAX_PENDING requests are kept: when the view is scrolled fast, the thumbnails of the rows
+    scrolled out are not downloaded. The thumbnails are read from the cache, else downloaded
+    and added to the cache, then decoded by decode(data) in the worker thread.
+    The result is passed to onLoaded(url, thumbnail), by the worker thread. The URL stays requested
+    until the caller calls delivered(url), once the thumbnail is kept where it looks for it first:
+    the thumbnail is not downloaded again in between. The URLs that fail are not requested again.
+    '''
+    
+    def __init__(self, cache: ThumbnailCache = None, maxWorkers=4, maxPerHost=2, maxPending=MAX_PENDING,
+                 decode=None, onLoaded=None, log=None):
+        self.cache = cache
+        self.maxWorkers = max(1, maxWorkers)
+        self.maxPerHost = max(1, maxPerHost)
+        self.decode = decode or bytes
+        self.onLoaded = onLoaded or _ignore
+        self.log = log or _ignore
+        self._pending = deque(maxlen=maxPending)
+        self._requested = set()
+        self._failed = set()
+        self._active: Dict[str, int] = {}
+        self._workers = 0
+        self._closed = False
+        self._condition = threading.Condition()
+    
+    def request(self, url) -> bool:
+        '''Request a thumbnail, return False if it is already requested or failed'''
+        with self._condition:
+            if self._closed or url in self._requested or url in self._failed:
+                return False
+            if len(self._pending) == self._pending.maxlen:
+                self._requested.discard(self._pending[0])
+            self._pending.append(url)
+            self._requested.add(url)
+            if self._workers < self.maxWorkers:
+                self._workers += 1
+                threading.Thread(target=self._work, name='ThumbnailFetcher', daemon=True).start()
+            self._condition.notify()
+            return True
+    
+    def delivered(self, url):
+        '''The thumbnail passed to onLoaded is kept by the caller, it can be requested again once dropped'''
+        with self._condition:
+            self._requested.discard(url)
+    
+    def cancelPending(self):
+        '''Forget the requests not started, they can be requested again'''
+        with self._condition:
+            self._requested.difference_update(self._pending)
+            self._pending.clear()
+    
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._pending.clear()
+            self._condition.notify_all()
+    
+    def _next(self) -> Optional[str]:
+        '''The last requested URL of a server with less than maxPerHost requests, None when closed'''
+        with self._condition:
+            while not self._closed:
+                for url in reversed(self._pending):
+                    host = urlparse(url).netloc
+                    if self._active.get(host, 0) < self.maxPerHost:
+                        self._pending.remove(url)
+                        self._active[host] = self._active.get(host, 0) + 1
+                        return url
+                self._condition.wait()
+            self._workers -= 1
+            return None
+    
+    def _done(self, url, failed):
+        host = urlparse(url).netloc
+        with self._condition:
+            self._active[host] -= 1
+            if failed:
+                self._requested.discard(url)
+                self._failed.add(url)
+            self._condition.notify_all()
+    
+    def _work(self):
+        while True:
+            url = self._next()
+            if url is None:
+                return
+            thumbnail = None
+            try:
+                thumbnail = self.decode(self._load(url))
+            except Exception as e:
+                self.log('Failed loading the thumbnail', url, e)
+            if thumbnail is not None:
+                self.onLoaded(url, thumbnail)
+            self._done(url, thumbnail is None)
+    
+    def _load(self, url) -> bytes:
+        data = self.cache.get(url) if self.cache else None
+        if data is None:
+            with openUrl(url, THUMBNAIL_TIMEOUT, {'Accept': 'image/*'}) as response:
+                data = response.read()
+            if self.cache:
+                self.cache.put(url, data)
+        return data
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+__license__   = 'GPL v3'
+__copyright__ = '2015, Steinar Bang ; 2020, un_pogaz <un.pogaz@gmail.com>'
+
+
+import calendar
+import datetime
+import re
+from functools import lru_cache
+from typing import Iterable, List, Optional
+
+# RFC 3339 / ISO 8601 timestamps, as used by Atom and the calibre REST API:
+# 2015-10-21T07:28:00Z, 2015-10-21T09:28:00.123+02:00, 2015-10-21 07:28:00, 2015-10-21
+# The timestamps without offset are in UTC
+_timestamp = re.compile(
+    r'\s*(\d{4})-(\d\d)-(\d\d)'
+    r'(?:[Tt ](\d\d):(\d\d)(?::(\d\d)(?:[.,]\d+)?)?)?'
+    r'\s*(?:[Zz]|([+-])(\d\d):?(\d\d)?)?\s*$',
+)
+
+
+@lru_cache(maxsize=4096)
+def parseTimestampToEpoch(rawTimestamp) -> int:
+    '''
+    Parse a RFC 3339 timestamp to seconds since the epoch, the UTC offset is applied.
+    Raise ValueError if the timestamp is not valid.
+    
+    The results are cached: the feeds often repeat the same timestamp for all their entries.
+    '''
+    # Fast path, in C: the usual forms, "Z" is only accepted by Python 3.11
+    try:
+        timestamp = datetime.datetime.fromisoformat(
+            rawTimestamp[:-1] + '+00:00' if rawTimestamp[-1:] in ('Z', 'z') else rawTimestamp,
+        )
+    except ValueError:
+        epoch = _parseTimestampToEpoch(rawTimestamp)
+        if epoch is None:
+            raise ValueError(f'Invalid timestamp: {rawTimestamp!r}') from None
+        return epoch
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=datetime.timezone.utc)
+    return int(timestamp.timestamp())
+
+
+def _parseTimestampToEpoch(rawTimestamp) -> Optional[int]:
+    '''The forms refused by fromisoformat, None if the timestamp is not valid (like 2015-02-31)'''
+    match = _timestamp.match(rawTimestamp)
+    if match is None:
+        return None
+    year, month, day, hour, minute, second, sign, offsetHours, offsetMinutes = match.groups()
+    year, month, day = int(year), int(month), int(day)
+    hour, minute, second = int(hour or 0), int(minute or 0), int(second or 0)
+    offsetHours, offsetMinutes = int(offsetHours or 0), int(offsetMinutes or 0)
+    # 60 seconds: a leap second
+    if not (1 <= month <= 12 and 1 <= day <= calendar.monthrange(year, month)[1]
+            and hour <= 23 and minute <= 59 and second <= 60 and offsetHours <= 23 and offsetMinutes <= 59):
+        return None
+    epoch = calendar.timegm((year, month, day, hour, minute, second))
+    if sign:
+        offset = offsetHours * 3600 + offsetMinutes * 60
+        epoch += -offset if sign == '+' else offset
+    return epoch
+
+
+def parseTimestampsToEpoch(rawTimestamps: Iterable[str], default=None) -> List[int]:
+    '''Parse the timestamps of a page in one pass, the invalid timestamps are replaced by "default"'''
+    epochs = []
+    for rawTimestamp in rawTimestamps:
+        try:
+            epochs.append(parseTimestampToEpoch(rawTimestamp))
+        except (ValueError, TypeError):
+            epochs.append(default)
+    return epochs
+
+
+def epochToDatetime(epoch: int) -> datetime.datetime:
+    '''Timezone aware datetime, for the display and the calibre database'''
+    return datetime.datetime.fromtimestamp(epoch, datetime.timezone.utc)
+
+
+def datetimeToEpoch(timestamp: datetime.datetime) -> int:
+    if timestamp.tzinfo is None:
+        return calendar.timegm(timestamp.timetuple())
+    return int(timestamp.timestamp())
+
+
+def parse_timestamp(rawTimestamp) -> datetime.datetime:
+    return epochToDatetime(parseTimestampToEpoch(rawTimestamp))